@@ -146,10 +146,9 @@ def run_simulation(time_step=global_time_step, a=0.02, b=0.2, c=-65.0, d=6.0,
     if save_data:
         datfilename = "results/%s_%s.dat" % (title.replace("(","").replace(")","").replace(" ","_"),options.simulator)
 
-        datfile = open(datfilename,'w')
-        for i in range(len(vm)):
-            datfile.write('%s\t%s\n'%(vm.times[i].magnitude,vm[i][0].magnitude))
-        datfile.close()
+        # same tab-separated format as before, written in one call
+        np.savetxt(datfilename, np.column_stack((vm.times.magnitude, vm.magnitude[:, 0])),
+                   fmt='%s', delimiter='\t')
         print('   Saved data to %s'%datfilename)
 
 
@@ -0,0 +1,44 @@
+"""
+Conversions between the plain arrays of kernels.py and the neo /
+quantities / elephant objects that neuronunit expects.
+
+These packages are slow to import, so they are only imported when a
+conversion is actually requested; the kernels and batch code paths never
+touch them.
+"""
+
+def to_analogsignal(v, dt, t_start=0.0, units='mV'):
+	"""
+	Wrap a membrane potential trace in mV (or another trace in units),
+	sampled every dt ms, in a neo.AnalogSignal.
+	"""
+	import quantities as pq
+	from neo import AnalogSignal
+	return AnalogSignal(v,
+						units=units,
+						sampling_period=dt*pq.ms,
+						t_start=t_start*pq.ms)
+
+def to_spiketrain(times, t_stop):
+	"""
+	Wrap spike times in ms in a neo.SpikeTrain ending at t_stop ms.
+	"""
+	import quantities as pq
+	from neo import SpikeTrain
+	return SpikeTrain(times, units=pq.ms, t_stop=t_stop*pq.ms)
+
+def threshold_spike_count(vM, threshold=0.0):
+	"""
+	Number of upward crossings of threshold (mV) in an AnalogSignal.
+	"""
+	import quantities as pq
+	from elephant.spike_train_generation import threshold_detection
+	return len(threshold_detection(vM, threshold*pq.mV))
+
+def to_ms(value):
+	"""
+	A duration as a float in ms, from a quantity or a plain number in ms.
+	"""
+	if hasattr(value, 'rescale'):
+		return float(value.rescale('ms'))
+	return float(value)
@@ -0,0 +1,87 @@
+"""
+Memory allocated per evaluation with and without reused buffers.
+
+Repeats evaluations the way an optimizer loop does and reports, for
+each, the peak memory allocated above the baseline during one
+evaluation (tracemalloc, which sees numpy's allocations) and the time
+per evaluation:
+
+- a population run by kernels.simulate_population, allocating its trace,
+  with a kernels.Workspace and with a caller-supplied out array;
+- a chunked stream through simulate_population_chunk;
+- IZHIModel.inject_square_current with new attrs at every evaluation,
+  with and without a workspace.
+
+usage: python benchmarks/bench_alloc.py [n_evaluations] [n_cells]
+"""
+import sys
+import time
+import tracemalloc
+
+from common import AMPLITUDES, step_current
+import numpy as np
+import izhikevich as izhi
+from kernels import Workspace, simulate_population, simulate_population_chunk
+from utils import reduced_cells
+
+DT = 0.25
+CURRENT = {'amplitude': 100.0, 'delay': 100.0, 'duration': 900.0}
+
+
+def measure(evaluate, n):
+	"""
+	(peak bytes above the baseline per evaluation, seconds per evaluation)
+	"""
+	evaluate(0)
+	tracemalloc.start()
+	peak = 0
+	t1 = time.perf_counter()
+	for i in range(n):
+		baseline = tracemalloc.get_traced_memory()[0]
+		tracemalloc.reset_peak()
+		evaluate(i)
+		peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+	runtime = (time.perf_counter() - t1)/n
+	tracemalloc.stop()
+	return peak, runtime
+
+
+def main(n_evaluations=200, n_cells=100):
+	n, n_cells = int(n_evaluations), int(n_cells)
+	cells = dict(reduced_cells['RS'], a=np.linspace(0.01, 0.1, n_cells))
+	I = step_current(AMPLITUDES['RS'], 1000.0, DT)
+	workspace = Workspace()
+	out = np.empty((n_cells, len(I)))
+	chunks = np.array_split(I, 10)
+	rng = np.random.RandomState(0)
+	candidates = [dict(reduced_cells['RS'], a=a) for a in rng.uniform(0.01, 0.05, n)]
+
+	def stream(workspace):
+		state = None
+		for chunk in chunks:
+			trace, state = simulate_population_chunk(cells, chunk, state, dt=DT, workspace=workspace)
+
+	def model_run(model):
+		def evaluate(i):
+			model.set_attrs(dict(candidates[i]))
+			model.inject_square_current(CURRENT)
+		return evaluate
+
+	cases = [
+		('population', lambda i: simulate_population(cells, I, dt=DT)),
+		('population workspace', lambda i: simulate_population(cells, I, dt=DT, workspace=workspace)),
+		('population out=', lambda i: simulate_population(cells, I, dt=DT, out=out)),
+		('chunked', lambda i: stream(None)),
+		('chunked workspace', lambda i: stream(workspace)),
+		('IZHIModel', model_run(izhi.IZHIModel())),
+		('IZHIModel workspace', model_run(izhi.IZHIModel(workspace=Workspace()))),
+	]
+	print('%d evaluations, %d cells x %d steps' % (n, n_cells, len(I)))
+	print('%-22s %14s %12s' % ('evaluation', 'peak kB/eval', 'us/eval'))
+	for label, evaluate in cases:
+		peak, runtime = measure(evaluate, n)
+		print('%-22s %14.1f %12.1f' % (label, peak/1024.0, runtime*1e6))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
@@ -0,0 +1,55 @@
+"""
+Effect of cache.ResultCache on repeated IZHIModel evaluations.
+
+Mimics an optimizer that re-evaluates candidates: every generation draws
+n_candidates parameter sets from a small pool of distinct ones, and each
+is run with inject_square_current. Prints the runtime without a cache,
+with the memory tier only and with the disk tier (a second pass in a
+fresh cache object, as a new process would see it), with the hit rates.
+
+usage: python benchmarks/bench_cache.py [n_generations] [n_candidates] [pool_size]
+"""
+import sys
+import tempfile
+import time
+
+import common
+import numpy as np
+import izhikevich as izhi
+from cache import ResultCache
+from utils import reduced_cells
+
+CURRENT = {'amplitude': 100.0, 'delay': 100.0, 'duration': 500.0}
+
+
+def run(generations, cache):
+	t1 = time.perf_counter()
+	for candidates in generations:
+		for attrs in candidates:
+			model = izhi.IZHIModel(attrs=dict(attrs), cache=cache)
+			model.inject_square_current(CURRENT)
+	return time.perf_counter() - t1
+
+
+def main(n_generations=20, n_candidates=50, pool_size=100):
+	rng = np.random.RandomState(0)
+	base = reduced_cells['RS']
+	pool = [dict(base, a=a, d=d) for a, d in zip(rng.uniform(0.01, 0.05, int(pool_size)),
+												  rng.uniform(50, 150, int(pool_size)))]
+	generations = [[pool[i] for i in rng.randint(0, len(pool), int(n_candidates))]
+				   for _ in range(int(n_generations))]
+	# compile before timing
+	izhi.IZHIModel(attrs=dict(base)).inject_square_current(CURRENT)
+
+	print('%-12s %10s %10s' % ('cache', 'runtime s', 'hit rate'))
+	print('%-12s %10.4f %10s' % ('none', run(generations, None), '-'))
+	memory = ResultCache(max_entries=int(pool_size))
+	print('%-12s %10.4f %10.2f' % ('memory', run(generations, memory), memory.stats()['hit_rate']))
+	directory = tempfile.mkdtemp(prefix='izhi-result-cache-')
+	run(generations, ResultCache(max_entries=1, directory=directory))
+	disk = ResultCache(max_entries=int(pool_size), directory=directory)
+	print('%-12s %10.4f %10.2f' % ('disk, warm', run(generations, disk), disk.stats()['hit_rate']))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
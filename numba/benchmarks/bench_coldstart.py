@@ -0,0 +1,53 @@
+"""
+Cold-start cost of a fresh worker process.
+
+Each measurement runs in a new python process: import the kernels, call
+kernels.precompile() and run one population simulation. The first
+process uses an empty numba cache directory and compiles everything;
+the following processes share that directory and load the cached machine
+code instead.
+
+usage: python benchmarks/bench_coldstart.py [n_warm_processes]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+WORKER = """
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, %r)
+import numpy as np
+import kernels
+t1 = time.perf_counter()
+kernels.precompile()
+t2 = time.perf_counter()
+kernels.simulate_population([{'C': 100, 'k': 0.7, 'vr': -60, 'vt': -40, 'vPeak': 35,
+							  'a': 0.03, 'b': -2, 'c': -50, 'd': 100, 'celltype': 1}],
+							np.full(4000, 100.0))
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'precompile': t2 - t1, 'first run': t3 - t2}))
+""" % os.path.join(HERE, '..')
+
+
+def run_worker(cache_dir):
+	env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+	output = subprocess.check_output([sys.executable, '-c', WORKER], env=env)
+	return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main(n_warm=3):
+	cache_dir = tempfile.mkdtemp(prefix='izhi-numba-cache-')
+	print('%-8s %10s %12s %12s' % ('process', 'import s', 'precompile s', 'first run s'))
+	for n in range(1 + int(n_warm)):
+		times = run_worker(cache_dir)
+		print('%-8s %10.3f %12.3f %12.4f' % ('cold' if n == 0 else 'cached',
+											  times['import'], times['precompile'], times['first run']))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
@@ -0,0 +1,65 @@
+"""
+Accuracy against speed of the integration time step.
+
+Every reduced_cells entry is driven by a step current and simulated over
+a range of steps. For each step the runtime of a population of identical
+cells and the spike-time error with respect to a converged reference
+(adaptive integration at a tight tolerance) are printed, followed by the
+largest step whose spike count matches the reference and whose worst
+spike-time error stays below the tolerance. This is done for plain
+forward Euler with spike times on the grid and for interpolated threshold
+crossings (interpolate=True) with Euler and RK4; the error of Euler
+itself dominates at coarse steps, so sub-step timing needs both.
+
+usage: python benchmarks/bench_dt.py [tolerance_ms] [t_stop_ms]
+"""
+import sys
+
+from common import AMPLITUDES, best_of, step_current
+import numpy as np
+from kernels import simulate_population_spikes
+from utils import reduced_cells
+
+REFERENCE_DT = 0.01
+MODES = (('euler', False), ('euler', True), ('rk4', True))
+DTS = (0.025, 0.05, 0.1, 0.125, 0.25, 0.5, 1.0)
+N_CELLS = 256
+
+
+def spike_time_error(times, reference):
+	"""
+	(count difference, mean and max absolute error over the paired spikes)
+	"""
+	n = min(len(times), len(reference))
+	if n == 0:
+		return len(times) - len(reference), 0.0, 0.0
+	error = np.abs(times[:n] - reference[:n])
+	return len(times) - len(reference), error.mean(), error.max()
+
+
+def main(tolerance=1.0, t_stop=1000.0):
+	print('%d cells per timing, tolerance %s ms' % (N_CELLS, tolerance))
+	for key, cell in reduced_cells.items():
+		amplitude = AMPLITUDES[key]
+		reference = simulate_population_spikes([cell], step_current(amplitude, t_stop, REFERENCE_DT),
+												dt=REFERENCE_DT, method='adaptive', tol=1e-5)[0]
+		print('\n%s (%d reference spikes)' % (key, len(reference)))
+		print('%8s %12s %8s %12s %12s' % ('dt', 'runtime s', 'dcount', 'mean err', 'max err'))
+		for method, interpolate in MODES:
+			print('%s%s' % (method, ', interpolated' if interpolate else ''))
+			safe = None
+			for dt in DTS:
+				I = step_current(amplitude, t_stop, dt)
+				times = simulate_population_spikes([cell], I, dt=dt, method=method,
+												   interpolate=interpolate)[0]
+				runtime = best_of(lambda: simulate_population_spikes([cell] * N_CELLS, I, dt=dt, method=method,
+																	 interpolate=interpolate))
+				dcount, mean_error, max_error = spike_time_error(times, reference)
+				print('%8s %12.4f %8d %12.3f %12.3f' % (dt, runtime, dcount, mean_error, max_error))
+				if dcount == 0 and max_error <= tolerance:
+					safe = dt
+			print('largest safe dt for %s: %s' % (key, safe))
+
+
+if __name__ == '__main__':
+	main(*[float(a) for a in sys.argv[1:]])
@@ -0,0 +1,71 @@
+"""
+Feature extraction for a large population: compiled extractors against
+the per-cell neo/elephant route.
+
+A population of n_cells cells (all reduced_cells types, repeated) is
+driven by step currents. Times are printed for the simulation itself,
+for features.spike_features on the spike times, for
+features.trace_features on the traces, and, when neo and elephant are
+installed, for AnalogSignal + threshold_detection + numpy ISI statistics
+on a few cells, extrapolated to the population.
+
+usage: python benchmarks/bench_features.py [n_cells] [t_stop_ms]
+"""
+import sys
+import time
+
+from common import AMPLITUDES, best_of, step_current
+import numpy as np
+import adapters
+from features import spike_features, trace_features
+from kernels import simulate_population, simulate_population_spikes
+from utils import reduced_cells
+
+DT = 0.25
+N_NEO = 20
+
+
+def neo_features(v):
+	import quantities as pq
+	from elephant.spike_train_generation import threshold_detection
+	times = np.asarray(threshold_detection(adapters.to_analogsignal(v, DT), 0*pq.mV).rescale('ms'))
+	isi = np.diff(times)
+	cv = isi.std()/isi.mean() if len(isi) > 1 else np.nan
+	adaptation = np.mean(np.diff(isi)/(isi[1:] + isi[:-1])) if len(isi) > 2 else np.nan
+	return len(times), cv, adaptation
+
+
+def main(n_cells=10000, t_stop=1000.0):
+	keys = list(reduced_cells)
+	types = np.arange(n_cells) % len(keys)
+	cells = [reduced_cells[keys[n]] for n in types]
+	step = step_current(1.0, t_stop, DT)
+	I = np.array([AMPLITUDES[key]*step for key in keys])[types]
+
+	simulate_population_spikes(cells[:1], I[:1], dt=DT, parallel=True)
+	runtime = best_of(lambda: simulate_population_spikes(cells, I, dt=DT, parallel=True), 1)
+	print('%-20s %10.4f s' % ('simulate spikes', runtime))
+	spikes = simulate_population_spikes(cells, I, dt=DT, parallel=True)
+	spike_features(spikes[:1], t_stop)
+	print('%-20s %10.4f s' % ('spike_features', best_of(lambda: spike_features(spikes, t_stop))))
+
+	v = simulate_population(cells, I, dt=DT, parallel=True)
+	trace_features(v[:1], DT)
+	print('%-20s %10.4f s' % ('trace_features', best_of(lambda: trace_features(v, DT))))
+	try:
+		neo_features(v[0])
+	except ImportError:
+		print('%-20s %10s' % ('neo/elephant', 'missing'))
+		return
+	t1 = time.perf_counter()
+	for n in range(N_NEO):
+		neo_features(v[n])
+	per_cell = (time.perf_counter() - t1)/N_NEO
+	print('%-20s %10.4f s (extrapolated)' % ('neo/elephant', per_cell*n_cells))
+
+
+if __name__ == '__main__':
+	args = [float(a) for a in sys.argv[1:]]
+	if args:
+		args[0] = int(args[0])
+	main(*args)
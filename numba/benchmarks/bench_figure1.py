@@ -0,0 +1,56 @@
+"""
+The 20 panels of Izhikevich (2004), Fig. 1, in one batch.
+
+Runs simple_model.FIGURE1 with one simulate_2003 call for the whole
+panel set (serially and on every thread), and with one call per panel
+as the PyNN and NEURON scripts do, each panel's stimulus sampled into a
+dense current and passed to kernels.get_2003_vm where the panel uses
+the standard model. Prints the runtimes, then the spike count of every
+panel and whether its batched trace equals the get_2003_vm one.
+
+usage: python benchmarks/bench_figure1.py [repeat]
+"""
+import sys
+
+from common import best_of
+import numpy as np
+import simple_model
+from kernels import get_2003_vm
+
+
+def standard(params):
+	return params.get('f', 5.0) == 5.0 and not params.get('accommodation') and 'u_init' not in params
+
+
+def one_by_one():
+	traces = []
+	for title, (params, stimulus, dt) in simple_model.FIGURE1.items():
+		if standard(params):
+			traces.append(get_2003_vm(stimulus.sample(dt), None, a=params['a'], b=params['b'],
+									  c=params['c'], d=params['d'], vr=params['v_init'], dt=dt))
+		else:
+			traces.append(simple_model.simulate_2003([params], stimulus, dt)[0])
+	return traces
+
+
+def main(repeat=20):
+	repeat = int(repeat)
+	# compile before timing
+	v = simple_model.run_figure1()
+	simple_model.run_figure1(parallel=True)
+	traces = one_by_one()
+	print('%-24s %10s' % ('Fig. 1 (20 panels)', 'runtime ms'))
+	print('%-24s %10.3f' % ('one call per panel', 1e3*best_of(one_by_one, repeat)))
+	print('%-24s %10.3f' % ('run_figure1', 1e3*best_of(simple_model.run_figure1, repeat)))
+	print('%-24s %10.3f' % ('run_figure1, parallel',
+						   1e3*best_of(lambda: simple_model.run_figure1(parallel=True), repeat)))
+	spikes = simple_model.run_figure1(record='spikes')
+	print('%-34s %7s %10s' % ('panel', 'spikes', 'same'))
+	for row, trace, times, (title, (params, stimulus, dt)) in zip(v, traces, spikes,
+																  simple_model.FIGURE1.items()):
+		same = np.array_equal(row[:len(trace)], trace) if standard(params) else '-'
+		print('%-34s %7d %10s' % (title, len(times), same))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
@@ -0,0 +1,53 @@
+"""
+Import time of the modules of this package, and of the heavy scientific
+dependencies they used to load eagerly, each in a fresh python process.
+
+kernels only needs numpy and numba. izhikevich and utils defer neo,
+quantities, elephant and matplotlib until a conversion or a plot is
+requested, so their import time should stay close to that of kernels.
+
+usage: python benchmarks/bench_import.py [repeat]
+"""
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = ('numpy', 'numba', 'kernels', 'izhikevich', 'utils',
+		   'quantities', 'neo', 'elephant', 'matplotlib.pyplot')
+
+WORKER = """
+import sys, time
+sys.path.insert(0, %r)
+t0 = time.perf_counter()
+import %s
+print(time.perf_counter() - t0)
+"""
+
+
+def import_time(module):
+	"""
+	Seconds to import module in a new interpreter, None if it is not
+	installed.
+	"""
+	try:
+		output = subprocess.check_output([sys.executable, '-c', WORKER % (os.path.join(HERE, '..'), module)],
+										 stderr=subprocess.DEVNULL)
+	except subprocess.CalledProcessError:
+		return None
+	return float(output.decode().strip().splitlines()[-1])
+
+
+def main(repeat=3):
+	print('%-20s %10s' % ('module', 'import s'))
+	for module in MODULES:
+		times = [import_time(module) for _ in range(int(repeat))]
+		if None in times:
+			print('%-20s %10s' % (module, 'missing'))
+		else:
+			print('%-20s %10.3f' % (module, min(times)))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
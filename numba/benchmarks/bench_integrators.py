@@ -0,0 +1,78 @@
+"""
+Throughput of the integration methods at bounded spike-time error.
+
+For every reduced_cells entry each method is run over a range of steps;
+the largest step whose spike count matches a tightly converged adaptive
+reference and whose worst spike-time error stays below the tolerance is
+kept. The fixed-step methods other than forward Euler apply the reset at
+the interpolated threshold crossing. The runtime of a population at that
+step is compared with forward Euler at its own largest safe step, or at
+the finest step when none is safe (marked *).
+
+usage: python benchmarks/bench_integrators.py [tolerance_ms] [t_stop_ms]
+"""
+import sys
+
+from common import AMPLITUDES, best_of, step_current
+from bench_dt import spike_time_error
+import numpy as np
+from kernels import METHODS, simulate_population, simulate_population_spikes
+from utils import reduced_cells
+
+DTS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+N_CELLS = 256
+# forward Euler is the get_vm_* scheme as it is, adaptive places its own resets
+INTERPOLATE = {'euler': False, 'exp_euler': True, 'rk4': True, 'adaptive': False}
+
+
+def largest_safe_dt(cell, amplitude, t_stop, method, reference, tolerance):
+	safe = None
+	for dt in DTS:
+		I = step_current(amplitude, t_stop, dt)
+		times = simulate_population_spikes([cell], I, dt=dt, method=method,
+										   interpolate=INTERPOLATE[method])[0]
+		dcount, mean_error, max_error = spike_time_error(times, reference)
+		if dcount == 0 and max_error <= tolerance:
+			safe = dt
+	return safe
+
+
+def strong_drive_check(amplitude=1000.0, t_stop=1000.0):
+	"""
+	True if the adaptive method finishes on an LTS cell driven so hard
+	that its reset state already lies above the threshold.
+	"""
+	v = simulate_population([reduced_cells['LTS']], step_current(amplitude, t_stop, 0.25),
+							method='adaptive')
+	return bool(np.isfinite(v).all())
+
+
+def main(tolerance=1.0, t_stop=1000.0):
+	methods = sorted(METHODS, key=METHODS.get)
+	print('adaptive finishes on a strongly driven LTS cell: %s' % strong_drive_check())
+	print('tolerance %s ms, %d cells per timing' % (tolerance, N_CELLS))
+	print('%-5s %-10s %8s %12s %8s' % ('type', 'method', 'dt', 'runtime s', 'gain'))
+	for key, cell in reduced_cells.items():
+		amplitude = AMPLITUDES[key]
+		reference = simulate_population_spikes([cell], step_current(amplitude, t_stop, 0.01),
+												dt=0.01, method='adaptive', tol=1e-5)[0]
+		euler_runtime = None
+		for method in methods:
+			dt = largest_safe_dt(cell, amplitude, t_stop, method, reference, tolerance)
+			mark = ''
+			if dt is None:
+				if method != 'euler':
+					print('%-5s %-10s %8s' % (key, method, 'none'))
+					continue
+				dt, mark = DTS[0], '*'
+			I = step_current(amplitude, t_stop, dt)
+			runtime = best_of(lambda: simulate_population_spikes([cell] * N_CELLS, I, dt=dt, method=method,
+																  interpolate=INTERPOLATE[method]))
+			if method == 'euler':
+				euler_runtime = runtime
+			print('%-5s %-10s %8s %12.4f %8.2f' % (key, method, str(dt) + mark, runtime,
+												   euler_runtime/runtime))
+
+
+if __name__ == '__main__':
+	main(*[float(a) for a in sys.argv[1:]])
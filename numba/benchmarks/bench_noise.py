@@ -0,0 +1,64 @@
+"""
+Pre-generated noise arrays against noise generated inside the kernels.
+
+A population of RS variants receives a baseline current plus OU noise
+and Poisson synaptic bombardment over a number of trials, once with the
+noise of every trial sampled into a dense (cells, steps) array
+(noise.Noise.sample) and passed to kernels.simulate_population_spikes,
+and once with noise.simulate_noise_spikes drawing it in the kernel.
+Prints the runtime of each and the bytes of the dense noise, and checks
+that both give the same spikes and that a parallel run on every thread
+is bit-identical to the serial one.
+
+usage: python benchmarks/bench_noise.py [n_cells] [t_stop_ms] [n_trials]
+"""
+import sys
+
+from common import best_of
+import numba
+import numpy as np
+import noise
+from kernels import simulate_population_spikes
+from utils import reduced_cells
+
+DT = 0.25
+BASELINE = 40.0
+
+
+def main(n_cells=100, t_stop=2000.0, n_trials=5):
+	n_cells, n_trials = int(n_cells), int(n_trials)
+	steps = int(round(t_stop/DT))
+	cells = dict(reduced_cells['RS'], a=np.linspace(0.01, 0.1, n_cells))
+	background = noise.ou(30.0, 5.0, mean=20.0) + noise.poisson(1000.0, 20.0, 2.0)
+
+	def dense(trial):
+		I = np.empty((n_cells, steps))
+		for n in range(n_cells):
+			I[n] = BASELINE + background.sample(steps, DT, cell=n, trial=trial)
+		return simulate_population_spikes(cells, I, dt=DT)
+
+	def kernel(trial, parallel=False):
+		return noise.simulate_noise_spikes(cells, background, BASELINE, trial=trial, steps=steps,
+										   dt=DT, parallel=parallel)
+
+	# compile before timing
+	dense(0)
+	kernel(0)
+	kernel(0, parallel=True)
+	same = all(np.array_equal(x, y) for x, y in zip(dense(1), kernel(1)))
+	threads = all(np.array_equal(x, y) for x, y in zip(kernel(1), kernel(1, parallel=True)))
+	print('%d cells, %d steps, %d trials, %d threads' % (n_cells, steps, n_trials,
+														numba.get_num_threads()))
+	print('%-24s %10s %14s' % ('noise', 'runtime s', 'noise bytes'))
+	runtime = best_of(lambda: [dense(trial) for trial in range(n_trials)], 1)
+	print('%-24s %10.4f %14d' % ('pre-generated', runtime, n_cells*steps*8))
+	runtime = best_of(lambda: [kernel(trial) for trial in range(n_trials)], 1)
+	print('%-24s %10.4f %14d' % ('in kernel', runtime, 0))
+	runtime = best_of(lambda: [kernel(trial, True) for trial in range(n_trials)], 1)
+	print('%-24s %10.4f %14d' % ('in kernel, parallel', runtime, 0))
+	print('same spikes as pre-generated: %s, serial == parallel: %s' % (same, threads))
+
+
+if __name__ == '__main__':
+	args = [float(a) for a in sys.argv[1:]]
+	main(*args)
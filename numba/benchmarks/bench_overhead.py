@@ -0,0 +1,74 @@
+"""
+Per-call overhead of a single-cell run, before and after the parameter
+record.
+
+"before" is the dispatch IZHIModel.inject_direct_current used to do on
+every call: copy attrs, pop the extra keys, round celltype, cast every
+value to float and pick a get_vm_* kernel through a chain of np.bool_
+comparisons. "after" is IZHIModel._trace, which passes the validated
+params.CellParams straight to kernels.get_vm_cell. Both produce the same
+trace; the AnalogSignal wrapping, common to both, is left out. Short
+stimuli show the overhead, long ones the (identical) integration cost.
+
+usage: python benchmarks/bench_overhead.py [n_calls]
+"""
+import copy
+import sys
+import time
+
+import common
+import numpy as np
+import izhikevich as izhi
+from kernels import get_vm_one_two_three, get_vm_four, get_vm_five, get_vm_six, get_vm_seven
+from utils import reduced_cells
+
+STEPS = (4, 40, 400, 4000)
+
+
+def before(attrs, I, dt):
+	attrs['I'] = np.array(I)
+	attrs['celltype'] = int(round(attrs['celltype']))
+	everything = copy.copy(attrs)
+	if 'current_inj' in everything.keys():
+		everything.pop('current_inj', None)
+	everything.pop('celltype', None)
+	everything = dict((key, value if key == 'I' else float(value)) for key, value in everything.items())
+	if np.bool_(attrs['celltype'] <= 3):
+		v = get_vm_one_two_three(dt=dt, **everything)
+	else:
+		if np.bool_(attrs['celltype'] == 4):
+			v = get_vm_four(dt=dt, **everything)
+		if np.bool_(attrs['celltype'] == 5):
+			v = get_vm_five(dt=dt, **everything)
+		if np.bool_(attrs['celltype'] == 6):
+			I = everything.pop('I')
+			v = get_vm_six(I, dt=dt, **everything)
+		if np.bool_(attrs['celltype'] == 7):
+			v = get_vm_seven(dt=dt, **everything)
+	attrs.pop('I', None)
+	return v
+
+
+def per_call(func, n_calls):
+	func()
+	t1 = time.perf_counter()
+	for _ in range(n_calls):
+		func()
+	return (time.perf_counter() - t1)/n_calls*1e6
+
+
+def main(n_calls=20000):
+	n_calls = int(n_calls)
+	print('%-5s %7s %12s %12s %8s' % ('type', 'steps', 'before us', 'after us', 'ratio'))
+	for key, cell in reduced_cells.items():
+		model = izhi.IZHIModel(attrs=dict(cell))
+		attrs = dict(cell)
+		for steps in STEPS:
+			I = np.full(steps, 100.0)
+			old = per_call(lambda: before(attrs, I, model.dt), n_calls)
+			new = per_call(lambda: model._trace(I), n_calls)
+			print('%-5s %7d %12.2f %12.2f %8.1f' % (key, steps, old, new, old/new))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
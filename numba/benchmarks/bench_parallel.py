@@ -0,0 +1,51 @@
+"""
+Scaling of the parallel population kernel with the number of threads.
+
+For each of the seven 2007 cell types a population of identical cells is
+driven by a step current and integrated with 1, 2, 4 ... threads.
+Prints cells/second for every (cell type, thread count) pair.
+
+usage: python benchmarks/bench_parallel.py [n_cells] [t_stop_ms]
+"""
+import sys
+
+from common import AMPLITUDES, best_of, step_current
+import numba
+from kernels import simulate_population
+from utils import reduced_cells
+
+DT = 0.25
+
+
+def thread_counts():
+	counts = []
+	n = 1
+	while n < numba.config.NUMBA_NUM_THREADS:
+		counts.append(n)
+		n *= 2
+	counts.append(numba.config.NUMBA_NUM_THREADS)
+	return counts
+
+
+def main(n_cells=4096, t_stop=500.0):
+	N = int(t_stop/DT)
+	counts = thread_counts()
+	print('%d cells x %d steps, dt=%s ms' % (n_cells, N, DT))
+	print('%-5s' % 'type' + ''.join('%14s' % ('%d thr' % n) for n in counts))
+	for key, cell in reduced_cells.items():
+		I = step_current(AMPLITUDES[key], t_stop, DT)
+		cells = [cell] * n_cells
+		# compile before timing
+		simulate_population(cells[:1], I, dt=DT, parallel=True)
+		row = []
+		for n in counts:
+			elapsed = best_of(lambda: simulate_population(cells, I, dt=DT, parallel=True, n_threads=n))
+			row.append(n_cells/elapsed)
+		print('%-5s' % key + ''.join('%14.0f' % rate for rate in row))
+
+
+if __name__ == '__main__':
+	args = [float(a) for a in sys.argv[1:]]
+	if args:
+		args[0] = int(args[0])
+	main(*args)
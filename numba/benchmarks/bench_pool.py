@@ -0,0 +1,71 @@
+"""
+Process-pool runs (runner.run) against one in-process population run.
+
+A grid of RS variants (a x d) is driven by a step current and simulated
+once by kernels.simulate_population (serial and threaded) and by
+runner.run for a growing number of worker processes, recording traces
+and spike times. The pool pays for starting the workers and for the
+copy out of shared memory; it is meant for runs that do not fit one
+process or must survive a crash.
+
+usage: python benchmarks/bench_pool.py [n_cells] [t_stop_ms]
+"""
+import os
+import sys
+import tempfile
+
+from common import AMPLITUDES, best_of, step_current
+import numpy as np
+import runner
+from kernels import simulate_population
+from sweep import parameter_grid
+from utils import reduced_cells
+
+DT = 0.25
+
+
+def directory_check(cells, I):
+	"""
+	True if runs kept in a directory, traces and spike times, match the
+	shared memory runs.
+	"""
+	same = True
+	for record in ('vm', 'spikes'):
+		expected = runner.run(cells, I, record=record, dt=DT, processes=2)
+		with tempfile.TemporaryDirectory() as directory:
+			result = runner.run(cells, I, record=record, dt=DT, processes=2, directory=directory)
+			if record == 'vm':
+				same = same and np.array_equal(np.asarray(result), expected)
+			else:
+				same = same and all(np.array_equal(a, b) for a, b in zip(result, expected))
+			del result
+	return same
+
+
+def main(n_cells=2000, t_stop=1000.0):
+	side = int(np.sqrt(n_cells))
+	cells = parameter_grid(reduced_cells['RS'], a=np.linspace(0.01, 0.1, side),
+						   d=np.linspace(10.0, 200.0, side))
+	n_cells = len(cells['C'])
+	I = step_current(AMPLITUDES['RS'], t_stop, DT)
+	cell_steps = n_cells*len(I)
+	print('%d cells, %d steps' % (n_cells, len(I)))
+	for parallel in (False, True):
+		simulate_population(cells, I[:10], dt=DT, parallel=parallel)
+		runtime = best_of(lambda: simulate_population(cells, I, dt=DT, parallel=parallel), 1)
+		print('%-24s %10.4f s %10.3g cell-steps/s' % ('in process' + (' parallel' if parallel else ''),
+													  runtime, cell_steps/runtime))
+	print('directory runs == shared memory runs: %s' % directory_check(cells, I))
+	counts = sorted(set([1, 2, os.cpu_count() or 1]))
+	for record in ('vm', 'spikes'):
+		for processes in counts:
+			runtime = best_of(lambda: runner.run(cells, I, record=record, dt=DT, processes=processes), 1)
+			print('%-24s %10.4f s %10.3g cell-steps/s' % ('pool %s x%d' % (record, processes),
+														  runtime, cell_steps/runtime))
+
+
+if __name__ == '__main__':
+	args = [float(a) for a in sys.argv[1:]]
+	if args:
+		args[0] = int(args[0])
+	main(*args)
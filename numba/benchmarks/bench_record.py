@@ -0,0 +1,50 @@
+"""
+Cost of full traces against decimated and selective recording.
+
+A population of RS variants is driven by a step current and recorded
+with kernels.simulate_population (every sample of v) and with
+kernels.record_population for a range of decimation factors, with and
+without u, for a tenth of the cells and for the first half of the run.
+Prints the runtime and the bytes allocated for the results of each.
+
+usage: python benchmarks/bench_record.py [n_cells] [t_stop_ms]
+"""
+import sys
+
+from common import AMPLITUDES, best_of, step_current
+import numpy as np
+from kernels import simulate_population, record_population
+from utils import reduced_cells
+
+DT = 0.25
+
+
+def size(result):
+	return sum(value.nbytes for key, value in result.items() if key in ('v', 'u'))
+
+
+def main(n_cells=1000, t_stop=2000.0):
+	n_cells = int(n_cells)
+	cells = dict(reduced_cells['RS'], a=np.linspace(0.01, 0.1, n_cells))
+	I = step_current(AMPLITUDES['RS'], t_stop, DT)
+	cases = [('every 1', {}), ('every 10', {'every': 10}), ('every 100', {'every': 100}),
+			 ('every 10, v and u', {'every': 10, 'variables': ('v', 'u')}),
+			 ('10% of the cells', {'indices': slice(0, n_cells//10)}),
+			 ('first half', {'t_stop': float(t_stop)/2})]
+	# compile before timing
+	simulate_population(cells, I[:10], dt=DT)
+	record_population(cells, I[:10], dt=DT, variables=('v', 'u'))
+	print('%d cells, %d steps' % (n_cells, len(I)))
+	print('%-22s %10s %12s' % ('recording', 'runtime s', 'result MB'))
+	runtime = best_of(lambda: simulate_population(cells, I, dt=DT))
+	print('%-22s %10.4f %12.1f' % ('simulate_population', runtime,
+								   simulate_population(cells, I, dt=DT).nbytes/2**20))
+	for label, options in cases:
+		runtime = best_of(lambda: record_population(cells, I, dt=DT, **options))
+		print('%-22s %10.4f %12.1f' % (label, runtime,
+									   size(record_population(cells, I, dt=DT, **options))/2**20))
+
+
+if __name__ == '__main__':
+	args = [float(a) for a in sys.argv[1:]]
+	main(*args)
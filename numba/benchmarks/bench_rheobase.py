@@ -0,0 +1,66 @@
+"""
+Batched rheobase search against bisection in python with IZHIModel.
+
+A generation of candidates (random a, b, d around reduced_cells['RS'])
+gets its rheobase from sweep.rheobase in one call, and from a python
+bisection over inject_square_current for a few candidates, extrapolated
+to the whole generation.
+
+usage: python benchmarks/bench_rheobase.py [n_candidates]
+"""
+import sys
+import time
+
+from common import best_of
+import numpy as np
+import izhikevich as izhi
+from sweep import parameter_samples, rheobase
+from utils import reduced_cells
+
+DURATION = 600.0
+RESOLUTION = 0.1
+N_LOOP = 5
+
+
+def python_rheobase(attrs, lo=0.0, hi=100.0):
+	model = izhi.IZHIModel(attrs=dict(attrs), record='spikes')
+
+	def fires(amplitude):
+		model.inject_square_current({'amplitude': amplitude, 'delay': 0.0, 'duration': DURATION})
+		return model.get_spike_count() > 0
+
+	while not fires(hi):
+		lo, hi = hi, 2*hi
+	while hi - lo > RESOLUTION:
+		mid = 0.5*(lo + hi)
+		if fires(mid):
+			hi = mid
+		else:
+			lo = mid
+	return hi
+
+
+def main(n_candidates=500):
+	samples = np.random.RandomState(0).uniform([0.01, -4.0, 50.0], [0.05, 0.0, 150.0],
+											   (int(n_candidates), 3))
+	cells = parameter_samples(reduced_cells['RS'], ['a', 'b', 'd'], samples)
+	for parallel in (False, True):
+		# compile before timing
+		rheobase([reduced_cells['RS']], parallel=parallel, duration=DURATION)
+		runtime = best_of(lambda: rheobase(cells, parallel=parallel, resolution=RESOLUTION,
+										   duration=DURATION))
+		print('rheobase%-10s %6d candidates %10.4f s' % (' parallel' if parallel else '',
+														  int(n_candidates), runtime))
+	attrs = dict(reduced_cells['RS'])
+	python_rheobase(attrs)
+	t1 = time.perf_counter()
+	for n in range(N_LOOP):
+		attrs.update(a=samples[n, 0], b=samples[n, 1], d=samples[n, 2])
+		python_rheobase(attrs)
+	per_candidate = (time.perf_counter() - t1)/N_LOOP
+	print('python loop       %6d candidates %10.4f s (extrapolated)'
+		  % (int(n_candidates), per_candidate*int(n_candidates)))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
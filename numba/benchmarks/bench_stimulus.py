@@ -0,0 +1,64 @@
+"""
+Dense currents against stimulus.Stimulus tables evaluated in the kernel.
+
+A protocol (a hyperpolarising step, a ramp and a train of short pulses)
+of growing duration drives a population of RS variants, once sampled
+into a dense (steps,) current with Stimulus.sample and passed to
+kernels.simulate_population_spikes, and once passed as a Stimulus to
+stimulus.simulate_stimulus_spikes. Prints the bytes of the current and
+the runtime of each; with spike recording nothing else grows with the
+duration.
+
+usage: python benchmarks/bench_stimulus.py [n_cells]
+"""
+import sys
+
+from common import best_of
+import numpy as np
+import stimulus
+from kernels import simulate_population, simulate_population_spikes
+from utils import reduced_cells
+
+DT = 0.25
+
+
+def protocol(t_stop):
+	return (stimulus.square(-50.0, 0.0, 120.0, t_stop) + stimulus.ramp(0.05, 120.0, t_stop)
+			+ stimulus.pulse_train(300.0, 200.0, 2.0, 25.0, int((t_stop - 200.0)//25.0), t_stop))
+
+
+def dense_check(t_stop=1000.0):
+	"""
+	True if the table runs reproduce the dense current runs of every
+	reduced cell, in float64 and float32.
+	"""
+	p = protocol(t_stop)
+	cells = list(reduced_cells.values())
+	return all(np.array_equal(simulate_population(cells, p.sample(DT, dtype), dt=DT, dtype=dtype),
+							  stimulus.simulate_stimulus(cells, p, dt=DT, dtype=dtype))
+			   for dtype in (np.float64, np.float32))
+
+
+def main(n_cells=100):
+	n_cells = int(n_cells)
+	cells = dict(reduced_cells['RS'], a=np.linspace(0.01, 0.1, n_cells))
+	# compile before timing
+	short = protocol(300.0)
+	simulate_population_spikes(cells, short.sample(DT), dt=DT)
+	stimulus.simulate_stimulus_spikes(cells, short, dt=DT)
+	print('table runs == dense runs: %s' % dense_check())
+	print('%d cells' % n_cells)
+	print('%-10s %10s %14s %10s %14s %10s' % ('t_stop ms', 'segments', 'dense bytes', 'dense s',
+											  'table bytes', 'table s'))
+	for t_stop in (1e3, 1e4, 1e5, 1e6):
+		p = protocol(t_stop)
+		dense_bytes = p.steps(DT)*8
+		table_bytes = sum(array.nbytes for array in p.table(DT))
+		dense = best_of(lambda: simulate_population_spikes(cells, p.sample(DT), dt=DT), 1)
+		table = best_of(lambda: stimulus.simulate_stimulus_spikes(cells, p, dt=DT), 1)
+		print('%-10g %10d %14d %10.4f %14d %10.4f' % (t_stop, len(p.segments), dense_bytes, dense,
+													  table_bytes, table))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
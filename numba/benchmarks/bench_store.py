@@ -0,0 +1,79 @@
+"""
+store.TraceStore against the '%s\t%s\n' text files of run_simulation.
+
+A population of RS variants is simulated once; its traces are then
+written as text (one line per sample, as utils.run_simulation did),
+with np.save, and into a TraceStore, and the store is also filled by
+TraceStore.simulate straight from the kernel. Prints the write time and
+size on disk of each, and the time to read a window of a few cells back
+from the text files and from the store. The text files are only written
+for 10 cells, their time and size are scaled to n_cells.
+
+usage: python benchmarks/bench_store.py [n_cells] [t_stop_ms]
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from common import AMPLITUDES, best_of, step_current
+import numpy as np
+from kernels import simulate_population
+from store import TraceStore
+from utils import reduced_cells
+
+DT = 0.25
+
+
+def size(path):
+	if os.path.isfile(path):
+		return os.path.getsize(path)
+	return sum(os.path.getsize(os.path.join(folder, name))
+			   for folder, _, names in os.walk(path) for name in names)
+
+
+def write_text(directory, traces, times):
+	for n, trace in enumerate(traces):
+		with open(os.path.join(directory, '%d.dat' % n), 'w') as f:
+			for i in range(len(trace)):
+				f.write('%s\t%s\n' % (times[i], trace[i]))
+
+
+def main(n_cells=100, t_stop=10000.0):
+	n_cells = int(n_cells)
+	cells = dict(reduced_cells['RS'], a=np.linspace(0.01, 0.1, n_cells))
+	I = step_current(AMPLITUDES['RS'], t_stop, DT)
+	traces = simulate_population(cells, I, dt=DT)
+	times = np.arange(traces.shape[1])*DT
+	window = (slice(2, 7), slice(len(I)//2, len(I)//2 + 400))
+	root = tempfile.mkdtemp(prefix='izhi-store-')
+	try:
+		print('%d cells, %d steps' % traces.shape)
+		print('%-22s %10s %12s' % ('format', 'write s', 'size MB'))
+		text = os.path.join(root, 'text')
+		os.makedirs(text)
+		print('%-22s %10.4f %12.1f' % ('text', best_of(lambda: write_text(text, traces[:10], times), 1)
+									   *n_cells/10, size(text)*n_cells/10/2**20))
+		npy = os.path.join(root, 'traces.npy')
+		print('%-22s %10.4f %12.1f' % ('np.save', best_of(lambda: np.save(npy, traces), 1),
+									   size(npy)/2**20))
+		for dtype in (np.float64, np.float32):
+			store = TraceStore(os.path.join(root, 'store'))
+			runtime = best_of(lambda: store.write('vm', traces.astype(dtype, copy=False), dt=DT,
+												  overwrite=True), 1)
+			print('%-22s %10.4f %12.1f' % ('store %s' % np.dtype(dtype).name, runtime,
+										   size(os.path.join(root, 'store', 'vm'))/2**20))
+		runtime = best_of(lambda: store.simulate('sim', cells, I, dt=DT, overwrite=True), 1)
+		print('%-22s %10.4f %12s' % ('store.simulate', runtime, '(+ run)'))
+
+		print('%-22s %10s' % ('read window', 'read s'))
+		print('%-22s %10.4f' % ('text', best_of(lambda: [np.loadtxt(os.path.join(text, '%d.dat' % n))
+														for n in range(window[0].start, window[0].stop)])))
+		print('%-22s %10.4f' % ('store', best_of(lambda: TraceStore(os.path.join(root, 'store'), 'r')['sim'][window])))
+	finally:
+		shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+	args = [float(a) for a in sys.argv[1:]]
+	main(*args)
@@ -0,0 +1,61 @@
+"""
+Parameter sweep with sweep.sweep against the per-amplitude IZHIModel loop
+of utils.plot_model (without the plotting).
+
+A grid of a and d values around reduced_cells['RS'] is driven by square
+pulses of n_amplitudes amplitudes. The loop is timed on a few runs and
+extrapolated to the whole grid; it counts spikes through elephant and
+is reported as missing without it.
+
+usage: python benchmarks/bench_sweep.py [n_a] [n_d] [n_amplitudes]
+"""
+import sys
+import time
+
+from common import best_of
+import numpy as np
+import izhikevich as izhi
+from sweep import parameter_grid, sweep
+from utils import reduced_cells
+
+DURATION = 600.0
+N_LOOP = 10
+
+
+def loop_runtime(cell, amplitudes):
+	"""
+	Seconds per (parameter set, amplitude) of the IZHIModel loop.
+	"""
+	model = izhi.IZHIModel(attrs=dict(cell))
+	model.inject_square_current({'amplitude': 100.0, 'delay': 0.0, 'duration': DURATION})
+	model.get_spike_count()
+	t1 = time.perf_counter()
+	for amplitude in amplitudes[:N_LOOP]:
+		model = izhi.IZHIModel(attrs=dict(cell))
+		model.inject_square_current({'amplitude': amplitude, 'delay': 0.0, 'duration': DURATION})
+		model.get_spike_count()
+	return (time.perf_counter() - t1)/min(N_LOOP, len(amplitudes))
+
+
+def main(n_a=20, n_d=10, n_amplitudes=50):
+	cell = reduced_cells['RS']
+	cells = parameter_grid(cell, a=np.linspace(0.01, 0.05, int(n_a)), d=np.linspace(50, 150, int(n_d)))
+	amplitudes = np.linspace(0, 500, int(n_amplitudes))
+	n_runs = int(n_a)*int(n_d)*int(n_amplitudes)
+	sweep(cells, amplitudes[:1], duration=DURATION)
+	for parallel in (False, True):
+		sweep(cells, amplitudes[:1], duration=DURATION, parallel=parallel)
+		runtime = best_of(lambda: sweep(cells, amplitudes, duration=DURATION, parallel=parallel))
+		print('sweep%-10s %8d runs %10.4f s %12.0f runs/s'
+			  % (' parallel' if parallel else '', n_runs, runtime, n_runs/runtime))
+	try:
+		per_run = loop_runtime(cell, amplitudes)
+	except ImportError:
+		print('IZHIModel loop %8s' % 'missing')
+		return
+	print('IZHIModel loop %8d runs %10.4f s %12.0f runs/s (extrapolated)'
+		  % (n_runs, per_run*n_runs, 1/per_run))
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:])
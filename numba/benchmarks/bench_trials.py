@@ -0,0 +1,75 @@
+"""
+Trial ensembles in one call against one call per trial.
+
+An RS cell driven by a square pulse plus OU and Poisson noise is
+repeated over n_trials trials, once with a python loop of
+noise.simulate_noise_spikes (one trial per call, as with IZHIModel) and
+once with noise.simulate_trials, serially and on every thread. Prints
+the runtime of each and the mean rate of the trial-averaged PSTH, and
+checks that the ensemble gives the spikes of the loop, and that a
+noiseless IZHIModel.run_trials trial gives the spikes (and
+noise.simulate_noise the trace) of inject_square_current.
+
+usage: python benchmarks/bench_trials.py [n_trials] [t_stop_ms]
+"""
+import sys
+
+from common import AMPLITUDES, best_of
+import numba
+import numpy as np
+import izhikevich as izhi
+import noise
+import stimulus
+from utils import reduced_cells
+
+DT = 0.25
+SQUARE = {'amplitude': 300.0, 'delay': 100.0, 'duration': 500.0}
+
+
+def noiseless_check():
+	"""
+	True if a noiseless trial of a square pulse reproduces
+	inject_square_current, spikes and trace.
+	"""
+	silent = noise.Noise([])
+	model = izhi.IZHIModel(attrs=dict(reduced_cells['RS']), record='spikes')
+	spikes = model.inject_square_current(SQUARE)
+	trial = noise.trial_spikes(model.run_trials(silent, 1, SQUARE), 1)[0]
+	model = izhi.IZHIModel(attrs=dict(reduced_cells['RS']))
+	v = np.asarray(model.inject_square_current(SQUARE)).ravel()
+	N, table = model._square_table(SQUARE['amplitude'], SQUARE['delay'], SQUARE['duration'])
+	trace = noise.simulate_noise(reduced_cells['RS'], silent,
+								 stimulus.get_stimulus_samples(np.empty(N), *table), dt=DT)[0]
+	return np.array_equal(spikes, trial) and np.array_equal(v, trace)
+
+
+def main(n_trials=1000, t_stop=1000.0):
+	n_trials = int(n_trials)
+	cell = reduced_cells['RS']
+	pulse = stimulus.square(AMPLITUDES['RS'], t_stop/10, 0.8*t_stop, t_stop)
+	background = noise.ou(30.0, 5.0) + noise.poisson(500.0, 20.0, 2.0)
+
+	def loop():
+		return [noise.simulate_noise_spikes(cell, background, pulse, trial=t, dt=DT)[0]
+				for t in range(n_trials)]
+
+	def ensemble(parallel=False):
+		return noise.simulate_trials(cell, background, n_trials, pulse, dt=DT, parallel=parallel)
+
+	# compile before timing
+	noise.simulate_trials(cell, background, 2, pulse, dt=DT)
+	noise.simulate_trials(cell, background, 2, pulse, dt=DT, parallel=True)
+	same = all(np.array_equal(x, y) for x, y in
+			   zip(loop(), noise.trial_spikes(ensemble(), n_trials)))
+	print('%d trials, %d steps, %d threads' % (n_trials, pulse.steps(DT), numba.get_num_threads()))
+	print('%-22s %10s' % ('trials', 'runtime s'))
+	print('%-22s %10.4f' % ('one call per trial', best_of(loop, 1)))
+	print('%-22s %10.4f' % ('simulate_trials', best_of(ensemble, 1)))
+	print('%-22s %10.4f' % ('simulate_trials, par.', best_of(lambda: ensemble(True), 1)))
+	print('mean rate %.2f Hz, same spikes as the loop: %s' % (ensemble()['psth'].mean(), same))
+	print('noiseless trial == inject_square_current: %s' % noiseless_check())
+
+
+if __name__ == '__main__':
+	args = [float(a) for a in sys.argv[1:]]
+	main(*args)
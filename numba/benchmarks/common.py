@@ -0,0 +1,35 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+# step amplitudes (pA) that make each type fire, taken from the 2007 figures
+AMPLITUDES = {'RS': 100, 'IB': 500, 'TC': 100, 'LTS': 200, 'RTN': 90, 'FS': 200, 'CH': 400}
+
+
+def best_of(func, repeat=3):
+	"""
+	Smallest wall time in seconds of repeat calls to func.
+	"""
+	times = []
+	for _ in range(repeat):
+		t1 = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - t1)
+	return min(times)
+
+
+def step_current(amplitude, t_stop, dt, onset=None):
+	"""
+	Current that steps from 0 to amplitude at onset (default t_stop/10).
+	"""
+	if onset is None:
+		onset = t_stop/10
+	I = np.zeros(int(round(t_stop/dt)))
+	I[int(round(onset/dt)):] = amplitude
+	return I
@@ -0,0 +1,239 @@
+"""
+Benchmark suite with stored baselines.
+
+Measures, for every single-cell kernel (get_vm_one_two_three,
+get_vm_four ... get_vm_seven, get_2003_vm and get_vm_cell) and for the
+serial and parallel population backends:
+
+	compile/<kernel>            first call in a fresh process with an empty
+								numba cache, s (lower is better)
+	latency/<kernel>            one call on a short stimulus, us (lower)
+	throughput/<kernel>/<ms>    cells x steps per second for a run of the
+								given duration (higher); the population
+								backends are run for several population
+								sizes, throughput/<backend>/<cells>x<ms>
+
+Results are written as JSON together with the versions and the machine
+they were measured on. Comparing against a stored baseline flags every
+metric that got worse by more than the tolerance and exits with status
+1, so the suite can gate a change:
+
+	python benchmarks/suite.py --save benchmarks/baseline.json
+	python benchmarks/suite.py --compare benchmarks/baseline.json
+
+Timings are only comparable on the same machine; --compare warns when
+the baseline was measured elsewhere. Latencies of a few microseconds
+vary more from run to run than throughputs, so they are held to the
+wider --latency-tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import AMPLITUDES, step_current
+import numba
+import numpy as np
+import kernels
+from utils import reduced_cells
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DT = 0.25
+LATENCY_STEPS = 40
+DURATIONS = (100.0, 1000.0)
+POPULATIONS = (1, 100, 1000)
+QUICK_DURATIONS = (100.0,)
+QUICK_POPULATIONS = (1, 100)
+
+# cell type simulated by each single-cell kernel
+KERNEL_CELLS = (('get_vm_one_two_three', 'RS'), ('get_vm_four', 'LTS'), ('get_vm_five', 'FS'),
+				('get_vm_six', 'TC'), ('get_vm_seven', 'RTN'), ('get_vm_cell', 'RS'))
+BACKENDS = ('population', 'population_parallel')
+KERNELS = tuple(name for name, _ in KERNEL_CELLS) + ('get_2003_vm',) + BACKENDS
+
+
+def kernel_call(name, steps):
+	"""
+	A function of no arguments that runs kernel name for steps samples.
+	"""
+	if name == 'get_2003_vm':
+		I = np.full(steps, 14.0)
+		times = np.arange(steps)*DT
+		return lambda: kernels.get_2003_vm(I, times, a=0.02, b=0.2, c=-65.0, d=6.0, vr=-70.0, dt=DT)
+	if name in BACKENDS:
+		cell = reduced_cells['RS']
+		I = step_current(AMPLITUDES['RS'], steps*DT, DT)
+		return lambda: kernels.simulate_population([cell], I, dt=DT, parallel=name.endswith('parallel'))
+	key = dict(KERNEL_CELLS)[name]
+	cell = reduced_cells[key]
+	attrs = dict((param, float(cell[param])) for param in kernels.PARAM_NAMES if param != 'celltype')
+	I = step_current(AMPLITUDES[key], steps*DT, DT)
+	kernel = getattr(kernels, name)
+	if name == 'get_vm_cell':
+		args = tuple(int(cell[param]) if param == 'celltype' else float(cell[param])
+					 for param in kernels.KERNEL_PARAMS)
+		return lambda: kernel(np.empty(steps), I, *args, dt=DT)
+	if name == 'get_vm_six':
+		return lambda: kernel(I, dt=DT, **attrs)
+	return lambda: kernel(I=I, dt=DT, **attrs)
+
+
+def compile_time(name):
+	"""
+	Seconds taken by the first call of kernel name in a new process with
+	an empty numba cache.
+	"""
+	cache_dir = tempfile.mkdtemp(prefix='izhi-bench-cache-')
+	env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+	output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--compile-worker', name],
+									 env=env)
+	return float(output.decode().strip().splitlines()[-1])
+
+
+def _compile_worker(name):
+	call = kernel_call(name, LATENCY_STEPS)
+	t1 = time.perf_counter()
+	call()
+	print(time.perf_counter() - t1)
+
+
+def best_time(func, min_time=0.5, repeat=7):
+	"""
+	Smallest time per call over repeat batches, each batch running for at
+	least min_time seconds.
+	"""
+	func()
+	number = 1
+	while True:
+		t1 = time.perf_counter()
+		for _ in range(number):
+			func()
+		elapsed = time.perf_counter() - t1
+		if elapsed >= min_time/repeat or number >= 1 << 20:
+			break
+		number *= 4
+	best = elapsed/number
+	for _ in range(repeat - 1):
+		t1 = time.perf_counter()
+		for _ in range(number):
+			func()
+		best = min(best, (time.perf_counter() - t1)/number)
+	return best
+
+
+def population_call(name, n_cells, steps):
+	cells = [reduced_cells['RS']]*n_cells
+	I = step_current(AMPLITUDES['RS'], steps*DT, DT)
+	return lambda: kernels.simulate_population(cells, I, dt=DT, parallel=name.endswith('parallel'))
+
+
+def run(quick=False, compile=True, pattern=None):
+	"""
+	Run the suite and return {metric: {'value', 'unit', 'better'}}.
+	"""
+	durations = QUICK_DURATIONS if quick else DURATIONS
+	populations = QUICK_POPULATIONS if quick else POPULATIONS
+	results = {}
+
+	def record(metric, value, unit, better):
+		results[metric] = {'value': value, 'unit': unit, 'better': better}
+		print('%-44s %14.6g %s' % (metric, value, unit))
+		sys.stdout.flush()
+
+	def wanted(metric):
+		return pattern is None or re.search(pattern, metric)
+
+	for name in KERNELS:
+		if compile and wanted('compile/%s' % name):
+			record('compile/%s' % name, compile_time(name), 's', 'lower')
+		if wanted('latency/%s' % name):
+			record('latency/%s' % name, best_time(kernel_call(name, LATENCY_STEPS))*1e6, 'us', 'lower')
+		for duration in durations:
+			steps = int(duration/DT)
+			if name in BACKENDS:
+				for n_cells in populations:
+					metric = 'throughput/%s/%dx%dms' % (name, n_cells, duration)
+					if wanted(metric):
+						elapsed = best_time(population_call(name, n_cells, steps))
+						record(metric, n_cells*steps/elapsed, 'cell-steps/s', 'higher')
+			else:
+				metric = 'throughput/%s/%dms' % (name, duration)
+				if wanted(metric):
+					record(metric, steps/best_time(kernel_call(name, steps)), 'cell-steps/s', 'higher')
+	return results
+
+
+def machine():
+	return {'python': platform.python_version(), 'numpy': np.__version__,
+			'numba': numba.__version__, 'platform': platform.platform(),
+			'processor': platform.processor() or platform.machine(),
+			'cpus': os.cpu_count(), 'threads': numba.config.NUMBA_NUM_THREADS}
+
+
+def compare(results, baseline, tolerance, latency_tolerance=None):
+	"""
+	Print the change of every metric against baseline and return the
+	names of those that regressed by more than tolerance (a fraction),
+	or by more than latency_tolerance for the latency metrics.
+	"""
+	if latency_tolerance is None:
+		latency_tolerance = tolerance
+	if baseline.get('machine') != machine():
+		print('warning: the baseline was measured on a different machine or software versions')
+	regressions = []
+	print('\n%-44s %14s %14s %9s' % ('metric', 'baseline', 'now', 'change'))
+	for metric, result in sorted(results.items()):
+		if metric not in baseline['results']:
+			continue
+		old = baseline['results'][metric]['value']
+		new = result['value']
+		if result['better'] == 'lower':
+			change = old/new - 1.0
+		else:
+			change = new/old - 1.0
+		flag = ''
+		if change < -(latency_tolerance if metric.startswith('latency/') else tolerance):
+			regressions.append(metric)
+			flag = ' REGRESSION'
+		print('%-44s %14.6g %14.6g %+8.1f%%%s' % (metric, old, new, 100*change, flag))
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+	parser.add_argument('--quick', action='store_true', help='fewer durations and population sizes')
+	parser.add_argument('--no-compile', action='store_true', help='skip the compile-time measurements')
+	parser.add_argument('--filter', help='only run metrics matching this regular expression')
+	parser.add_argument('--save', help='write the results to this JSON file')
+	parser.add_argument('--compare', help='compare against this baseline JSON file')
+	parser.add_argument('--tolerance', type=float, default=0.25,
+						help='allowed slowdown as a fraction (default 0.25)')
+	parser.add_argument('--latency-tolerance', type=float, default=0.5,
+						help='allowed slowdown of the latency metrics (default 0.5)')
+	parser.add_argument('--compile-worker', help=argparse.SUPPRESS)
+	args = parser.parse_args(argv)
+	if args.compile_worker:
+		_compile_worker(args.compile_worker)
+		return 0
+
+	results = run(quick=args.quick, compile=not args.no_compile, pattern=args.filter)
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump({'machine': machine(), 'results': results}, f, indent=1, sort_keys=True)
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		regressions = compare(results, baseline, args.tolerance, args.latency_tolerance)
+		if regressions:
+			print('\n%d metric(s) regressed by more than the tolerance' % len(regressions))
+			return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Spike-time drift of the float32 mode against float64.
+
+Every reduced_cells entry is simulated twice with each dtype: with a
+plain step current, and with the same step plus gaussian noise (fixed
+seed), whose samples are not exactly representable in single precision.
+For each run the spike-count difference, the mean and worst spike-time
+difference, the largest voltage difference and the memory of the
+current plus trace are printed, together with the runtime of a
+population of identical cells.
+
+usage: python benchmarks/validate_float32.py [t_stop_ms] [dt_ms]
+"""
+import sys
+
+from common import AMPLITUDES, best_of, step_current
+from bench_dt import spike_time_error
+import numpy as np
+from kernels import simulate_population, simulate_population_spikes
+from utils import reduced_cells
+
+N_CELLS = 256
+NOISE_SD = 20.0
+
+
+def stimuli(amplitude, t_stop, dt):
+	I = step_current(amplitude, t_stop, dt)
+	noise = np.random.RandomState(0).normal(0.0, NOISE_SD, len(I))
+	return (('step', I), ('noisy step', I + noise))
+
+
+def main(t_stop=1000.0, dt=0.25):
+	print('%d steps, dt=%s ms, %d cells per timing' % (int(t_stop/dt), dt, N_CELLS))
+	print('%-5s %-11s %7s %11s %11s %11s %10s %10s %9s %9s'
+		  % ('type', 'stimulus', 'dcount', 'mean ms', 'max ms', 'max dv mV',
+			 'f64 bytes', 'f32 bytes', 'f64 s', 'f32 s'))
+	for key, cell in reduced_cells.items():
+		for name, I in stimuli(AMPLITUDES[key], t_stop, dt):
+			results = {}
+			for dtype in (np.float64, np.float32):
+				trace = simulate_population([cell], I, dt=dt, dtype=dtype)[0]
+				times = simulate_population_spikes([cell], I, dt=dt, dtype=dtype)[0]
+				runtime = best_of(lambda: simulate_population([cell] * N_CELLS, I, dt=dt, dtype=dtype))
+				nbytes = 2*trace.nbytes*N_CELLS
+				results[dtype] = (trace, times, nbytes, runtime)
+			trace64, times64, bytes64, runtime64 = results[np.float64]
+			trace32, times32, bytes32, runtime32 = results[np.float32]
+			dcount, mean_error, max_error = spike_time_error(times32, times64)
+			dv = np.abs(trace32.astype(np.float64) - trace64).max()
+			print('%-5s %-11s %7d %11.4f %11.4f %11.2e %10d %10d %9.4f %9.4f'
+				  % (key, name, dcount, mean_error, max_error, dv,
+					 bytes64, bytes32, runtime64, runtime32))
+
+
+if __name__ == '__main__':
+	main(*[float(a) for a in sys.argv[1:]])
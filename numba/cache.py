@@ -0,0 +1,156 @@
+"""
+Memoization of IZHIModel results.
+
+Optimizers evaluate the same (attrs, stimulus) pair many times. A
+ResultCache maps a content hash of everything that determines a run
+(see cache_key) to the raw result array, the membrane potential trace or
+the spike times, in two tiers:
+
+- an in-memory LRU tier bounded to max_entries arrays;
+- an optional on-disk tier, one .npy file per key under directory, that
+  is loaded memory-mapped and can be shared by any number of processes.
+
+	>>> cache = ResultCache(max_entries=256, directory='/tmp/izhi-cache')
+	>>> model = IZHIModel(attrs, cache=cache)
+	>>> model.inject_square_current(current)   # simulated
+	>>> model.inject_square_current(current)   # from the cache
+	>>> cache.stats()
+"""
+import collections
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from kernels import PARAM_NAMES
+
+
+def _canonical(value):
+	"""
+	A hashable form of value in which equal values are equal: numbers
+	become floats, sequences a digest of their float64 contents.
+	"""
+	if isinstance(value, (float, int, np.number)) and not isinstance(value, (bool, np.bool_)):
+		return float(value)
+	if isinstance(value, (list, tuple, np.ndarray)):
+		array = np.ascontiguousarray(value, dtype=np.float64)
+		if array.ndim == 0:
+			return float(array)
+		return (array.shape, hashlib.sha1(array.tobytes()).hexdigest())
+	return value
+
+
+def cache_key(attrs, stimulus, **settings):
+	"""
+	sha1 hex digest identifying a run.
+
+	attrs : model parameters; only the names in kernels.PARAM_NAMES are
+			used, celltype is rounded to int
+	stimulus : description of the injected current, e.g.
+			   ('square', amplitude, delay, duration) or ('direct', I)
+	settings : anything else the result depends on (dt, method, ...)
+	"""
+	params = tuple((name, int(round(attrs[name])) if name == 'celltype' else _canonical(attrs[name]))
+				   for name in PARAM_NAMES if name in attrs)
+	description = (params,
+				   tuple(_canonical(item) for item in stimulus),
+				   tuple(sorted((key, _canonical(value)) for key, value in settings.items())))
+	return hashlib.sha1(repr(description).encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+	"""
+	Two-tier cache of result arrays keyed by cache_key.
+
+	max_entries : size of the in-memory LRU tier
+	directory : on-disk tier, shared between processes; None keeps the
+				cache in memory only
+	"""
+
+	def __init__(self, max_entries=128, directory=None):
+		self.max_entries = int(max_entries)
+		self.directory = directory
+		if directory is not None and not os.path.isdir(directory):
+			os.makedirs(directory)
+		self._entries = collections.OrderedDict()
+		self.hits = 0
+		self.disk_hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def _path(self, key):
+		return os.path.join(self.directory, key[:2], key + '.npy')
+
+	def get(self, key):
+		"""
+		The array stored under key, or None. Disk hits are memory-mapped
+		read-only and promoted to the memory tier.
+		"""
+		if key in self._entries:
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return self._entries[key]
+		if self.directory is not None:
+			path = self._path(key)
+			if os.path.exists(path):
+				value = np.load(path, mmap_mode='r')
+				self.disk_hits += 1
+				self._remember(key, value)
+				return value
+		self.misses += 1
+		return None
+
+	def put(self, key, value):
+		"""
+		Store a read-only copy of value under key in both tiers.
+		"""
+		value = np.array(value)
+		value.flags.writeable = False
+		self._remember(key, value)
+		if self.directory is not None:
+			path = self._path(key)
+			if not os.path.exists(path):
+				folder = os.path.dirname(path)
+				if not os.path.isdir(folder):
+					os.makedirs(folder, exist_ok=True)
+				# write to a temporary file and rename it, so that another
+				# process never sees a partial file
+				handle, temporary = tempfile.mkstemp(dir=folder, suffix='.npy')
+				with os.fdopen(handle, 'wb') as f:
+					np.save(f, value)
+				os.replace(temporary, path)
+
+	def _remember(self, key, value):
+		self._entries[key] = value
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last=False)
+			self.evictions += 1
+
+	def __contains__(self, key):
+		return key in self._entries or (self.directory is not None
+										and os.path.exists(self._path(key)))
+
+	def __len__(self):
+		return len(self._entries)
+
+	def clear(self, disk=False):
+		"""
+		Empty the memory tier, and the disk tier as well with disk=True.
+		"""
+		self._entries.clear()
+		if disk and self.directory is not None:
+			for folder, _, files in os.walk(self.directory):
+				for name in files:
+					if name.endswith('.npy'):
+						os.remove(os.path.join(folder, name))
+
+	def stats(self):
+		"""
+		Hit/miss counters; hit_rate counts memory and disk hits.
+		"""
+		lookups = self.hits + self.disk_hits + self.misses
+		return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+				'evictions': self.evictions, 'entries': len(self._entries),
+				'hit_rate': (self.hits + self.disk_hits)/lookups if lookups else 0.0}
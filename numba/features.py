@@ -0,0 +1,192 @@
+"""
+Compiled electrophysiology features of simulated cells.
+
+The extractors work on the plain arrays of kernels.py, one row per
+cell, and return a numpy structured array of dtype FEATURES:
+
+	spike_count    spikes in [t_start, t_stop)
+	rate           spike_count/(t_stop - t_start), Hz
+	latency        first spike time minus t_start, ms
+	mean_isi       mean interspike interval, ms
+	isi_cv         standard deviation over mean of the intervals
+	adaptation     mean of (isi[i+1] - isi[i])/(isi[i+1] + isi[i]),
+				   positive for a slowing train
+	burst_count    runs of at least two spikes closer than burst_isi
+	ap_peak        mean spike peak, mV (trace_features only)
+
+Undefined features (a latency without spikes, a CV with fewer than two
+intervals ...) are nan.
+
+	>>> times = simulate_population_spikes(cells, I, dt=0.25)
+	>>> table = spike_features(times, t_stop=len(I)*0.25)
+	>>> table = trace_features(simulate_population(cells, I), dt=0.25)
+"""
+import numpy as np
+from numba import jit, prange
+
+from kernels import _grow
+
+FEATURES = np.dtype([('spike_count', np.int64), ('rate', np.float64), ('latency', np.float64),
+					 ('mean_isi', np.float64), ('isi_cv', np.float64), ('adaptation', np.float64),
+					 ('burst_count', np.int64), ('ap_peak', np.float64)])
+# interspike interval (ms) below which consecutive spikes belong to a burst
+BURST_ISI = 10.0
+
+
+@jit(nopython=True, cache=True)
+def _train_features(out, times, peaks, t_start, t_stop, burst_isi):
+	"""
+	Fill out with the features, in FEATURES order, of one spike train.
+
+	times : spike times in ms, sorted
+	peaks : spike peaks in mV, or an empty array
+	"""
+	for j in range(out.shape[0]):
+		out[j] = np.nan
+	first = 0
+	while first < times.shape[0] and times[first] < t_start:
+		first += 1
+	last = first
+	while last < times.shape[0] and times[last] < t_stop:
+		last += 1
+	n = last - first
+	out[0] = n
+	out[1] = n/((t_stop - t_start)/1000.0)
+	out[6] = 0
+	if n == 0:
+		return out
+	out[2] = times[first] - t_start
+	if peaks.shape[0] > 0:
+		total = 0.0
+		for i in range(first, last):
+			total += peaks[i]
+		out[7] = total/n
+	if n < 2:
+		return out
+
+	total = 0.0
+	for i in range(first, last-1):
+		total += times[i+1] - times[i]
+	mean = total/(n-1)
+	out[3] = mean
+	if n > 2:
+		squares = 0.0
+		ratios = 0.0
+		for i in range(first, last-1):
+			isi = times[i+1] - times[i]
+			squares += (isi - mean)**2
+			if i < last-2:
+				following = times[i+2] - times[i+1]
+				if following + isi > 0:
+					ratios += (following - isi)/(following + isi)
+		out[4] = np.sqrt(squares/(n-1))/mean if mean > 0 else np.nan
+		out[5] = ratios/(n-2)
+
+	bursts = 0
+	in_burst = False
+	for i in range(first, last-1):
+		if times[i+1] - times[i] < burst_isi:
+			if not in_burst:
+				bursts += 1
+				in_burst = True
+		else:
+			in_burst = False
+	out[6] = bursts
+	return out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_spike_features(out, times, offsets, t_start, t_stop, burst_isi):
+	"""
+	Features of every spike train of (times, offsets), the packed form of
+	kernels.get_spikes_population: the spikes of cell n are
+	times[offsets[n]:offsets[n+1]].
+	"""
+	empty = np.empty(0)
+	for n in prange(out.shape[0]):
+		_train_features(out[n], times[offsets[n]:offsets[n+1]], empty, t_start, t_stop, burst_isi)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def _trace_spikes(v, dt, threshold):
+	"""
+	(times, peaks) of the upward threshold crossings of one trace; the
+	peak is the largest sample before v falls back below threshold.
+	"""
+	times = np.empty(16)
+	peaks = np.empty(16)
+	n = 0
+	above = v.shape[0] > 0 and v[0] >= threshold
+	for i in range(1, v.shape[0]):
+		if v[i] >= threshold:
+			if not above:
+				times = _grow(times, n)
+				peaks = _grow(peaks, n)
+				times[n] = i*dt
+				peaks[n] = v[i]
+				n += 1
+				above = True
+			elif v[i] > peaks[n-1]:
+				peaks[n-1] = v[i]
+		else:
+			above = False
+	return times[:n], peaks[:n]
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_trace_features(out, v, dt, threshold, t_start, t_stop, burst_isi):
+	"""
+	Features of every row of the (cells, steps) trace array v.
+	"""
+	for n in prange(out.shape[0]):
+		times, peaks = _trace_spikes(v[n], dt, threshold)
+		_train_features(out[n], times, peaks, t_start, t_stop, burst_isi)
+	return out
+
+
+def _table(values):
+	table = np.empty(values.shape[0], dtype=FEATURES)
+	for j, name in enumerate(FEATURES.names):
+		column = values[:, j]
+		if FEATURES[name] == np.int64:
+			column = column.astype(np.int64)
+		table[name] = column
+	return table
+
+
+def spike_features(spikes, t_stop, t_start=0.0, burst_isi=BURST_ISI):
+	"""
+	Features of a list of spike-time arrays (ms), e.g. from
+	kernels.simulate_population_spikes, or of a single array such as
+	IZHIModel.get_spike_times(). ap_peak is nan, the peaks are not known.
+	"""
+	if isinstance(spikes, np.ndarray) and spikes.ndim == 1 and spikes.dtype != object:
+		spikes = [spikes]
+	spikes = [np.asarray(times, dtype=np.float64) for times in spikes]
+	offsets = np.zeros(len(spikes)+1, dtype=np.int64)
+	offsets[1:] = np.cumsum([len(times) for times in spikes])
+	times = np.concatenate(spikes) if spikes else np.empty(0)
+	values = np.empty((len(spikes), len(FEATURES.names)))
+	get_spike_features(values, times, offsets, float(t_start), float(t_stop), float(burst_isi))
+	return _table(values)
+
+
+def trace_features(v, dt, threshold=0.0, t_start=0.0, t_stop=None, burst_isi=BURST_ISI):
+	"""
+	Features of one membrane potential trace (mV) or of a (cells, steps)
+	batch, e.g. from kernels.simulate_population. Spikes are upward
+	crossings of threshold (mV), as in IZHIModel.get_spike_count.
+	t_stop defaults to the end of the traces.
+	"""
+	v = np.asarray(v)
+	if v.dtype not in (np.float64, np.float32):
+		v = v.astype(np.float64)
+	if v.ndim == 1:
+		v = v[np.newaxis]
+	if t_stop is None:
+		t_stop = v.shape[1]*dt
+	values = np.empty((v.shape[0], len(FEATURES.names)))
+	get_trace_features(values, v, float(dt), float(threshold), float(t_start), float(t_stop),
+					   float(burst_isi))
+	return _table(values)
@@ -1,192 +1,76 @@
-
-from quantities import mV, ms, s, V
-from neo import AnalogSignal
-import neuronunit.capabilities as cap
 import numpy as np
-import quantities as pq
-import numpy
-voltage_units = mV
-import copy
-from elephant.spike_train_generation import threshold_detection
-
-from numba import jit#, autojit
-import cython
-import time
-def timer(func):
-	def inner(*args, **kwargs):
-		t1 = time.time()
-		f = func(*args, **kwargs)
-		t2 = time.time()
-		print('time taken on block {0} '.format(t2-t1))
-		return f
-	return inner
-
-@jit(nopython=True)
-def get_vm_four(C=89.7960714285714,
-		 a=0.01, b=15, c=-60, d=10, k=1.6,
-		 vPeak=(86.364525297619-65.2261863636364),
-		  vr=-65.2261863636364, vt=-50,I=[]):
-		  #celltype=1, N=0,start=0,stop=0,amp=0,ramp=None):
-	tau = dt = 0.25
-	N = len(I)
-
-	v = vr*np.ones(N)
-	u = np.zeros(N)
-
-	v[0] = vr
-	for i in range(N-1):
-		# forward Euler method
-		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
-		u[i+1] = u[i]+tau*a*(b*(v[i]-vr)-u[i]); # Calculate recovery variable
-		if v[i+1] > (vPeak - 0.1*u[i+1]):
-			v[i] = vPeak - 0.1*u[i+1]
-			v[i+1] = c + 0.04*u[i+1]; # Reset voltage
-			if (u[i]+d)<670:
-				u[i+1] = u[i+1]+d; # Reset recovery variable
-			else:
-				u[i+1] = 670;
-
-	return v
-
-@jit#(nopython=True)
-def get_vm_five(C=89.7960714285714,
-		 a=0.01, b=15, c=-60, d=10, k=1.6,
-		 vPeak=(86.364525297619-65.2261863636364),
-		  vr=-65.2261863636364, vt=-50,I=[]):#celltype=1,
-		  #N=0,start=0,stop=0,amp=0,ramp=None,pulse=None):
-	N = len(I)
-
-	tau= dt = 0.25; #dt
-	v = vr*np.ones(N)
-	u = np.zeros(N)
-	v[0] = vr
-	for i in range(N-1):
-		# forward Euler method
-		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
-
-		#u[i+1]=u[i]+tau*a*(b*(v[i]-vr)-u[i]); # Calculate recovery variable
-		if v[i+1] < d:
-			u[i+1] = u[i] + tau*a*(0-u[i])
-		else:
-			u[i+1] = u[i] + tau*a*((0.025*(v[i]-d)**3)-u[i])
-
-
-		if v[i+1]>=vPeak:
-			v[i]=vPeak;
-			v[i+1]=c;
-
-	return v
-
-
-
-@jit#(nopython=True)
-def get_vm_six(I,C=89.7960714285714,
-		 a=0.01, b=15, c=-60, d=10, k=1.6,
-		 vPeak=(86.364525297619-65.2261863636364),
-		  vr=-65.2261863636364, vt=-50):
-	tau= dt = 0.25; #dt
-	N = len(I)
-
-	v = vr*np.ones(N)
-	u = np.zeros(N)
-	v[0] = vr
-	for i in range(N-1):
-	   # forward Euler method
-		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
-
-
-		if v[i+1] > -65:
-			b=0;
-		else:
-			b=15;
-		u[i+1]=u[i]+tau*a*(b*(v[i]-vr)-u[i]);
-
-		if v[i+1] > (vPeak + 0.1*u[i+1]):
-			v[i]= vPeak + 0.1*u[i+1];
-			v[i+1] = c-0.1*u[i+1]; # Reset voltage
-			u[i+1]=u[i+1]+d;
-
-	return v
-
-@jit#(nopython=True)
-def get_vm_seven(C=89.7960714285714,
-		 a=0.01, b=15, c=-60, d=10, k=1.6,
-		 vPeak=(86.364525297619-65.2261863636364),
-		  vr=-65.2261863636364, vt=-50,I=np.array([0])):
-	tau= dt = 0.25; #dt
-	N = len(I)
 
-	v = vr*np.ones(N)
-	u = np.zeros(N)
-	for i in range(N-1):
-
-		# forward Euler method
-		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
-
-
-		if v[i+1] > -65:
-			b=2;
-		else:
-			b=10;
-
-		u[i+1]=u[i]+tau*a*(b*(v[i]-vr)-u[i]);
-		if v[i+1]>=vPeak:
-			v[i]=vPeak;
-			v[i+1]=c;
-			u[i+1]=u[i+1]+d;  # reset u, except for FS cells
-
-
-	return v
-
-
-@jit(nopython=True)
-def get_vm_one_two_three(C=89.7960714285714,
-		 a=0.01, b=15, c=-60, d=10, k=1.6,
-		 vPeak=(86.364525297619-65.2261863636364),
-		  vr=-65.2261863636364, vt=-50,I=np.array([0])):
-	tau= dt = 0.25; #dt
-	N = len(I)
-	v = vr*np.ones(N)
-	u = np.zeros(N)
-	for i in range(N-1):
-		# forward Euler method
-		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
-		u[i+1] = u[i]+tau*a*(b*(v[i]-vr)-u[i]); # Calculate recovery variable
-
-		if v[i+1]>=vPeak:
-			v[i]=vPeak
-			v[i+1]=c
-			u[i+1]=u[i+1]+d  # reset u, except for FS cells
-	return v
-
-@jit(nopython=True)
-def get_2003_vm(I,times,a=0.01, b=15, c=-60, d=10,vr = -70):
-	u=b*vr
-	V = vr
-	tau = dt = 0.25
-	N = len(I)
-	vv = np.zeros(N)
-	UU = np.zeros(N)
-
-	for i in range(N):
-		V = V + tau*(0.04*V**2+5*V+140-u+I[i]);
-		u = u + tau*a*(b*V-u);
-		if V > 30:
-			vv[i] = 30;
-			V = c;
-			u = u + d;
-		else:
-			vv[i]=V;
-		UU[i]=u;
-	return vv
+import adapters
+import kernels
+from cache import cache_key
+import features
+import metrics
+from metrics import timer
+from params import CellParams
+from kernels import get_vm_one_two_three, get_vm_four, get_vm_five, get_vm_six, get_vm_seven, get_2003_vm
+from kernels import get_vm_population, get_vm_population_parallel, simulate_population, population_params
+from kernels import get_spike_indices, simulate_population_spikes
+from kernels import get_vm_chunk, simulate_population_chunk, get_vm_cell
+from kernels import record_population, recording_window
+from kernels import precompile, PARAM_NAMES
+from stimulus import segment_table, get_vm_cell_stimulus, get_spike_times_stimulus, get_stimulus_samples
+from stimulus import Stimulus
+from noise import simulate_trials
 
 
 class IZHIModel():
 
 	name = 'IZHI'
 
-	def __init__(self, attrs=None):
+	def __init__(self, attrs=None, record='vm', dt=0.25, method='euler', tol=0.01,
+				 interpolate=False, dtype=np.float64, cache=None, record_every=1,
+				 record_u=False, record_window=None, workspace=None):
+		"""
+		record : 'vm' to keep the membrane potential as an AnalogSignal,
+				 'spikes' to keep only the spike times (see get_spike_times)
+		dt : integration time step in ms
+		method : 'euler', 'exp_euler', 'rk4' or 'adaptive', see
+				 kernels.simulate_population
+		tol : sub-step error tolerance in mV for method='adaptive'
+		interpolate : reset at the threshold crossing within the step and
+					  report continuous spike times
+		dtype : np.float32 to keep the current and the recorded trace in
+				single precision, see kernels.simulate_population
+		cache : a cache.ResultCache; runs whose attrs, stimulus and
+				settings were seen before are taken from it
+		record_every : keep one sample of the trace in every steps
+		record_u : also record the recovery variable, see
+				   get_recovery_variable
+		record_window : (t_start, t_stop) in ms to record only part of
+						the run, t_stop may be None for the end
+		The record_* options are applied inside the kernel
+		(kernels.record_population), so unrecorded samples are never
+		allocated.
+		workspace : a kernels.Workspace whose buffers hold the trace of
+					every run, so repeated runs do not allocate it; the
+					vM of a run is then a view that the next run
+					overwrites
+		"""
 		self.vM = None
+		self.dt = dt
+		self.method = method
+		self.tol = tol
+		self.interpolate = interpolate
+		self.dtype = np.dtype(dtype)
+		self.cache = cache
+		self.workspace = workspace
+		self._cache_key = None
+		# metrics.RunRecord of the run in progress, None unless metrics are enabled
+		self._run = None
+		self.tstop = None
+		self.spike_times = None
+		self.record = record
+		self.record_every = int(record_every)
+		self.record_u = record_u
+		self.record_window = record_window
+		self.uM = None
+		self._params = None
+		self._params_snapshot = None
 		self.attrs = attrs
 		self.temp_attrs = None
 		self.default_attrs = {'C':89.7960714285714,
@@ -200,219 +84,450 @@ class IZHIModel():
 			self.attrs = self.default_attrs
 
 
+	@property
+	def attrs(self):
+		return self._attrs
+
+	@attrs.setter
+	def attrs(self, attrs):
+		self._attrs = attrs
+		self._params = None
+		self._params_snapshot = None
+
+	@property
+	def params(self):
+		"""
+		The attrs as a validated params.CellParams. The record is rebuilt
+		whenever the parameter values in attrs differ from those it was
+		built from, so in-place edits of the dict are seen by every run.
+		"""
+		if self._attrs is None:
+			self._attrs = self.default_attrs
+		snapshot = tuple(self._attrs.get(name) for name in PARAM_NAMES)
+		if self._params is None or snapshot != self._params_snapshot:
+			self._params = CellParams.from_attrs(self._attrs)
+			self._params_snapshot = snapshot
+		return self._params
+
 	def get_spike_count(self):
-		thresh = threshold_detection(self.vM,0*qt.mV)
-		return len(thresh)
+		if self.record == 'spikes':
+			return len(self.spike_times)
+		return adapters.threshold_spike_count(self.vM, 0.0)
+
+	def get_spike_times(self):
+		"""Spike times in ms of the last run made with record='spikes'.
+		"""
+		return self.spike_times
+
+	def get_features(self, t_start=0.0, t_stop=None, burst_isi=features.BURST_ISI):
+		"""
+		Firing features of the last run as a features.FEATURES record,
+		computed from the spike times or the raw trace without going
+		through neo or elephant. t_stop defaults to the end of the run.
+		"""
+		if t_stop is None:
+			t_stop = self.tstop
+		if self.record == 'spikes':
+			return features.spike_features(self.spike_times, t_stop, t_start, burst_isi)[0]
+		v = np.asarray(self.vM, dtype=np.float64).ravel()
+		# the trace starts at t0 with a decimated record, which can miss spikes
+		period, t0 = self._sampling()
+		return features.trace_features(v, period, 0.0, t_start - t0, t_stop - t0, burst_isi)[0]
+
+	def get_recovery_variable(self):
+		"""
+		AnalogSignal of the recovery variable u (pA) of the last run made
+		with record_u=True, else None.
+		"""
+		return self.uM
 
-	def set_stop_time(self, stop_time = 650*pq.ms):
+	def iter_membrane_potential(self, chunks, state=None):
+		"""
+		Generator that integrates an iterable of current chunks and yields
+		one AnalogSignal per chunk.
+
+		The cell starts at rest unless state=(v, u) is given; the state after
+		each chunk is kept in self.state, so an interrupted stream can be
+		resumed. Memory use does not depend on the total duration.
+		Chunks are integrated with forward Euler (kernels.get_vm_chunk),
+		so the model must use method='euler' without interpolate.
+		"""
+		if self.method != 'euler' or self.interpolate:
+			raise ValueError("chunked runs only support method='euler' without interpolate, "
+							 "got method=%r, interpolate=%r" % (self.method, self.interpolate))
+		params = self.params
+		if state is None:
+			state = (params.vr, 0.0)
+		v, u = state
+		self.state = (v, u)
+		t_start = 0.0
+		for I in chunks:
+			I = np.asarray(I, dtype=self.dtype)
+			out = np.empty(len(I), dtype=self.dtype)
+			v, u = get_vm_chunk(out, I, v, u, *params.args, dt=self.dt)
+			self.state = (v, u)
+			yield adapters.to_analogsignal(out, self.dt, t_start=t_start)
+			t_start += len(I)*self.dt
+
+	def _record_spikes(self, I):
+		"""
+		Integrate I keeping only the spike times, the voltage trace is never
+		allocated.
+		"""
+		if self._uses_method_kernels():
+			self.vM = None
+			self.spike_times = self._integrate(simulate_population_spikes, [self.params.as_dict()], I, dt=self.dt,
+											   method=self.method, tol=self.tol,
+											   interpolate=self.interpolate,
+											   dtype=self.dtype)[0]
+		else:
+			indices = self._integrate(get_spike_indices, np.asarray(I, dtype=self.dtype),
+									  *self.params.args, dt=self.dt)
+			self.vM = None
+			self.spike_times = indices*self.dt
+		return self._keep_spikes()
+
+	def _keep_spikes(self):
+		self._store(self.spike_times)
+		if self._run is not None:
+			self._close(self.spike_times)
+		return self.spike_times
+
+	def set_stop_time(self, stop_time=650.0):
 		"""Sets the simulation duration
-		stopTimeMs: duration in milliseconds
+		stop_time: duration, a quantity or a float in milliseconds
 		"""
-		self.tstop = float(stop_time.rescale(pq.ms))
+		self.tstop = adapters.to_ms(stop_time)
 
+	def warmup(self):
+		"""
+		Compile (or load from numba's disk cache) the kernels this model
+		uses with its current settings, so the first real run does not pay
+		for it. The last recorded results are left untouched.
+		"""
+		vM, spike_times, cache, tstop = self.vM, self.spike_times, self.cache, self.tstop
+		self.cache = None
+		try:
+			# warm-up runs are not runs of the model, keep them out of the metrics
+			with metrics.paused():
+				self.inject_direct_current(np.zeros(4))
+				self.inject_square_current({'amplitude': 0.0, 'delay': self.dt,
+											'duration': 4*self.dt})
+		finally:
+			self.vM, self.spike_times, self.cache, self.tstop = vM, spike_times, cache, tstop
+
+	def _uses_method_kernels(self):
+		return self.method != 'euler' or self.interpolate
+
+	def _selective(self):
+		"""
+		True if the record_* options ask for less than the full trace.
+		"""
+		return self.record_every != 1 or self.record_u or self.record_window is not None
 
-	def get_membrane_potential(self):
-		"""Must return a neo.core.AnalogSignal.
+	def _sampling(self):
 		"""
-		if type(self.vM) is not type(None):
-			return self.vM
+		(sampling period, time of the first sample) of the recorded trace.
+		"""
+		t_start = self.record_window[0] if self.record_window is not None else 0.0
+		start, _ = recording_window(0, self.dt, self.record_every, t_start)
+		return self.record_every*self.dt, start*self.dt
 
+	def _run_recording(self, I):
+		"""
+		Integrate I recording the samples and variables selected by the
+		record_* options. With record_u the cached value stacks v and u.
+		"""
+		t_start, t_stop = self.record_window if self.record_window is not None else (0.0, None)
+		variables = ('v', 'u') if self.record_u else ('v',)
+		result = self._integrate(record_population, [self.params.as_dict()], I, every=self.record_every,
+								 variables=variables, t_start=t_start, t_stop=t_stop, dt=self.dt,
+								 method=self.method, tol=self.tol, interpolate=self.interpolate,
+								 dtype=self.dtype)
+		value = np.vstack([result[name] for name in variables]) if self.record_u else result['v'][0]
+		self._store(value)
+		return self._wrap(value)
+
+	def _out(self, out, N):
+		"""
+		The trace buffer of a run of N samples, see kernels._out.
+		"""
+		return kernels._out(out, (N,), self.dtype, self.workspace)
 
-		if type(self.vM) is type(None):
+	def _trace(self, I, out=None):
+		"""
+		Forward Euler trace of the current I from rest, computed straight
+		from the parameter record (the get_vm_* scheme of every cell type).
+		"""
+		I = np.asarray(I, dtype=self.dtype)
+		out = self._out(out, len(I))
+		if self._run is None:
+			return get_vm_cell(out, I, *self.params.args, dt=self.dt)
+		return self._run.integrate(get_vm_cell, out, I, *self.params.args, dt=self.dt)
 
-			everything = copy.copy(self.attrs)
-			if hasattr(self,'Iext'):
-				everything.update({'Iext':self.Iext})
+	def _run_method(self, I, out=None):
+		"""
+		Integrate I with one of the alternative integrators of
+		kernels.simulate_population.
+		"""
+		out = self._out(out, len(np.atleast_1d(I)))
+		v = self._integrate(simulate_population, [self.params.as_dict()], I, dt=self.dt, method=self.method,
+							tol=self.tol, interpolate=self.interpolate,
+							dtype=self.dtype, out=out[np.newaxis])[0]
+		self._store(v)
+		return self._wrap(v)
+
+	def _simulate(self, I, out=None):
+		"""
+		Run I with the recording and integrator of the model, after a cache
+		miss. out receives the full trace, see inject_direct_current.
+		"""
+		if out is not None and (self.record == 'spikes' or self._selective()):
+			raise ValueError('out is only used when the full trace is recorded')
+		if self.record == 'spikes':
+			return self._record_spikes(I)
+		if self._selective():
+			return self._run_recording(I)
+		if self._uses_method_kernels():
+			return self._run_method(I, out)
+		v = self._trace(I, out)
+		self._store(v)
+		return self._wrap(v)
+
+	def _simulate_table(self, table, N, out=None):
+		"""
+		Run the N samples of a stimulus breakpoint table (see
+		stimulus.segment_table) after a cache miss; the current is computed
+		inside the kernel. Selective recording samples it first.
+		"""
+		if out is not None and (self.record == 'spikes' or self._selective()):
+			raise ValueError('out is only used when the full trace is recorded')
+		if self._selective():
+			I = get_stimulus_samples(np.empty(N, dtype=self.dtype), *table)
+			return self._run_recording(I)
+		method = kernels.METHODS[self.method]
+		if self.record == 'spikes':
+			self.vM = None
+			self.spike_times = self._integrate(get_spike_times_stimulus, N, *table + (
+											   method, self.interpolate, self.tol) + self.params.args,
+											   dt=self.dt)
+			return self._keep_spikes()
+		out = self._out(out, N)
+		v = self._integrate(get_vm_cell_stimulus, out, *table + (method, self.interpolate, self.tol)
+							+ self.params.args, dt=self.dt)
+		self._store(v)
+		return self._wrap(v)
+
+	def _integrate(self, kernel, *args, **kwargs):
+		if self._run is None:
+			return kernel(*args, **kwargs)
+		return self._run.integrate(kernel, *args, **kwargs)
+
+	def _wrap(self, v, source='kernel'):
+		"""
+		Set self.vM to the AnalogSignal of the trace v, closing the metrics
+		record of the run if there is one. A (2, samples) v holds the
+		traces of v and u recorded with record_u.
+		"""
+		value = v
+		period, t_start = self._sampling()
+		self.uM = None
+		if np.ndim(value) == 2:
+			v, u = value
+			self.uM = adapters.to_analogsignal(u, period, t_start=t_start, units='pA')
+		run = self._run
+		if run is None:
+			self.vM = adapters.to_analogsignal(v, period, t_start=t_start)
+			return self.vM
+		self.vM = run.postprocess(adapters.to_analogsignal, v, period, t_start)
+		self._close(value, source)
+		return self.vM
 
-			if 'current_inj' in everything.keys():
-				everything.pop('current_inj',None)
-			everything = copy.copy(self.attrs)
+	def _close(self, value, source='kernel'):
+		"""Close the metrics record of the run whose raw result is value."""
+		run, self._run = self._run, None
+		run.source = source
+		run.finish(value, len(value) if self.record == 'spikes' else None)
 
-			self.attrs['celltype'] = int(round(self.attrs['celltype']))
-			assert type(self.attrs['celltype']) is type(int())
-			if self.attrs['celltype'] <= 3:
-				everything.pop('celltype',None)
-				v = get_vm_one_two_three(**everything)
-			else:
-				if self.attrs['celltype'] == 4:
-					v = get_vm_four(**everything)
-				if self.attrs['celltype'] == 5:
-					v = get_vm_five(**everything)
-				if self.attrs['celltype'] == 6:
-					v = get_vm_six(**everything)
-				if self.attrs['celltype'] == 7:
+	def _lookup(self, stimulus):
+		"""
+		Look the run of stimulus up in self.cache. On a hit the result is
+		restored and returned; on a miss None is returned and the key is
+		kept for _store.
+		"""
+		self._cache_key = None
+		if self.cache is None:
+			return None
+		settings = {}
+		if self.record != 'spikes' and self._selective():
+			t_start, t_stop = self.record_window if self.record_window is not None else (0.0, None)
+			settings = {'record_every': self.record_every, 'record_u': bool(self.record_u),
+						'record_window': (t_start, np.inf if t_stop is None else t_stop)}
+		key = cache_key(self.params.as_dict(), stimulus, dt=self.dt, record=self.record,
+						method=self.method, tol=self.tol, interpolate=self.interpolate,
+						dtype=str(self.dtype), **settings)
+		value = self.cache.get(key)
+		if value is None:
+			self._cache_key = key
+			return None
+		if self.record != 'spikes':
+			return self._wrap(value, 'cache')
+		self.vM = None
+		self.spike_times = value
+		if self._run is not None:
+			self._close(value, 'cache')
+		return self.spike_times
 
+	def _store(self, value):
+		if self._cache_key is not None:
+			self.cache.put(self._cache_key, value)
+			self._cache_key = None
 
-					v = get_vm_seven(**everything)
 
-			self.vM = AnalogSignal(v,
-								units=pq.mV,
-								sampling_period=0.25*pq.ms)
+	def get_membrane_potential(self):
+		"""Must return a neo.core.AnalogSignal.
+		"""
+		if type(self.vM) is not type(None):
+			return self.vM
+
 
+		if type(self.vM) is type(None):
+			v = self._trace(self.attrs.get('I', np.zeros(0)))
+			self.vM = adapters.to_analogsignal(v, self.dt)
 
 		return self.vM
 
 	def set_attrs(self, attrs):
 		self.attrs = attrs
+		# the last results belong to the previous parameters
+		self.vM = None
+		self.spike_times = None
 
 
 	def wrap_known_i(self,i,times):
-		everything = self.attrs
-		if 'current_inj' in everything.keys():
-			everything.pop('current_inj',None)
-		if 'celltype' in everything.keys():
-			everything.pop('celltype',None)
-		two_thousand_and_three=False
-		if two_thousand_and_three:
-			v = AnalogSignal(get_2003_vm(i,times,**reduced),units=pq.mV,sampling_period=0.25*pq.ms)
-		else:
-			v = AnalogSignal(get_vm_known_i(i,times,**everything),units=pq.mV,sampling_period=(times[1]-times[0])*pq.ms)
-		thresh = threshold_detection(v,0*pq.mV)
-		return v
+		"""
+		Inject a known current i sampled at times (ms); the integration step
+		of this run is taken from the sampling interval of times, the
+		model's dt is left as it was.
+		"""
+		dt, self.dt = self.dt, float(times[1]-times[0])
+		try:
+			return self.inject_direct_current(i)
+		finally:
+			self.dt = dt
 
-	@cython.boundscheck(False)
-	@cython.wraparound(False)
-	def inject_direct_current(self, I):
+	def inject_direct_current(self, I, out=None):
 		"""
 		Inputs: current : a dictionary with exactly three items, whose keys are: 'amplitude', 'delay', 'duration'
 		Example: current = {'amplitude':float*pq.pA, 'delay':float*pq.ms, 'duration':float*pq.ms}}
 		where \'pq\' is a physical unit representation, implemented by casting float values to the quanitities \'type\'.
 		Description: A parameterized means of applying current injection into defined
 		Currently only single section neuronal models are supported, the neurite section is understood to be simply the soma.
+		out: optional C-contiguous array of len(I) samples of the model
+		dtype that receives the trace instead of a new array; on a cache
+		hit the cached trace is returned and out is left untouched.
 
 		"""
 
-		attrs = self.attrs
-		if attrs is None:
-			attrs = self.default_attrs
-
-		self.attrs = attrs
-		self.attrs['I'] = np.array(I)
-
-		self.attrs['celltype'] = int(round(self.attrs['celltype']))
-		everything = copy.copy(self.attrs)
-
-		if 'current_inj' in everything.keys():
-			everything.pop('current_inj',None)
-
-		if np.bool_(self.attrs['celltype'] <= 3):
-			everything.pop('celltype',None)
-			v = get_vm_one_two_three(**everything)
-		else:
-
-
-			if np.bool_(self.attrs['celltype'] == 4):
-				everything.pop('celltype',None)
-				v = get_vm_four(**everything)
-			if np.bool_(self.attrs['celltype'] == 5):
-				everything.pop('celltype',None)
-				v = get_vm_five(**everything)
-			if np.bool_(self.attrs['celltype'] == 6):
-				everything.pop('celltype',None)
-				if 'I' in self.attrs.keys():
-					everything.pop('I',None)
-				v = get_vm_six(self.attrs['I'],**everything)
-			if np.bool_(self.attrs['celltype'] == 7):
-				everything.pop('celltype',None)
-				v = get_vm_seven(**everything)
-
-		if 'I' in self.attrs.keys():
-			self.attrs.pop('I',None)
-
-		self.vM = AnalogSignal(v,
-							units=pq.mV,
-							sampling_period=0.25*pq.ms)
-
-		return self.vM
+		if self.attrs is None:
+			self.attrs = self.default_attrs
+		self.tstop = len(np.atleast_1d(I))*self.dt
+		self._run = metrics.begin('direct', len(np.atleast_1d(I))) if metrics.ENABLED else None
+		cached = self._lookup(('direct', np.atleast_1d(I)))
+		if cached is not None:
+			return cached
+		return self._simulate(I, out)
 
 
-	@cython.boundscheck(False)
-	@cython.wraparound(False)
-	def inject_square_current(self, current):
+	def inject_square_current(self, current, out=None):
 		"""
 		Inputs: current : a dictionary with exactly three items, whose keys are: 'amplitude', 'delay', 'duration'
 		Example: current = {'amplitude':float*pq.pA, 'delay':float*pq.ms, 'duration':float*pq.ms}}
 		where \'pq\' is a physical unit representation, implemented by casting float values to the quanitities \'type\'.
 		Description: A parameterized means of applying current injection into defined
 		Currently only single section neuronal models are supported, the neurite section is understood to be simply the soma.
+		out: receives the trace, see inject_direct_current.
 
 		"""
 
-		attrs = self.attrs
-		if attrs is None:
-			attrs = self.default_attrs
+		if self.attrs is None:
+			self.attrs = self.default_attrs
+		amplitude, delay, duration = self._square_pulse(current)
+		N, table = self._square_table(amplitude, delay, duration)
+		self._run = metrics.begin('square', N) if metrics.ENABLED else None
+		cached = self._lookup(('square', amplitude, delay, duration))
+		if cached is not None:
+			return cached
+		return self._simulate_table(table, N, out)
+
+	@staticmethod
+	def _square_pulse(current):
+		"""
+		(amplitude, delay, duration) as floats from a square current dict.
+		"""
+		missing = [key for key in ('amplitude', 'delay', 'duration') if key not in current]
+		if missing:
+			raise ValueError('a square current needs the keys amplitude, delay and duration, '
+							 'missing %s' % ', '.join(missing))
+		return float(current['amplitude']), float(current['delay']), float(current['duration'])
 
-		self.attrs = attrs
-		if 'delay' in current.keys() and 'duration' in current.keys():
-			square = True
-			c = current
-		if isinstance(c['amplitude'],type(pq)):
-			amplitude = float(c['amplitude'].simplified)
-			print(c['amplitude'],c['amplitude'].simplified)
-			duration = float(c['duration'])#.simplified)
-			delay = float(c['delay'])#.simplified)
-		else:
-			amplitude = float(c['amplitude'])
-			duration = float(c['duration'])
-			delay = float(c['delay'])
-		#print(amplitude,duration,delay)
+	def _square_table(self, amplitude, delay, duration):
+		"""
+		(N, breakpoint table) of a square pulse; sets tstop to its end.
+		"""
 		tMax = delay + duration #+ 200.0#*pq.ms
 
 		#self.set_stop_time(tMax*pq.ms)
 		tMax = self.tstop = float(tMax)
-		N = int(tMax/0.25)
-		Iext = np.zeros(N)
+		N = int(tMax/self.dt)
 		delay_ind = int((delay/tMax)*N)
 		duration_ind = int((duration/tMax)*N)
 
-		Iext[0:delay_ind-1] = 0.0
-		Iext[delay_ind:delay_ind+duration_ind-1] = amplitude
-		Iext[delay_ind+duration_ind::] = 0.0
-		#self.Iext = None
-		#self.Iext = Iext
-
-		self.attrs['I'] = Iext
-
-		everything = copy.copy(self.attrs)
-		#everything.update({'N':len(Iext)})
-
-		#everything.update({'Iext':Iext})
-		#everything.update({'start':delay_ind})
-		#everything.update({'stop':delay_ind+duration_ind})
-		#everything.update({'amp':amplitude})
-		if 'celltype' in everything.keys():
-			everything.pop('celltype',None)
+		# the pulse covers samples delay_ind to delay_ind+duration_ind-2, as
+		# the dense current did; the kernel evaluates it on the fly
+		table = segment_table([delay_ind], [delay_ind+duration_ind-1], [amplitude], [0.0], N,
+							  self.dtype)
+		return N, table
 
-		if 'current_inj' in everything.keys():
-			everything.pop('current_inj',None)
-		#import pdb; pdb.set_trace()
-
-		self.attrs['celltype'] = int(round(self.attrs['celltype']))
-		assert type(self.attrs['celltype']) is type(int())
-
-		if np.bool_(self.attrs['celltype'] <= 3):
-			everything.pop('celltype',None)
-			v = get_vm_one_two_three(**everything)
+	def inject_stimulus(self, stimulus, out=None):
+		"""
+		Inject a stimulus.Stimulus (steps, pulses, ramps and sums thereof)
+		without sampling it into an array; the run lasts stimulus.t_stop.
+		out: receives the trace, see inject_direct_current.
+		"""
+		if self.attrs is None:
+			self.attrs = self.default_attrs
+		self.tstop = stimulus.t_stop
+		N = stimulus.steps(self.dt)
+		table = stimulus.table(self.dt, self.dtype)
+		self._run = metrics.begin('stimulus', N) if metrics.ENABLED else None
+		cached = self._lookup(('stimulus', N) + table)
+		if cached is not None:
+			return cached
+		return self._simulate_table(table, N, out)
+
+	def run_trials(self, noise, n_trials, current, bin_width=5.0, first_trial=0, parallel=False):
+		"""
+		Repeat the model n_trials times under noise (a noise.Noise) added to
+		current: a square current dict as in inject_square_current, a
+		stimulus.Stimulus or an array sampled every dt. The trials share
+		the parameters and the current and run in one compiled call; see
+		noise.simulate_trials for the raster and PSTH returned.
+		"""
+		if self.attrs is None:
+			self.attrs = self.default_attrs
+		if isinstance(current, dict):
+			# the samples of inject_square_current's pulse
+			N, table = self._square_table(*self._square_pulse(current))
+			current = get_stimulus_samples(np.empty(N, dtype=self.dtype), *table)
+		elif isinstance(current, Stimulus):
+			self.tstop = current.t_stop
 		else:
-
-
-			if np.bool_(self.attrs['celltype'] == 4):
-				v = get_vm_four(**everything)
-			if np.bool_(self.attrs['celltype'] == 5):
-				v = get_vm_five(**everything)
-			if np.bool_(self.attrs['celltype'] == 6):
-				v = get_vm_six(**everything)
-			if np.bool_(self.attrs['celltype'] == 7):
-				v = get_vm_seven(**everything)
-
-
-		self.attrs
-
-		self.vM = AnalogSignal(v,
-							units=pq.mV,
-							sampling_period=0.25*pq.ms)
-
-		return self.vM
+			self.tstop = len(current)*self.dt
+		return simulate_trials(self.params.as_dict(), noise, n_trials, current,
+							   first_trial=first_trial, bin_width=bin_width, dt=self.dt,
+							   parallel=parallel, method=self.method, tol=self.tol,
+							   interpolate=self.interpolate, dtype=self.dtype)
 
 	def _backend_run(self):
 		results = {}
@@ -421,9 +536,7 @@ class IZHIModel():
 		else:
 			v = get_vm(self.attrs)
 
-		self.vM = AnalogSignal(v,
-							   units = voltage_units,
-							   sampling_period = 0.25*pq.ms)
+		self.vM = adapters.to_analogsignal(v, self.dt)
 		results['vm'] = self.vM.magnitude
 		results['t'] = self.vM.times
 		results['run_number'] = results.get('run_number',0) + 1
@@ -0,0 +1,1311 @@
+"""
+Compiled kernels for the Izhikevich models.
+
+This is the simulation core: it only needs numpy and numba and returns
+plain arrays, so it can be imported cheaply by short-lived worker
+processes. izhikevich.IZHIModel wraps it and converts the results to
+neo/quantities objects through adapters.py.
+
+The get_vm_* kernels simulate a single cell. The population kernels
+integrate many cells in one compiled call. Per-cell
+parameters are passed as flat arrays and the voltage traces are written
+into a (cells x steps) array, so a parameter sweep pays python dispatch
+once rather than once per cell. The get_spike* kernels skip the trace
+altogether and only record the spike indices, and get_pulse_responses
+only counts the spikes of square-pulse responses; get_rheobase_population
+bisects the pulse amplitude for every cell (see sweep.py).
+get_recording_population keeps a decimated window of v and/or u only
+(record_population).
+
+The per-step update in _step reproduces get_vm_one_two_three and
+get_vm_four ... get_vm_seven exactly, so a population run of a single
+cell gives the same trace as IZHIModel.
+"""
+import numpy as np
+import numba
+from numba import jit, prange
+from numba.typed import List
+
+PARAM_NAMES = ('C', 'k', 'vr', 'vt', 'vPeak', 'a', 'b', 'c', 'd', 'celltype')
+# order in which the kernels take the per-cell parameter arrays
+KERNEL_PARAMS = ('celltype',) + PARAM_NAMES[:-1]
+# precisions of the current and trace buffers, float32 is opt-in
+DTYPES = (np.float64, np.float32)
+
+
+# single-cell kernels, one per group of 2007 cell types
+
+@jit(nopython=True, cache=True)
+def get_vm_four(C=89.7960714285714,
+		 a=0.01, b=15, c=-60, d=10, k=1.6,
+		 vPeak=(86.364525297619-65.2261863636364),
+		  vr=-65.2261863636364, vt=-50,I=[],dt=0.25):
+		  #celltype=1, N=0,start=0,stop=0,amp=0,ramp=None):
+	tau = dt
+	N = len(I)
+
+	v = vr*np.ones(N)
+	u = np.zeros(N)
+
+	v[0] = vr
+	for i in range(N-1):
+		# forward Euler method
+		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
+		u[i+1] = u[i]+tau*a*(b*(v[i]-vr)-u[i]); # Calculate recovery variable
+		if v[i+1] > (vPeak - 0.1*u[i+1]):
+			v[i] = vPeak - 0.1*u[i+1]
+			v[i+1] = c + 0.04*u[i+1]; # Reset voltage
+			if (u[i]+d)<670:
+				u[i+1] = u[i+1]+d; # Reset recovery variable
+			else:
+				u[i+1] = 670;
+
+	return v
+
+@jit(nopython=True, cache=True)
+def get_vm_five(C=89.7960714285714,
+		 a=0.01, b=15, c=-60, d=10, k=1.6,
+		 vPeak=(86.364525297619-65.2261863636364),
+		  vr=-65.2261863636364, vt=-50,I=[],dt=0.25):#celltype=1,
+		  #N=0,start=0,stop=0,amp=0,ramp=None,pulse=None):
+	N = len(I)
+
+	tau= dt
+	v = vr*np.ones(N)
+	u = np.zeros(N)
+	v[0] = vr
+	for i in range(N-1):
+		# forward Euler method
+		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
+
+		#u[i+1]=u[i]+tau*a*(b*(v[i]-vr)-u[i]); # Calculate recovery variable
+		if v[i+1] < d:
+			u[i+1] = u[i] + tau*a*(0-u[i])
+		else:
+			u[i+1] = u[i] + tau*a*((0.025*(v[i]-d)**3)-u[i])
+
+
+		if v[i+1]>=vPeak:
+			v[i]=vPeak;
+			v[i+1]=c;
+
+	return v
+
+
+
+@jit(nopython=True, cache=True)
+def get_vm_six(I,C=89.7960714285714,
+		 a=0.01, b=15, c=-60, d=10, k=1.6,
+		 vPeak=(86.364525297619-65.2261863636364),
+		  vr=-65.2261863636364, vt=-50, dt=0.25):
+	tau= dt
+	N = len(I)
+
+	v = vr*np.ones(N)
+	u = np.zeros(N)
+	v[0] = vr
+	for i in range(N-1):
+	   # forward Euler method
+		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
+
+
+		if v[i+1] > -65:
+			b=0;
+		else:
+			b=15;
+		u[i+1]=u[i]+tau*a*(b*(v[i]-vr)-u[i]);
+
+		if v[i+1] > (vPeak + 0.1*u[i+1]):
+			v[i]= vPeak + 0.1*u[i+1];
+			v[i+1] = c-0.1*u[i+1]; # Reset voltage
+			u[i+1]=u[i+1]+d;
+
+	return v
+
+@jit(nopython=True, cache=True)
+def get_vm_seven(C=89.7960714285714,
+		 a=0.01, b=15, c=-60, d=10, k=1.6,
+		 vPeak=(86.364525297619-65.2261863636364),
+		  vr=-65.2261863636364, vt=-50,I=np.array([0]),dt=0.25):
+	tau= dt
+	N = len(I)
+
+	v = vr*np.ones(N)
+	u = np.zeros(N)
+	for i in range(N-1):
+
+		# forward Euler method
+		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
+
+
+		if v[i+1] > -65:
+			b=2;
+		else:
+			b=10;
+
+		u[i+1]=u[i]+tau*a*(b*(v[i]-vr)-u[i]);
+		if v[i+1]>=vPeak:
+			v[i]=vPeak;
+			v[i+1]=c;
+			u[i+1]=u[i+1]+d;  # reset u, except for FS cells
+
+
+	return v
+
+
+@jit(nopython=True, cache=True)
+def get_vm_one_two_three(C=89.7960714285714,
+		 a=0.01, b=15, c=-60, d=10, k=1.6,
+		 vPeak=(86.364525297619-65.2261863636364),
+		  vr=-65.2261863636364, vt=-50,I=np.array([0]),dt=0.25):
+	tau= dt
+	N = len(I)
+	v = vr*np.ones(N)
+	u = np.zeros(N)
+	for i in range(N-1):
+		# forward Euler method
+		v[i+1] = v[i] + tau * (k * (v[i] - vr) * (v[i] - vt) - u[i] + I[i]) / C
+		u[i+1] = u[i]+tau*a*(b*(v[i]-vr)-u[i]); # Calculate recovery variable
+
+		if v[i+1]>=vPeak:
+			v[i]=vPeak
+			v[i+1]=c
+			u[i+1]=u[i+1]+d  # reset u, except for FS cells
+	return v
+
+@jit(nopython=True, cache=True)
+def get_2003_vm(I,times,a=0.01, b=15, c=-60, d=10,vr = -70, dt=0.25):
+	u=b*vr
+	V = vr
+	tau = dt
+	N = len(I)
+	vv = np.zeros(N)
+	UU = np.zeros(N)
+
+	for i in range(N):
+		V = V + tau*(0.04*V**2+5*V+140-u+I[i]);
+		u = u + tau*a*(b*V-u);
+		if V > 30:
+			vv[i] = 30;
+			V = c;
+			u = u + d;
+		else:
+			vv[i]=V;
+		UU[i]=u;
+	return vv
+
+
+@jit(nopython=True, cache=True)
+def _step(celltype, v, u, I, dt, C, k, vr, vt, vPeak, a, b, c, d):
+	"""
+	Advance one cell by one forward Euler step.
+
+	Returns (v_next, u_next, v_now, spiked) where v_now is the value to
+	store for the current sample; on a spike the current sample is
+	replaced by the spike peak, as in get_vm_*.
+	"""
+	v_next = v + dt * (k * (v - vr) * (v - vt) - u + I) / C
+
+	if celltype == 5:
+		# FS: u is driven by a cubic above the threshold stored in d
+		if v_next < d:
+			u_next = u + dt*a*(0-u)
+		else:
+			u_next = u + dt*a*((0.025*(v-d)**3)-u)
+	else:
+		# TC and RTN switch b depending on the membrane potential
+		if celltype == 6:
+			if v_next > -65:
+				b = 0.0
+			else:
+				b = 15.0
+		elif celltype == 7:
+			if v_next > -65:
+				b = 2.0
+			else:
+				b = 10.0
+		u_next = u + dt*a*(b*(v-vr)-u)
+
+	if celltype == 4:
+		if v_next > (vPeak - 0.1*u_next):
+			v_now = vPeak - 0.1*u_next
+			v_next = c + 0.04*u_next
+			if (u+d) < 670:
+				u_next = u_next + d
+			else:
+				u_next = 670.0
+			return v_next, u_next, v_now, True
+	elif celltype == 6:
+		if v_next > (vPeak + 0.1*u_next):
+			v_now = vPeak + 0.1*u_next
+			v_next = c - 0.1*u_next
+			u_next = u_next + d
+			return v_next, u_next, v_now, True
+	elif v_next >= vPeak:
+		v_next = c
+		if celltype != 5:
+			u_next = u_next + d  # reset u, except for FS cells
+		return v_next, u_next, vPeak, True
+
+	return v_next, u_next, v, False
+
+
+@jit(nopython=True, cache=True)
+def _integrate_chunk(out, I, v, u, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Integrate one cell over len(out) samples starting from the state (v, u)
+	and return the state after the last sample.
+
+	TC and RTN derive b from v at every step, so (v, u) is the whole state
+	of every cell type.
+	"""
+	for i in range(out.shape[0]):
+		v, u, out[i], spiked = _step(celltype, v, u, I[i], dt,
+									 C, k, vr, vt, vPeak, a, b, c, d)
+	return v, u
+
+
+@jit(nopython=True, cache=True)
+def _integrate_cell(out, I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Integrate one cell from v=vr, u=0 over len(out) samples.
+	"""
+	N = out.shape[0]
+	if N == 0:
+		return
+	v, u = _integrate_chunk(out[:N-1], I, vr, 0.0, celltype,
+							C, k, vr, vt, vPeak, a, b, c, d, dt)
+	out[N-1] = v
+
+
+@jit(nopython=True, cache=True)
+def get_vm_cell(out, I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Trace of a single cell of any type from rest, written into out.
+
+	Gives the same trace as the get_vm_* kernel of the cell type, without
+	the python dispatch on celltype; the parameters are passed in
+	KERNEL_PARAMS order (params.CellParams.args).
+	"""
+	_integrate_cell(out, I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def _grow(buf, n):
+	"""
+	Return buf, doubled in size if it has no room for item n.
+	"""
+	if n < buf.shape[0]:
+		return buf
+	bigger = np.empty(2*buf.shape[0], dtype=buf.dtype)
+	bigger[:n] = buf[:n]
+	return bigger
+
+
+@jit(nopython=True, cache=True)
+def _spikes_cell(I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Integrate one cell without keeping the trace.
+
+	Returns the sample indices at which the spike peak would be drawn in
+	the trace, i.e. the reset branch of _step.
+	"""
+	spikes = np.empty(16, dtype=np.int64)
+	n = 0
+	v = vr
+	u = 0.0
+	for i in range(I.shape[0]-1):
+		v, u, v_now, spiked = _step(celltype, v, u, I[i], dt,
+									C, k, vr, vt, vPeak, a, b, c, d)
+		if spiked:
+			spikes = _grow(spikes, n)
+			spikes[n] = i
+			n += 1
+	return spikes[:n].copy()
+
+
+@jit(nopython=True, cache=True)
+def get_spike_indices(I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Spike sample indices of a single cell; memory is O(spikes).
+	"""
+	return _spikes_cell(I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt)
+
+
+@jit(nopython=True, cache=True)
+def _concatenate_spikes(spikes, empty):
+	"""
+	Pack a list of per-cell spike arrays into (indices, offsets), where the
+	spikes of cell n are indices[offsets[n]:offsets[n+1]]; empty is a
+	zero-length array of the element type.
+	"""
+	offsets = np.zeros(len(spikes)+1, dtype=np.int64)
+	for n in range(len(spikes)):
+		offsets[n+1] = offsets[n] + spikes[n].shape[0]
+	indices = np.empty(offsets[-1], dtype=empty.dtype)
+	for n in range(len(spikes)):
+		indices[offsets[n]:offsets[n+1]] = spikes[n]
+	return indices, offsets
+
+
+@jit(nopython=True, cache=True)
+def get_spikes_population(I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Spike indices of every cell, returned as (indices, offsets).
+	"""
+	spikes = List()
+	for n in range(I.shape[0]):
+		spikes.append(_spikes_cell(I[n], celltype[n], C[n], k[n], vr[n], vt[n],
+								   vPeak[n], a[n], b[n], c[n], d[n], dt))
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.int64))
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_spikes_population_parallel(I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Same as get_spikes_population, with the cells spread over numba's threads.
+	"""
+	spikes = List()
+	for n in range(I.shape[0]):
+		spikes.append(np.empty(0, dtype=np.int64))
+	for n in prange(I.shape[0]):
+		spikes[n] = _spikes_cell(I[n], celltype[n], C[n], k[n], vr[n], vt[n],
+								 vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.int64))
+
+
+@jit(nopython=True, cache=True)
+def get_vm_chunk(out, I, v, u, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Continue a single cell from the state (v, u) over the current chunk I.
+
+	out receives the trace of the chunk; the state after the chunk is
+	returned so that the next chunk can carry on from it. Feeding a long
+	current through consecutive chunks gives the same trace as one call
+	(the very last sample may additionally show a spike peak).
+	"""
+	return _integrate_chunk(out, I, v, u, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt)
+
+
+@jit(nopython=True, cache=True)
+def get_vm_population_chunk(out, I, v, u, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Population version of get_vm_chunk; the state arrays v and u are
+	updated in place.
+	"""
+	for n in range(out.shape[0]):
+		v[n], u[n] = _integrate_chunk(out[n], I[n], v[n], u[n], celltype[n],
+									  C[n], k[n], vr[n], vt[n], vPeak[n],
+									  a[n], b[n], c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def get_vm_population(out, I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Integrate every row of out with the parameters of the same index.
+
+	out : (cells, steps) array that receives the voltage traces
+	I : (cells, steps) current array; a broadcast view is fine
+	celltype, C ... d : per-cell parameter arrays
+	"""
+	for n in range(out.shape[0]):
+		_integrate_cell(out[n], I[n], celltype[n], C[n], k[n], vr[n], vt[n],
+						vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_vm_population_parallel(out, I, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Same as get_vm_population, with the cells spread over numba's threads.
+	"""
+	for n in prange(out.shape[0]):
+		_integrate_cell(out[n], I[n], celltype[n], C[n], k[n], vr[n], vt[n],
+						vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return out
+
+
+# integration methods selectable through the method argument
+EULER, EXP_EULER, RK4, ADAPTIVE = 0, 1, 2, 3
+METHODS = {'euler': EULER, 'exp_euler': EXP_EULER, 'rk4': RK4, 'adaptive': ADAPTIVE}
+
+
+@jit(nopython=True, cache=True)
+def _u_target(celltype, v, vr, b, d):
+	"""
+	Value u relaxes to at rate a while v is held fixed.
+	"""
+	if celltype == 5:
+		if v < d:
+			return 0.0
+		return 0.025*(v-d)**3
+	if celltype == 6:
+		if v > -65:
+			b = 0.0
+		else:
+			b = 15.0
+	elif celltype == 7:
+		if v > -65:
+			b = 2.0
+		else:
+			b = 10.0
+	return b*(v-vr)
+
+
+@jit(nopython=True, cache=True)
+def _rhs(celltype, v, u, I, C, k, vr, vt, a, b, d):
+	"""
+	Time derivatives (dv/dt, du/dt) of the 2007 model.
+	"""
+	return (k*(v-vr)*(v-vt) - u + I)/C, a*(_u_target(celltype, v, vr, b, d) - u)
+
+
+@jit(nopython=True, cache=True)
+def _threshold(celltype, u, vPeak):
+	"""
+	Spike threshold, which moves with u for LTS and TC cells.
+	"""
+	if celltype == 4:
+		return vPeak - 0.1*u
+	if celltype == 6:
+		return vPeak + 0.1*u
+	return vPeak
+
+
+@jit(nopython=True, cache=True)
+def _reset(celltype, u, c, d):
+	"""
+	State (v, u) right after a spike.
+	"""
+	if celltype == 4:
+		return c + 0.04*u, min(u + d, 670.0)
+	if celltype == 5:
+		return c, u
+	if celltype == 6:
+		return c - 0.1*u, u + d
+	return c, u + d
+
+
+@jit(nopython=True, cache=True)
+def _crossing(celltype, v0, u0, v1, u1, vPeak):
+	"""
+	Fraction of a step from (v0, u0) to (v1, u1) at which v meets the
+	threshold, by linear interpolation.
+	"""
+	f0 = v0 - _threshold(celltype, u0, vPeak)
+	f1 = v1 - _threshold(celltype, u1, vPeak)
+	if not f1 > f0 or f0 >= 0:
+		return 0.0
+	return min(f0/(f0-f1), 1.0)
+
+
+@jit(nopython=True, cache=True)
+def _exp_euler(celltype, v, u, I, dt, C, k, vr, vt, a, b, d):
+	"""
+	Forward Euler for v and the exact exponential decay of u towards its
+	target for the frozen v, which stays stable for large a*dt.
+	"""
+	v_next = v + dt*(k*(v-vr)*(v-vt) - u + I)/C
+	target = _u_target(celltype, v, vr, b, d)
+	return v_next, target + (u - target)*np.exp(-a*dt)
+
+
+@jit(nopython=True, cache=True)
+def _rk4(celltype, v, u, I, dt, C, k, vr, vt, vPeak, a, b, d):
+	"""
+	Classical Runge-Kutta step with I held over the step. The stage
+	voltages are clipped at the threshold so that the quadratic upswing
+	cannot overflow.
+	"""
+	peak = _threshold(celltype, u, vPeak)
+	k1v, k1u = _rhs(celltype, v, u, I, C, k, vr, vt, a, b, d)
+	k2v, k2u = _rhs(celltype, min(v + 0.5*dt*k1v, peak), u + 0.5*dt*k1u, I, C, k, vr, vt, a, b, d)
+	k3v, k3u = _rhs(celltype, min(v + 0.5*dt*k2v, peak), u + 0.5*dt*k2u, I, C, k, vr, vt, a, b, d)
+	k4v, k4u = _rhs(celltype, min(v + dt*k3v, peak), u + dt*k3u, I, C, k, vr, vt, a, b, d)
+	return (v + dt*(k1v + 2*k2v + 2*k3v + k4v)/6,
+			u + dt*(k1u + 2*k2u + 2*k3u + k4u)/6)
+
+
+@jit(nopython=True, cache=True)
+def _fixed_step(method, celltype, v, u, I, dt, C, k, vr, vt, vPeak, a, b, d):
+	"""
+	One step of a fixed-step method without the spike reset. Euler here
+	uses the continuous right-hand side, see _rhs.
+	"""
+	if method == EXP_EULER:
+		return _exp_euler(celltype, v, u, I, dt, C, k, vr, vt, a, b, d)
+	if method == RK4:
+		return _rk4(celltype, v, u, I, dt, C, k, vr, vt, vPeak, a, b, d)
+	dv, du = _rhs(celltype, v, u, I, C, k, vr, vt, a, b, d)
+	return v + dt*dv, u + dt*du
+
+
+@jit(nopython=True, cache=True)
+def _adaptive(celltype, v, u, I, dt, h, tol, C, k, vr, vt, vPeak, a, b, c, d):
+	"""
+	Integrate over one sample interval dt with Heun sub-steps whose size h
+	is controlled by their difference to an Euler step (tol in mV). A
+	spike is placed where the sub-step crosses the threshold and the reset
+	is applied there.
+
+	Returns (v, u, h, frac): the sub-step size to start the next interval
+	with, and the position of the first spike within the interval as a
+	fraction of dt (-1 if there is none).
+	"""
+	h_min = 1e-4*dt
+	t = 0.0
+	frac = -1.0
+	while t < dt:
+		step = min(h, dt - t)
+		peak = _threshold(celltype, u, vPeak)
+		k1v, k1u = _rhs(celltype, v, u, I, C, k, vr, vt, a, b, d)
+		v_euler = v + step*k1v
+		u_euler = u + step*k1u
+		k2v, k2u = _rhs(celltype, min(v_euler, peak), u_euler, I, C, k, vr, vt, a, b, d)
+		v_next = v + 0.5*step*(k1v + k2v)
+		u_next = u + 0.5*step*(k1u + k2u)
+		error = abs(v_next - v_euler)
+		if error > tol and step > h_min:
+			h = max(step*max(0.9*np.sqrt(tol/error), 0.2), h_min)
+			continue
+
+		if v_next >= _threshold(celltype, u_next, vPeak):
+			theta = _crossing(celltype, v, u, v_next, u_next, vPeak)
+			if frac < 0:
+				frac = (t + theta*step)/dt
+			v, u = _reset(celltype, u + theta*(u_next - u), c, d)
+			if theta > 0:
+				t += theta*step
+			else:
+				# the sub-step started at or above the threshold, e.g. an LTS
+				# reset with u at its cap: spike once and move on by the
+				# whole sub-step so that t always advances
+				t += step
+		else:
+			v = v_next
+			u = u_next
+			t += step
+		if error > 0:
+			h = step*min(0.9*np.sqrt(tol/error), 2.0)
+		else:
+			h = 2.0*step
+		h = min(max(h, h_min), dt)
+	return v, u, h, frac
+
+
+@jit(nopython=True, cache=True)
+def _advance(method, interpolate, celltype, v, u, I, dt, h, tol, C, k, vr, vt, vPeak, a, b, c, d):
+	"""
+	Advance one cell by one sample with the chosen method.
+
+	With interpolate the threshold crossing of a fixed-step method is
+	located within the step, the reset is applied at that time and the
+	rest of the step is integrated from the reset state.
+
+	Returns (v_next, u_next, v_now, h, frac) where v_now is the value to
+	store for the current sample, h the adaptive sub-step size and frac
+	the position of a spike within the step in units of dt, or -1.
+	"""
+	if method == EULER and not interpolate:
+		v_next, u_next, v_now, spiked = _step(celltype, v, u, I, dt,
+											  C, k, vr, vt, vPeak, a, b, c, d)
+		if spiked:
+			return v_next, u_next, v_now, h, 0.0
+		return v_next, u_next, v_now, h, -1.0
+	if method == ADAPTIVE:
+		v_next, u_next, h, frac = _adaptive(celltype, v, u, I, dt, h, tol,
+											C, k, vr, vt, vPeak, a, b, c, d)
+		if frac >= 0:
+			return v_next, u_next, _threshold(celltype, u, vPeak), h, frac
+		return v_next, u_next, v, h, frac
+
+	v_next, u_next = _fixed_step(method, celltype, v, u, I, dt, C, k, vr, vt, vPeak, a, b, d)
+	if v_next >= _threshold(celltype, u_next, vPeak):
+		v_now = _threshold(celltype, u_next, vPeak)
+		if not interpolate:
+			v_next, u_next = _reset(celltype, u_next, c, d)
+			return v_next, u_next, v_now, h, 0.0
+		theta = _crossing(celltype, v, u, v_next, u_next, vPeak)
+		v_next, u_next = _reset(celltype, u + theta*(u_next - u), c, d)
+		if theta < 1.0:
+			v_next, u_next = _fixed_step(method, celltype, v_next, u_next, I, (1.0-theta)*dt,
+										 C, k, vr, vt, vPeak, a, b, d)
+		return v_next, u_next, v_now, h, theta
+	return v_next, u_next, v, h, -1.0
+
+
+@jit(nopython=True, cache=True)
+def _vm_cell_method(out, I, method, interpolate, tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Integrate one cell from rest with the chosen method over len(out) samples.
+	"""
+	N = out.shape[0]
+	if N == 0:
+		return
+	v = vr
+	u = 0.0
+	h = dt
+	for i in range(N-1):
+		v, u, out[i], h, frac = _advance(method, interpolate, celltype, v, u, I[i], dt, h, tol,
+										 C, k, vr, vt, vPeak, a, b, c, d)
+	out[N-1] = v
+
+
+@jit(nopython=True, cache=True)
+def _spike_times_cell_method(I, method, interpolate, tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Spike times (ms) of one cell integrated from rest with the chosen method.
+	"""
+	times = np.empty(16, dtype=np.float64)
+	count = 0
+	v = vr
+	u = 0.0
+	h = dt
+	for i in range(I.shape[0]-1):
+		v, u, v_now, h, frac = _advance(method, interpolate, celltype, v, u, I[i], dt, h, tol,
+										C, k, vr, vt, vPeak, a, b, c, d)
+		if frac >= 0:
+			times = _grow(times, count)
+			times[count] = (i + frac)*dt
+			count += 1
+	return times[:count].copy()
+
+
+@jit(nopython=True, cache=True)
+def get_vm_population_method(out, I, method, interpolate, tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Like get_vm_population for any integration method in METHODS.
+	"""
+	for n in range(out.shape[0]):
+		_vm_cell_method(out[n], I[n], method, interpolate, tol, celltype[n], C[n], k[n],
+						vr[n], vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_vm_population_method_parallel(out, I, method, interpolate, tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	for n in prange(out.shape[0]):
+		_vm_cell_method(out[n], I[n], method, interpolate, tol, celltype[n], C[n], k[n],
+						vr[n], vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def get_spike_times_population_method(I, method, interpolate, tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Spike times (ms) of every cell for any integration method, returned as
+	(times, offsets) like get_spikes_population.
+	"""
+	spikes = List()
+	for n in range(I.shape[0]):
+		spikes.append(_spike_times_cell_method(I[n], method, interpolate, tol, celltype[n], C[n], k[n],
+											   vr[n], vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt))
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_spike_times_population_method_parallel(I, method, interpolate, tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	spikes = List()
+	for n in range(I.shape[0]):
+		spikes.append(np.empty(0, dtype=np.float64))
+	for n in prange(I.shape[0]):
+		spikes[n] = _spike_times_cell_method(I[n], method, interpolate, tol, celltype[n], C[n], k[n],
+											 vr[n], vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+@jit(nopython=True, cache=True)
+def _record_cell(v_out, u_out, I, method, interpolate, tol, start, every, count, celltype,
+				 C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Integrate one cell from rest and record the count samples start,
+	start+every, ... into v_out and u_out; an empty output is not recorded.
+
+	The samples are those of _vm_cell_method (the spike peak on the sample
+	of a spike, u at the start of the step); integration stops at the last
+	recorded sample.
+	"""
+	n_out = count
+	if n_out == 0:
+		return
+	record_v = v_out.shape[0] > 0
+	record_u = u_out.shape[0] > 0
+	N = I.shape[0]
+	last = start + (n_out-1)*every
+	v = vr
+	u = 0.0
+	h = dt
+	j = 0
+	wait = start
+	for i in range(min(last + 1, N - 1)):
+		v_next, u_next, v_now, h, frac = _advance(method, interpolate, celltype, v, u, I[i], dt, h,
+												  tol, C, k, vr, vt, vPeak, a, b, c, d)
+		if wait == 0:
+			if record_v:
+				v_out[j] = v_now
+			if record_u:
+				u_out[j] = u
+			j += 1
+			wait = every
+		wait -= 1
+		v = v_next
+		u = u_next
+	if j < n_out:
+		# the last sample of the run holds the final state
+		if record_v:
+			v_out[j] = v
+		if record_u:
+			u_out[j] = u
+
+
+@jit(nopython=True, cache=True)
+def get_recording_population(v_out, u_out, I, method, interpolate, tol, start, every, count,
+							 celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Record every cell of I into the rows of v_out and u_out, see
+	_record_cell; an output with zero columns is not recorded.
+	"""
+	for n in range(I.shape[0]):
+		_record_cell(v_out[n], u_out[n], I[n], method, interpolate, tol, start, every, count, celltype[n],
+					 C[n], k[n], vr[n], vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return v_out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_recording_population_parallel(v_out, u_out, I, method, interpolate, tol, start, every,
+									  count, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	for n in prange(I.shape[0]):
+		_record_cell(v_out[n], u_out[n], I[n], method, interpolate, tol, start, every, count, celltype[n],
+					 C[n], k[n], vr[n], vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return v_out
+
+
+@jit(nopython=True, cache=True)
+def _pulse_response(amplitude, start, stop, N, method, interpolate, tol, celltype,
+					C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Integrate one cell from rest over N samples of a square pulse that is
+	amplitude on samples start <= i < stop and 0 elsewhere, without
+	keeping the trace.
+
+	Returns (count, latency): the number of spikes from the pulse onset on,
+	and the time (ms) of the first of them after the onset, or nan.
+	"""
+	count = 0
+	latency = np.nan
+	v = vr
+	u = 0.0
+	h = dt
+	for i in range(N-1):
+		if i >= start and i < stop:
+			I = amplitude
+		else:
+			I = 0.0
+		v, u, v_now, h, frac = _advance(method, interpolate, celltype, v, u, I, dt, h, tol,
+										C, k, vr, vt, vPeak, a, b, c, d)
+		if frac >= 0 and i >= start:
+			if count == 0:
+				latency = (i - start + frac)*dt
+			count += 1
+	return count, latency
+
+
+@jit(nopython=True, cache=True)
+def get_pulse_responses(counts, latencies, amplitudes, start, stop, N, method, interpolate, tol,
+						celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Square-pulse response of every (cell, amplitude) pair.
+
+	counts, latencies : (cells, amplitudes) output arrays, see _pulse_response
+	amplitudes : pulse amplitudes (pA) applied to every cell
+	celltype, C ... d : per-cell parameter arrays
+	The current is generated inside the kernel, so no (cells, steps)
+	array is ever allocated.
+	"""
+	n_amplitudes = amplitudes.shape[0]
+	for lane in range(counts.shape[0]*n_amplitudes):
+		n = lane // n_amplitudes
+		j = lane % n_amplitudes
+		counts[n, j], latencies[n, j] = _pulse_response(amplitudes[j], start, stop, N, method,
+														interpolate, tol, celltype[n], C[n], k[n],
+														vr[n], vt[n], vPeak[n], a[n], b[n], c[n],
+														d[n], dt)
+	return counts, latencies
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_pulse_responses_parallel(counts, latencies, amplitudes, start, stop, N, method, interpolate, tol,
+								 celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Same as get_pulse_responses, with the (cell, amplitude) pairs spread
+	over numba's threads.
+	"""
+	n_amplitudes = amplitudes.shape[0]
+	for lane in prange(counts.shape[0]*n_amplitudes):
+		n = lane // n_amplitudes
+		j = lane % n_amplitudes
+		counts[n, j], latencies[n, j] = _pulse_response(amplitudes[j], start, stop, N, method,
+														interpolate, tol, celltype[n], C[n], k[n],
+														vr[n], vt[n], vPeak[n], a[n], b[n], c[n],
+														d[n], dt)
+	return counts, latencies
+
+
+@jit(nopython=True, cache=True)
+def _fires(amplitude, start, stop, N, method, interpolate, tol, celltype,
+		   C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Whether one cell spikes after the onset of the pulse of _pulse_response;
+	integration stops at the first such spike.
+	"""
+	v = vr
+	u = 0.0
+	h = dt
+	for i in range(N-1):
+		if i >= start and i < stop:
+			I = amplitude
+		else:
+			I = 0.0
+		v, u, v_now, h, frac = _advance(method, interpolate, celltype, v, u, I, dt, h, tol,
+										C, k, vr, vt, vPeak, a, b, c, d)
+		if frac >= 0 and i >= start:
+			return True
+	return False
+
+
+@jit(nopython=True, cache=True)
+def _rheobase(lo, hi, max_amplitude, resolution, start, stop, N, method, interpolate, tol,
+			  celltype, C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Smallest pulse amplitude (pA) that makes one cell spike, to within
+	resolution, by bisection between lo and hi.
+
+	hi is doubled (and lo moved up to it) until the cell fires, giving up
+	with nan beyond max_amplitude. If the cell already fires at lo, lo is
+	returned. Returns (amplitude, number of simulations).
+	"""
+	hi = min(hi, max_amplitude)
+	runs = 1
+	if _fires(lo, start, stop, N, method, interpolate, tol, celltype,
+			  C, k, vr, vt, vPeak, a, b, c, d, dt):
+		return lo, runs
+	while True:
+		runs += 1
+		if _fires(hi, start, stop, N, method, interpolate, tol, celltype,
+				  C, k, vr, vt, vPeak, a, b, c, d, dt):
+			break
+		if hi >= max_amplitude:
+			return np.nan, runs
+		lo = hi
+		hi = min(2.0*hi, max_amplitude)
+	while hi - lo > resolution:
+		mid = 0.5*(lo + hi)
+		runs += 1
+		if _fires(mid, start, stop, N, method, interpolate, tol, celltype,
+				  C, k, vr, vt, vPeak, a, b, c, d, dt):
+			hi = mid
+		else:
+			lo = mid
+	return hi, runs
+
+
+@jit(nopython=True, cache=True)
+def get_rheobase_population(out, runs, lo, hi, max_amplitude, resolution, start, stop, N, method,
+							interpolate, tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Rheobase of every cell, see _rheobase. out and runs receive the
+	amplitudes and the number of simulations per cell; lo and hi are
+	per-cell initial brackets. Every cell converges on its own.
+	"""
+	for n in range(out.shape[0]):
+		out[n], runs[n] = _rheobase(lo[n], hi[n], max_amplitude, resolution, start, stop, N,
+									method, interpolate, tol, celltype[n], C[n], k[n],
+									vr[n], vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_rheobase_population_parallel(out, runs, lo, hi, max_amplitude, resolution, start, stop, N, method,
+									 interpolate, tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Same as get_rheobase_population, with the cells spread over numba's
+	threads.
+	"""
+	for n in prange(out.shape[0]):
+		out[n], runs[n] = _rheobase(lo[n], hi[n], max_amplitude, resolution, start, stop, N,
+									method, interpolate, tol, celltype[n], C[n], k[n],
+									vr[n], vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return out
+
+
+def _run_threaded(kernel, args, kwargs, n_threads=None):
+	"""
+	Call kernel with numba's thread count temporarily set to n_threads.
+	"""
+	if n_threads is None:
+		return kernel(*args, **kwargs)
+	previous = numba.get_num_threads()
+	numba.set_num_threads(int(n_threads))
+	try:
+		return kernel(*args, **kwargs)
+	finally:
+		numba.set_num_threads(previous)
+
+
+def population_params(cells):
+	"""
+	Convert a population description to a dict of per-cell arrays.
+
+	cells may be a list of attrs dicts (e.g. list(reduced_cells.values())),
+	a dict mapping each name in PARAM_NAMES to a sequence or scalar, or a
+	structured array with these fields (params.population_array).
+	Scalars are broadcast over the population. celltype is rounded to
+	int, the other parameters are cast to float64.
+	"""
+	if isinstance(cells, np.ndarray) and cells.dtype.names:
+		columns = dict((name, cells[name]) for name in PARAM_NAMES)
+		n_cells = len(cells)
+	elif isinstance(cells, dict):
+		columns = cells
+		sizes = [np.size(columns[name]) for name in PARAM_NAMES if np.ndim(columns[name])]
+		n_cells = max(sizes) if sizes else 1
+	else:
+		cells = list(cells)
+		columns = dict((name, [cell[name] for cell in cells]) for name in PARAM_NAMES)
+		n_cells = len(cells)
+
+	params = {}
+	for name in PARAM_NAMES:
+		values = np.asarray(columns[name], dtype=np.float64)
+		if values.ndim == 0:
+			values = np.full(n_cells, float(values))
+		if values.shape != (n_cells,):
+			raise ValueError('parameter %s has shape %s, expected (%d,)'
+							 % (name, values.shape, n_cells))
+		if name == 'celltype':
+			values = np.rint(values).astype(np.int64)
+		params[name] = values
+	return params
+
+
+def _kernel_args(params):
+	return tuple(params[name] for name in KERNEL_PARAMS)
+
+
+def _check_dtype(dtype):
+	dtype = np.dtype(dtype)
+	if dtype not in DTYPES:
+		raise ValueError('unsupported dtype %s, expected float64 or float32' % dtype)
+	return dtype
+
+
+def population_current(I, n_cells, dtype=np.float64):
+	"""
+	Return I as a (cells, steps) array of dtype (float64 or float32).
+
+	A 1-D current is shared by all cells through a broadcast view, so no
+	per-cell copy is made.
+	"""
+	I = np.asarray(I, dtype=_check_dtype(dtype))
+	if I.ndim == 1:
+		I = np.broadcast_to(I, (n_cells, I.shape[0]))
+	if I.ndim != 2 or I.shape[0] != n_cells:
+		raise ValueError('current has shape %s, expected (steps,) or (%d, steps)'
+						 % (I.shape, n_cells))
+	return I
+
+
+class Workspace(object):
+	"""
+	Buffers reused across runs, so that repeated evaluations (e.g. in an
+	optimizer loop) do not allocate a new trace, current and state per
+	call.
+
+	Each named buffer grows to the largest size requested and is handed
+	out as a C-contiguous view, so runs of different lengths can share a
+	workspace. A view is overwritten by the next run that asks for the
+	same buffer: copy results that must outlive it. allocations counts
+	the buffers actually allocated.
+	"""
+
+	def __init__(self):
+		self._buffers = {}
+		self.allocations = 0
+
+	def buffer(self, name, shape, dtype=np.float64):
+		"""
+		An uninitialised array of shape and dtype backed by buffer name.
+		"""
+		dtype = np.dtype(dtype)
+		size = int(np.prod(shape))
+		buf = self._buffers.get(name)
+		if buf is None or buf.dtype != dtype or buf.shape[0] < size:
+			buf = np.empty(max(size, 1), dtype=dtype)
+			self._buffers[name] = buf
+			self.allocations += 1
+		return buf[:size].reshape(shape)
+
+	def state(self, n_cells):
+		"""
+		(v, u) float64 state arrays of n_cells.
+		"""
+		return self.buffer('v', n_cells), self.buffer('u', n_cells)
+
+	@property
+	def nbytes(self):
+		return sum(buf.nbytes for buf in self._buffers.values())
+
+
+def _out(out, shape, dtype, workspace):
+	"""
+	The trace buffer of a run: out after checking it, else a view of
+	workspace, else a new array.
+	"""
+	if out is None:
+		if workspace is None:
+			return np.empty(shape, dtype=dtype)
+		return workspace.buffer('trace', shape, dtype)
+	if out.shape != shape or out.dtype != dtype or not out.flags.c_contiguous:
+		raise ValueError('out must be a C-contiguous %s array of shape %s' % (dtype, shape))
+	return out
+
+
+def _method_code(method):
+	if method not in METHODS:
+		raise ValueError('unknown integration method %r, expected one of %s'
+						 % (method, ', '.join(sorted(METHODS))))
+	return METHODS[method]
+
+
+def simulate_population(cells, I, dt=0.25, parallel=False, n_threads=None,
+						method='euler', tol=0.01, interpolate=False, dtype=np.float64, out=None,
+						workspace=None):
+	"""
+	Simulate a population of 2007 Izhikevich cells in one compiled call.
+
+	Inputs: cells : see population_params
+			I : a shared current of shape (steps,) or one row per cell
+			parallel : integrate the cells on several threads
+			n_threads : number of threads for a parallel run, defaults to
+						numba's setting (NUMBA_NUM_THREADS)
+			method : 'euler' (the get_vm_* scheme), 'exp_euler', 'rk4' or
+					 'adaptive'
+			tol : sub-step error tolerance in mV for method='adaptive'
+			interpolate : apply the reset at the threshold crossing within
+						  the step rather than at the end of it; most
+						  effective together with method='rk4'
+			dtype : float64, or float32 to halve the memory of the current
+					and of the traces (see below)
+			out : a C-contiguous (cells, steps) array of dtype to write the
+				  traces into, e.g. a view of a shared memory block
+			workspace : a Workspace to take the trace buffer from when
+						out is not given
+	Returns a (cells, steps) array of membrane potentials in mV.
+
+	With dtype=float32 the current is read and the trace is stored in
+	single precision; parameters and the (v, u) state stay float64, so the
+	only error is the rounding of the current and of the stored samples.
+	benchmarks/validate_float32.py reports the resulting spike-time drift.
+	"""
+	code = _method_code(method)
+	params = population_params(cells)
+	n_cells = len(params['C'])
+	I = population_current(I, n_cells, dtype)
+	out = _out(out, I.shape, I.dtype, workspace)
+	if code != EULER or interpolate:
+		kernel = get_vm_population_method_parallel if parallel else get_vm_population_method
+		_run_threaded(kernel, (out, I, code, interpolate, tol) + _kernel_args(params) + (dt,),
+					  {}, n_threads if parallel else None)
+	elif parallel:
+		_run_threaded(get_vm_population_parallel, (out, I) + _kernel_args(params),
+					  {'dt': dt}, n_threads)
+	else:
+		get_vm_population(out, I, *_kernel_args(params), dt=dt)
+	return out
+
+
+def simulate_population_spikes(cells, I, dt=0.25, parallel=False, n_threads=None,
+							   method='euler', tol=0.01, interpolate=False, dtype=np.float64):
+	"""
+	Like simulate_population, but only the spike times are recorded.
+
+	Returns a list with one array of spike times (ms) per cell. No voltage
+	trace is allocated, so memory grows with the number of spikes rather
+	than with the number of steps. With interpolate or method='adaptive'
+	the spike times are the interpolated threshold crossings rather than
+	grid samples, so coarse steps keep sub-step timing. dtype is the
+	precision of the current; the spike times are always float64.
+	"""
+	code = _method_code(method)
+	params = population_params(cells)
+	n_cells = len(params['C'])
+	I = population_current(I, n_cells, dtype)
+	if code != EULER or interpolate:
+		kernel = (get_spike_times_population_method_parallel if parallel
+				  else get_spike_times_population_method)
+		times, offsets = _run_threaded(kernel, (I, code, interpolate, tol) + _kernel_args(params) + (dt,),
+									   {}, n_threads if parallel else None)
+		return [times[offsets[n]:offsets[n+1]] for n in range(n_cells)]
+	kernel = get_spikes_population_parallel if parallel else get_spikes_population
+	indices, offsets = _run_threaded(kernel, (I,) + _kernel_args(params),
+									 {'dt': dt}, n_threads if parallel else None)
+	times = indices*dt
+	return [times[offsets[n]:offsets[n+1]] for n in range(n_cells)]
+
+
+VARIABLES = ('v', 'u')
+
+
+def recording_window(steps, dt, every=1, t_start=0.0, t_stop=None):
+	"""
+	(start, count) of the samples recorded every `every` steps from
+	t_start (ms, rounded up to a sample) up to t_stop (excluded, defaults
+	to the end of a run of steps samples).
+	"""
+	every = int(every)
+	if every < 1:
+		raise ValueError('every must be a positive number of steps, not %d' % every)
+	start = max(int(np.ceil(t_start/dt - 1e-9)), 0)
+	stop = steps if t_stop is None else min(int(np.ceil(t_stop/dt - 1e-9)), steps)
+	return start, max(-(-(stop - start)//every), 0)
+
+
+def record_population(cells, I, every=1, variables=('v',), indices=None, t_start=0.0, t_stop=None,
+					  dt=0.25, parallel=False, n_threads=None, method='euler', tol=0.01,
+					  interpolate=False, dtype=np.float64):
+	"""
+	Simulate a population recording only part of the state.
+
+	Inputs: every : keep one sample in every steps
+			variables : any of VARIABLES, 'u' being the recovery variable
+			indices : the cells to simulate and record, defaults to all
+			t_start, t_stop : recording window in ms, see recording_window
+			other arguments : see simulate_population
+	Returns a dict with a (recorded cells, samples) array of dtype per
+	variable, the sample 'times' in ms and the cell 'indices'.
+
+	The selection is applied inside the compiled loop: only the recorded
+	samples are allocated and integration stops after the last of them.
+	With the defaults 'v' equals simulate_population's trace.
+	"""
+	code = _method_code(method)
+	for name in variables:
+		if name not in VARIABLES:
+			raise ValueError('unknown variable %r, expected some of %s' % (name, ', '.join(VARIABLES)))
+	params = population_params(cells)
+	n_cells = len(params['C'])
+	I = population_current(I, n_cells, dtype)
+	if indices is None:
+		indices = np.arange(n_cells)
+	else:
+		indices = np.arange(n_cells)[indices]
+		params = dict((name, values[indices]) for name, values in params.items())
+		I = I[indices]
+	start, count = recording_window(I.shape[1], dt, every, t_start, t_stop)
+	outputs = dict((name, np.empty((len(indices), count if name in variables else 0), dtype=I.dtype))
+				   for name in VARIABLES)
+	kernel = get_recording_population_parallel if parallel else get_recording_population
+	_run_threaded(kernel, (outputs['v'], outputs['u'], I, code, interpolate, tol, start, int(every), count)
+				  + _kernel_args(params) + (dt,), {}, n_threads if parallel else None)
+	result = dict((name, outputs[name]) for name in variables)
+	result['times'] = (start + int(every)*np.arange(count))*dt
+	result['indices'] = indices
+	return result
+
+
+def initial_state(params):
+	"""
+	Resting state (v=vr, u=0) of a population given as population_params.
+	"""
+	return params['vr'].copy(), np.zeros(len(params['vr']))
+
+
+def simulate_population_chunk(cells, I, state=None, dt=0.25, dtype=np.float64, out=None,
+							  workspace=None):
+	"""
+	Integrate one chunk of current for a population and return
+	(trace, state), where state=(v, u) is passed to the next call.
+
+	With state=None the cells start at rest. Memory use only depends on
+	the chunk length, so arbitrarily long stimuli can be streamed. The
+	state is always float64, so chunked float32 runs match unchunked ones.
+	out and workspace are as in simulate_population; with a workspace
+	the returned state arrays are its buffers as well, so a stream of
+	chunks allocates nothing after the first one.
+	"""
+	params = population_params(cells)
+	n_cells = len(params['C'])
+	I = population_current(I, n_cells, dtype)
+	if state is None:
+		state = initial_state(params)
+	if workspace is None:
+		v = np.array(state[0], dtype=np.float64)
+		u = np.array(state[1], dtype=np.float64)
+	else:
+		v, u = workspace.state(n_cells)
+		# state may be the workspace's own arrays from the previous chunk
+		v[...] = state[0]
+		u[...] = state[1]
+	out = _out(out, I.shape, I.dtype, workspace)
+	get_vm_population_chunk(out, I, v, u, *_kernel_args(params), dt=dt)
+	return out, (v, u)
+
+
+def precompile(dtypes=DTYPES, methods=tuple(METHODS), parallel=True):
+	"""
+	Compile the single-cell kernels, and the population kernels for shared
+	(broadcast) and per-cell currents of the given dtypes, every method
+	and every cell type. A single cell sharing a current is its own
+	signature (numba sees a contiguous read-only view), so it is compiled
+	as well.
+
+	The kernels are cached on disk (numba's cache=True), so only the first
+	process pays for compilation; later processes load the machine code,
+	and calling precompile at start-up moves that cost out of the first
+	simulation.
+	"""
+	attrs = {'C':100.0, 'a':0.03, 'b':-2.0, 'c':-50.0, 'd':100.0, 'k':0.7,
+			 'vPeak':35.0, 'vr':-60.0, 'vt':-40.0}
+	population = dict(attrs, celltype=np.arange(1, 8))
+	single = dict(attrs, celltype=1)
+	for dtype in dtypes:
+		I = np.zeros(4, dtype=dtype)
+		for kernel in (get_vm_one_two_three, get_vm_four, get_vm_five, get_vm_seven):
+			kernel(I=I, dt=0.25, **attrs)
+		get_vm_six(I, dt=0.25, **attrs)
+		get_2003_vm(I, I, a=0.02, b=0.2, c=-65.0, d=6.0, vr=-70.0, dt=0.25)
+		get_spike_indices(I, 1, 100.0, 0.7, -60.0, -40.0, 35.0, 0.03, -2.0, -50.0, 100.0, dt=0.25)
+		get_vm_chunk(np.empty(4, dtype=dtype), I, -60.0, 0.0, 1,
+					 100.0, 0.7, -60.0, -40.0, 35.0, 0.03, -2.0, -50.0, 100.0, dt=0.25)
+		get_vm_cell(np.empty(4, dtype=dtype), I, 1,
+					100.0, 0.7, -60.0, -40.0, 35.0, 0.03, -2.0, -50.0, 100.0, dt=0.25)
+		for cells, I in ((population, np.zeros(4, dtype=dtype)),
+						 (single, np.zeros(4, dtype=dtype)),
+						 (population, np.zeros((7, 4), dtype=dtype))):
+			for method in methods:
+				for parallel_run in set((False, parallel)):
+					simulate_population(cells, I, parallel=parallel_run, method=method, dtype=dtype)
+					simulate_population_spikes(cells, I, parallel=parallel_run, method=method,
+											   dtype=dtype)
+					record_population(cells, I, variables=VARIABLES, parallel=parallel_run,
+									  method=method, dtype=dtype)
+					if method != 'adaptive':
+						simulate_population(cells, I, parallel=parallel_run, method=method,
+											interpolate=True, dtype=dtype)
+						simulate_population_spikes(cells, I, parallel=parallel_run, method=method,
+												   interpolate=True, dtype=dtype)
+			simulate_population_chunk(cells, I, dtype=dtype)
+	params = population_params(population)
+	amplitudes = np.zeros(2)
+	counts = np.zeros((7, 2), dtype=np.int64)
+	latencies = np.empty((7, 2))
+	for kernel in set((get_pulse_responses, get_pulse_responses_parallel if parallel else get_pulse_responses)):
+		kernel(counts, latencies, amplitudes, 1, 3, 4, EULER, False, 0.01, *_kernel_args(params), dt=0.25)
+	out = np.empty(7)
+	runs = np.zeros(7, dtype=np.int64)
+	for kernel in set((get_rheobase_population,
+					   get_rheobase_population_parallel if parallel else get_rheobase_population)):
+		kernel(out, runs, np.zeros(7), np.ones(7), 2.0, 1.0, 1, 3, 4, EULER, False, 0.01,
+			   *_kernel_args(params), dt=0.25)
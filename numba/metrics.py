@@ -0,0 +1,343 @@
+"""
+Run metrics of the simulations, off by default.
+
+While enabled, every IZHIModel run leaves a RunRecord (compile time,
+integration time, steps, spikes, bytes allocated for the result and
+post-processing time) in records(), and is aggregated into counters and
+histograms labelled by the kind of run:
+
+	izhi_runs_total{kind,source}          runs, source is kernel or cache
+	izhi_steps_total{kind}                integration steps
+	izhi_spikes_total{kind}               spikes
+	izhi_compile_seconds_total{kind}      time spent compiling or loading
+										  kernels from numba's disk cache
+	izhi_integration_seconds{kind}        histogram of kernel time per run
+	izhi_postprocess_seconds{kind}        histogram of wrapping time per run
+	izhi_allocated_bytes{kind}            histogram of result sizes
+	izhi_block_seconds{block}             functions decorated with timer
+
+The registry can be dumped as JSON or in the Prometheus text format:
+
+	>>> metrics.enable()
+	>>> model.inject_square_current(current)
+	>>> metrics.records()[-1]
+	>>> metrics.dump_prometheus('izhi.prom')
+
+When disabled, the instrumented code only tests ENABLED.
+"""
+import bisect
+import collections
+import contextlib
+import json
+import time
+
+import numpy as np
+from numba.core import event
+
+ENABLED = False
+# number of RunRecords kept by records()
+MAX_RECORDS = 10000
+TIME_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 0.1, 1.0, 10.0)
+SIZE_BUCKETS = (1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+
+_HELP = {
+	'izhi_runs_total': 'Simulation runs',
+	'izhi_steps_total': 'Integration steps',
+	'izhi_spikes_total': 'Spikes produced',
+	'izhi_compile_seconds_total': 'Seconds spent compiling or loading kernels',
+	'izhi_integration_seconds': 'Kernel time per run',
+	'izhi_postprocess_seconds': 'Time spent wrapping the results of a run',
+	'izhi_allocated_bytes': 'Bytes allocated for the results of a run',
+	'izhi_block_seconds': 'Time per call of the functions decorated with timer',
+}
+
+
+class Histogram(object):
+	"""
+	Histogram over fixed upper bounds; cumulative() gives the Prometheus
+	style counts of values <= each bound.
+	"""
+	__slots__ = ('bounds', 'counts', 'sum', 'count')
+
+	def __init__(self, bounds):
+		self.bounds = tuple(bounds)
+		# the last bin counts the values above every bound
+		self.counts = [0]*(len(self.bounds) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(self.bounds, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def cumulative(self):
+		total = 0
+		counts = []
+		for count in self.counts[:-1]:
+			total += count
+			counts.append(total)
+		return counts
+
+	def as_dict(self):
+		return {'buckets': dict(zip([repr(b) for b in self.bounds], self.cumulative())),
+				'sum': self.sum, 'count': self.count}
+
+
+class Registry(object):
+	"""
+	Counters and histograms keyed by name and a sorted tuple of labels.
+	"""
+
+	def __init__(self):
+		self.clear()
+
+	def clear(self):
+		self.counters = collections.OrderedDict()
+		self.histograms = collections.OrderedDict()
+
+	def inc(self, name, value=1, **labels):
+		self.add((name, tuple(sorted(labels.items()))), value)
+
+	def observe(self, name, value, bounds=TIME_BUCKETS, **labels):
+		self.sample((name, tuple(sorted(labels.items()))), value, bounds)
+
+	def add(self, key, value):
+		"""inc with a ready (name, labels) key."""
+		self.counters[key] = self.counters.get(key, 0) + value
+
+	def sample(self, key, value, bounds=TIME_BUCKETS):
+		"""observe with a ready (name, labels) key."""
+		histogram = self.histograms.get(key)
+		if histogram is None:
+			histogram = self.histograms[key] = Histogram(bounds)
+		histogram.observe(value)
+
+	def as_dict(self):
+		counters = collections.defaultdict(list)
+		for (name, labels), value in self.counters.items():
+			counters[name].append({'labels': dict(labels), 'value': value})
+		histograms = collections.defaultdict(list)
+		for (name, labels), histogram in self.histograms.items():
+			entry = histogram.as_dict()
+			entry['labels'] = dict(labels)
+			histograms[name].append(entry)
+		return {'counters': dict(counters), 'histograms': dict(histograms)}
+
+	def to_prometheus(self):
+		lines = []
+		for name, series in _families(self.counters):
+			lines.append('# HELP %s %s' % (name, _HELP.get(name, name)))
+			lines.append('# TYPE %s counter' % name)
+			for labels, value in series:
+				lines.append('%s%s %r' % (name, _labels(labels), value))
+		for name, series in _families(self.histograms):
+			lines.append('# HELP %s %s' % (name, _HELP.get(name, name)))
+			lines.append('# TYPE %s histogram' % name)
+			for labels, histogram in series:
+				for bound, count in zip(histogram.bounds, histogram.cumulative()):
+					lines.append('%s_bucket%s %d' % (name, _labels(labels + (('le', repr(bound)),)), count))
+				lines.append('%s_bucket%s %d' % (name, _labels(labels + (('le', '+Inf'),)), histogram.count))
+				lines.append('%s_sum%s %r' % (name, _labels(labels), histogram.sum))
+				lines.append('%s_count%s %d' % (name, _labels(labels), histogram.count))
+		return '\n'.join(lines) + '\n'
+
+
+def _families(values):
+	"""[(name, [(labels, value)])], the series of each name together, as
+	the text format requires."""
+	families = collections.OrderedDict()
+	for (name, labels), value in values.items():
+		families.setdefault(name, []).append((labels, value))
+	return families.items()
+
+
+def _labels(labels):
+	if not labels:
+		return ''
+	return '{%s}' % ','.join('%s="%s"' % (key, value) for key, value in labels)
+
+
+REGISTRY = Registry()
+_records = collections.deque(maxlen=MAX_RECORDS)
+
+
+class _CompileClock(event.Listener):
+	"""
+	Total time spent holding numba's compiler lock, which covers
+	compilation as well as loading from numba's disk cache.
+	"""
+
+	def __init__(self):
+		self.total = 0.0
+		self._depth = 0
+
+	def on_start(self, ev):
+		if self._depth == 0:
+			self._t1 = time.perf_counter()
+		self._depth += 1
+
+	def on_end(self, ev):
+		self._depth -= 1
+		if self._depth == 0:
+			self.total += time.perf_counter() - self._t1
+
+
+_compile_clock = _CompileClock()
+
+
+def enable():
+	global ENABLED
+	if not ENABLED:
+		event.register('numba:compiler_lock', _compile_clock)
+		ENABLED = True
+
+
+def disable():
+	global ENABLED
+	if ENABLED:
+		event.unregister('numba:compiler_lock', _compile_clock)
+		ENABLED = False
+
+
+@contextlib.contextmanager
+def paused():
+	"""
+	Record nothing, compilation included, inside the with block, e.g.
+	for warm-up runs.
+	"""
+	was_enabled = ENABLED
+	disable()
+	try:
+		yield
+	finally:
+		if was_enabled:
+			enable()
+
+
+def reset():
+	"""Forget all records, counters and histograms."""
+	REGISTRY.clear()
+	_records.clear()
+
+
+def records():
+	"""The RunRecords of the last MAX_RECORDS runs, oldest first."""
+	return list(_records)
+
+
+class RunRecord(object):
+	"""
+	Measurements of one run; times in seconds, sizes in bytes.
+	"""
+	__slots__ = ('kind', 'source', 'steps', 'spikes', 'compile_time', 'integration_time',
+				 'postprocess_time', 'allocated_bytes')
+
+	def __init__(self, kind, steps=0):
+		self.kind = kind
+		self.source = 'kernel'
+		self.steps = steps
+		self.spikes = 0
+		self.compile_time = 0.0
+		self.integration_time = 0.0
+		self.postprocess_time = 0.0
+		self.allocated_bytes = 0
+
+	def integrate(self, kernel, *args, **kwargs):
+		"""
+		Call kernel, adding the time it took to integration_time, except
+		for the part spent compiling, which goes to compile_time.
+		"""
+		compiled = _compile_clock.total
+		t1 = time.perf_counter()
+		result = kernel(*args, **kwargs)
+		elapsed = time.perf_counter() - t1
+		compiling = _compile_clock.total - compiled
+		self.compile_time += compiling
+		self.integration_time += elapsed - compiling
+		return result
+
+	def postprocess(self, func, *args, **kwargs):
+		t1 = time.perf_counter()
+		result = func(*args, **kwargs)
+		self.postprocess_time += time.perf_counter() - t1
+		return result
+
+	def finish(self, result=None, spikes=None):
+		"""
+		Complete the record with the size of the result array and the
+		number of spikes, counted as upward zero crossings of result when
+		not given, and add it to the registry.
+		"""
+		if result is not None:
+			result = np.asarray(result)
+			self.allocated_bytes = result.nbytes
+			if spikes is None and result.ndim == 1 and result.shape[0] > 1:
+				spikes = int(np.count_nonzero((result[1:] >= 0.0) & (result[:-1] < 0.0)))
+		self.spikes = spikes or 0
+		_records.append(self)
+		labels = (('kind', self.kind),)
+		REGISTRY.add(('izhi_runs_total', labels + (('source', self.source),)), 1)
+		if self.source == 'cache':
+			return self
+		REGISTRY.add(('izhi_steps_total', labels), self.steps)
+		REGISTRY.add(('izhi_spikes_total', labels), self.spikes)
+		REGISTRY.add(('izhi_compile_seconds_total', labels), self.compile_time)
+		REGISTRY.sample(('izhi_integration_seconds', labels), self.integration_time)
+		REGISTRY.sample(('izhi_postprocess_seconds', labels), self.postprocess_time)
+		REGISTRY.sample(('izhi_allocated_bytes', labels), self.allocated_bytes, SIZE_BUCKETS)
+		return self
+
+	def as_dict(self):
+		return dict((name, getattr(self, name)) for name in self.__slots__)
+
+	def __repr__(self):
+		return 'RunRecord(%s)' % ', '.join('%s=%r' % (name, getattr(self, name))
+										   for name in self.__slots__)
+
+
+def begin(kind, steps=0):
+	"""A new RunRecord, or None when metrics are disabled."""
+	if not ENABLED:
+		return None
+	return RunRecord(kind, steps)
+
+
+def timer(func):
+	"""
+	Decorator recording the wall time of every call of func in the
+	izhi_block_seconds histogram while metrics are enabled.
+	"""
+	def inner(*args, **kwargs):
+		if not ENABLED:
+			return func(*args, **kwargs)
+		t1 = time.perf_counter()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			REGISTRY.observe('izhi_block_seconds', time.perf_counter() - t1, block=func.__name__)
+	inner.__name__ = func.__name__
+	inner.__doc__ = func.__doc__
+	return inner
+
+
+def to_json():
+	state = REGISTRY.as_dict()
+	state['records'] = [record.as_dict() for record in _records]
+	return json.dumps(state, indent=1, sort_keys=True)
+
+
+def dump_json(path):
+	with open(path, 'w') as f:
+		f.write(to_json())
+
+
+def to_prometheus():
+	return REGISTRY.to_prometheus()
+
+
+def dump_prometheus(path):
+	"""Write the registry in the Prometheus text exposition format, e.g.
+	for node_exporter's textfile collector."""
+	with open(path, 'w') as f:
+		f.write(to_prometheus())
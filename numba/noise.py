@@ -0,0 +1,527 @@
+"""
+Noisy input currents generated inside the kernels.
+
+A Noise is a sum of sources added to the current of every cell:
+Ornstein-Uhlenbeck current noise (ou) and Poisson synaptic bombardment
+(poisson), each input event adding weight pA to an exponentially
+decaying synaptic current. Sources add up with +, when their seeds
+agree; reseed the sum to pick other random streams.
+
+	>>> background = (ou(30.0, 5.0, mean=50.0) + poisson(800.0, 20.0, 2.0)).reseed(1)
+	>>> v = simulate_noise(cells, background, I, trial=3)
+
+The random numbers come from a counter-based generator: the draw of a
+source at sample i is a hash of (seed, cell, trial, source, i), so it
+does not depend on the order in which cells, trials or samples are
+integrated. Traces are bit-identical for any thread count, for shards of
+cells given their cell_ids, and for chunks of samples
+(simulate_noise_chunk), and no noise array is ever stored; sample
+returns the dense noise of a cell when one is needed.
+"""
+import numpy as np
+from numba import jit, prange
+from numba.typed import List
+
+from kernels import _advance, _grow, _concatenate_spikes, _kernel_args, _method_code, _out
+from kernels import _run_threaded, _check_dtype, population_params
+from stimulus import Stimulus
+
+OU = 0
+POISSON = 1
+
+# splitmix64 (Steele, Lea and Flood 2014): an increment and a finaliser
+# that make a good counter-based generator
+_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+# Poisson counts per sample are truncated here
+MAX_EVENTS = 1000
+
+
+class Noise(object):
+	"""
+	Sum of independent noise sources.
+
+	sources : sequence of (kind, p0, p1, p2), kind OU with (mean pA,
+			  sigma pA, tau ms) or POISSON with (rate Hz, weight pA,
+			  tau ms)
+	seed : non-negative int selecting the random streams
+	"""
+
+	def __init__(self, sources, seed=0):
+		self.sources = [(int(source[0]),) + tuple(float(x) for x in source[1:])
+						for source in sources]
+		if int(seed) < 0:
+			raise ValueError('seed must be non-negative')
+		self.seed = int(seed)
+
+	def __add__(self, other):
+		if not isinstance(other, Noise):
+			return NotImplemented
+		if other.seed != self.seed:
+			raise ValueError('cannot add noise of seeds %d and %d, reseed the sum instead'
+							 % (self.seed, other.seed))
+		return Noise(self.sources + other.sources, self.seed)
+
+	def __repr__(self):
+		return 'Noise(%d sources, seed=%d)' % (len(self.sources), self.seed)
+
+	def reseed(self, seed):
+		"""
+		The same sources with other random streams.
+		"""
+		return Noise(self.sources, seed)
+
+	def table(self, dt):
+		"""
+		(kinds, coefs) for the kernels at time step dt: per source, OU
+		rows hold (mean, decay, scale) of the exact update
+		x <- mean + (x - mean)*decay + scale*z, POISSON rows (expected
+		events per sample, weight, decay).
+		"""
+		kinds = np.array([source[0] for source in self.sources], dtype=np.int64)
+		coefs = np.empty((len(self.sources), 3))
+		for s, (kind, p0, p1, p2) in enumerate(self.sources):
+			decay = np.exp(-dt/p2)
+			if kind == OU:
+				coefs[s] = (p0, decay, p1*np.sqrt(1.0 - decay**2))
+			elif kind == POISSON:
+				coefs[s] = (p0*dt/1000.0, p1, decay)
+			else:
+				raise ValueError('unknown noise source kind %r' % kind)
+		return kinds, coefs
+
+	def initial_state(self):
+		"""
+		State of the sources at the start of a run: OU at its mean, no
+		synaptic current.
+		"""
+		return np.array([source[1] if source[0] == OU else 0.0 for source in self.sources])
+
+	def keys(self, cell_ids, trial=0):
+		"""
+		(lanes, sources) uint64 keys of the random streams of the cells
+		cell_ids in trial, a number or one trial per cell id.
+		"""
+		cell_ids = np.asarray(cell_ids, dtype=np.int64)
+		trials = np.ascontiguousarray(np.broadcast_to(np.asarray(trial, dtype=np.int64),
+													  cell_ids.shape))
+		if np.any(cell_ids < 0) or np.any(trials < 0):
+			raise ValueError('cell ids and trials must be non-negative')
+		keys = np.empty((len(cell_ids), len(self.sources)), dtype=np.uint64)
+		return _stream_keys(keys, self.seed, cell_ids, trials)
+
+	def sample(self, steps, dt, cell=0, trial=0, start=0):
+		"""
+		The dense noise (pA) of one cell over samples start..start+steps,
+		for plotting or to check a run against kernels.simulate_population.
+		"""
+		kinds, coefs = self.table(dt)
+		state = self.initial_state()
+		out = np.empty(int(steps))
+		return get_noise_samples(out, start, self.keys([cell], trial)[0], kinds, coefs, state)
+
+
+def ou(sigma, tau, mean=0.0, seed=0):
+	"""
+	Ornstein-Uhlenbeck current of stationary standard deviation sigma pA
+	and correlation time tau ms around mean pA.
+	"""
+	return Noise([(OU, mean, sigma, tau)], seed)
+
+
+def poisson(rate, weight, tau, seed=0):
+	"""
+	Poisson input events at rate Hz, each adding weight pA (negative for
+	inhibition) to a synaptic current decaying with time constant tau ms.
+	"""
+	return Noise([(POISSON, rate, weight, tau)], seed)
+
+
+@jit(nopython=True, cache=True)
+def _mix(z):
+	z = (z ^ (z >> np.uint64(30)))*_MIX1
+	z = (z ^ (z >> np.uint64(27)))*_MIX2
+	return z ^ (z >> np.uint64(31))
+
+
+@jit(nopython=True, cache=True)
+def _stream_keys(out, seed, cell_ids, trials):
+	for n in range(out.shape[0]):
+		key = _mix(np.uint64(seed) + _GAMMA)
+		key = _mix(key ^ _mix(np.uint64(cell_ids[n]) + _GAMMA))
+		key = _mix(key ^ _mix(np.uint64(trials[n]) + _GAMMA + _GAMMA))
+		for s in range(out.shape[1]):
+			out[n, s] = _mix(key + np.uint64(s + 1)*_GAMMA)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def _uniform(key, counter):
+	"""
+	Uniform draw in [0, 1) number counter of the stream key.
+	"""
+	x = _mix(key + np.uint64(counter + 1)*_GAMMA)
+	return np.float64(x >> np.uint64(11))*(1.0/9007199254740992.0)
+
+
+@jit(nopython=True, cache=True)
+def _normal(key, i):
+	"""
+	Standard normal draw of sample i (Box-Muller on draws 2i and 2i+1).
+	"""
+	r = np.sqrt(-2.0*np.log(1.0 - _uniform(key, 2*i)))
+	return r*np.cos(2.0*np.pi*_uniform(key, 2*i + 1))
+
+
+@jit(nopython=True, cache=True)
+def _events(lam, x):
+	"""
+	Poisson(lam) count by inversion of the uniform draw x.
+	"""
+	p = np.exp(-lam)
+	cdf = p
+	count = 0
+	while x > cdf and count < MAX_EVENTS:
+		count += 1
+		p *= lam/count
+		cdf += p
+	return count
+
+
+@jit(nopython=True, cache=True)
+def _noise(i, keys, kinds, coefs, state):
+	"""
+	Advance the sources of one cell to sample i and return their current.
+	"""
+	total = 0.0
+	for s in range(kinds.shape[0]):
+		if kinds[s] == OU:
+			mean = coefs[s, 0]
+			state[s] = mean + (state[s] - mean)*coefs[s, 1] + coefs[s, 2]*_normal(keys[s], i)
+		else:
+			state[s] = state[s]*coefs[s, 2] + coefs[s, 1]*_events(coefs[s, 0], _uniform(keys[s], i))
+		total += state[s]
+	return total
+
+
+@jit(nopython=True, cache=True)
+def get_noise_samples(out, start, keys, kinds, coefs, state):
+	"""
+	Noise of one cell over samples start..start+len(out); state is
+	advanced in place.
+	"""
+	for i in range(out.shape[0]):
+		out[i] = _noise(start + i, keys, kinds, coefs, state)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def _noisy_cell(out, I, n_steps, start, state, keys, kinds, coefs, method, interpolate, tol,
+				celltype, C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Integrate one cell over n_steps samples of I plus noise, from sample
+	start of the run. state holds (v, u, h, source states...) and is
+	advanced in place. The trace goes to out unless it is empty, as in
+	_vm_cell_method; the spike times (ms from the start of the run) are
+	returned.
+	"""
+	record = out.shape[0] > 0
+	times = np.empty(16, dtype=np.float64)
+	count = 0
+	sources = state[3:]
+	v = state[0]
+	u = state[1]
+	h = state[2]
+	for i in range(n_steps):
+		current = I[i] + _noise(start + i, keys, kinds, coefs, sources)
+		v, u, v_now, h, frac = _advance(method, interpolate, celltype, v, u, current, dt, h, tol,
+										C, k, vr, vt, vPeak, a, b, c, d)
+		if record:
+			out[i] = v_now
+		if frac >= 0:
+			times = _grow(times, count)
+			times[count] = (start + i + frac)*dt
+			count += 1
+	state[0] = v
+	state[1] = u
+	state[2] = h
+	return times[:count].copy()
+
+
+@jit(nopython=True, cache=True)
+def _noisy_run(out, I, N, state, keys, kinds, coefs, method, interpolate, tol,
+			   celltype, C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	A whole run of N samples from state: the last sample holds the final
+	v, as in _vm_cell_method.
+	"""
+	if N == 0:
+		return np.empty(0, dtype=np.float64)
+	times = _noisy_cell(out, I, N - 1, 0, state, keys, kinds, coefs, method, interpolate, tol,
+						celltype, C, k, vr, vt, vPeak, a, b, c, d, dt)
+	if out.shape[0] > 0:
+		out[N-1] = state[0]
+	return times
+
+
+@jit(nopython=True, cache=True)
+def get_vm_population_noise(out, I, state, keys, kinds, coefs, method, interpolate, tol,
+							celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Trace of every cell driven by I plus noise from the states in state
+	(one row of (v, u, h, source states...) per cell).
+	"""
+	for n in range(out.shape[0]):
+		_noisy_run(out[n], I[n], out.shape[1], state[n], keys[n], kinds, coefs, method,
+				   interpolate, tol, celltype[n], C[n], k[n], vr[n], vt[n], vPeak[n], a[n], b[n],
+				   c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_vm_population_noise_parallel(out, I, state, keys, kinds, coefs, method, interpolate, tol,
+									 celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	for n in prange(out.shape[0]):
+		_noisy_run(out[n], I[n], out.shape[1], state[n], keys[n], kinds, coefs, method,
+				   interpolate, tol, celltype[n], C[n], k[n], vr[n], vt[n], vPeak[n], a[n], b[n],
+				   c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def get_spike_times_population_noise(I, state, keys, kinds, coefs, method, interpolate, tol,
+									 celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Spike times of every cell driven by I plus noise, as (times, offsets).
+	"""
+	spikes = List()
+	for n in range(I.shape[0]):
+		spikes.append(_noisy_run(np.empty(0), I[n], I.shape[1], state[n], keys[n], kinds, coefs,
+								 method, interpolate, tol, celltype[n], C[n], k[n], vr[n], vt[n],
+								 vPeak[n], a[n], b[n], c[n], d[n], dt))
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_spike_times_population_noise_parallel(I, state, keys, kinds, coefs, method, interpolate,
+											  tol, celltype, C, k, vr, vt, vPeak, a, b, c, d,
+											  dt=0.25):
+	spikes = List()
+	for n in range(I.shape[0]):
+		spikes.append(np.empty(0, dtype=np.float64))
+	for n in prange(I.shape[0]):
+		spikes[n] = _noisy_run(np.empty(0), I[n], I.shape[1], state[n], keys[n], kinds, coefs,
+							   method, interpolate, tol, celltype[n], C[n], k[n], vr[n], vt[n],
+							   vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+@jit(nopython=True, cache=True)
+def get_vm_population_noise_chunk(out, I, start, state, keys, kinds, coefs, method, interpolate,
+								  tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Continue every cell over the chunk I, starting at sample start of the
+	run; state is advanced in place, as in kernels.get_vm_population_chunk.
+	"""
+	for n in range(out.shape[0]):
+		_noisy_cell(out[n], I[n], out.shape[1], start, state[n], keys[n], kinds, coefs, method,
+					interpolate, tol, celltype[n], C[n], k[n], vr[n], vt[n], vPeak[n], a[n], b[n],
+					c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def get_spike_times_trials(I, state, keys, n_trials, kinds, coefs, method, interpolate, tol,
+						   celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Spike times of n_trials lanes per cell, as (times, offsets): lane
+	l = n*n_trials + t runs cell n from state[n] with the noise keys[l],
+	the current I[n] and the parameters being shared by its trials.
+	"""
+	spikes = List()
+	lane_state = np.empty(state.shape[1])
+	for lane in range(keys.shape[0]):
+		n = lane // n_trials
+		lane_state[:] = state[n]
+		spikes.append(_noisy_run(np.empty(0), I[n], I.shape[1], lane_state, keys[lane], kinds,
+								 coefs, method, interpolate, tol, celltype[n], C[n], k[n], vr[n],
+								 vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt))
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_spike_times_trials_parallel(I, state, keys, n_trials, kinds, coefs, method, interpolate,
+									tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	spikes = List()
+	for lane in range(keys.shape[0]):
+		spikes.append(np.empty(0, dtype=np.float64))
+	for lane in prange(keys.shape[0]):
+		n = lane // n_trials
+		spikes[lane] = _noisy_run(np.empty(0), I[n], I.shape[1], state[n].copy(), keys[lane], kinds,
+								  coefs, method, interpolate, tol, celltype[n], C[n], k[n], vr[n],
+								  vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+def noise_current(I, n_cells, dtype=np.float64, steps=None):
+	"""
+	kernels.population_current, except that a number is a constant
+	baseline of steps samples, broadcast without allocating them.
+	"""
+	dtype = _check_dtype(dtype)
+	if np.ndim(I) == 0:
+		if steps is None:
+			raise ValueError('a constant current needs the number of steps')
+		return np.broadcast_to(np.asarray(I, dtype=dtype), (n_cells, int(steps)))
+	I = np.asarray(I, dtype=dtype)
+	if I.ndim == 1:
+		I = np.broadcast_to(I, (n_cells, I.shape[0]))
+	if I.ndim != 2 or I.shape[0] != n_cells:
+		raise ValueError('current has shape %s, expected (steps,) or (%d, steps)'
+						 % (I.shape, n_cells))
+	return I
+
+
+def initial_state(params, noise, dt=0.25):
+	"""
+	(cells, 3 + sources) state of a noisy run from rest: v=vr, u=0, the
+	adaptive step h=dt and the sources of noise.initial_state.
+	"""
+	n_cells = len(params['vr'])
+	state = np.empty((n_cells, 3 + len(noise.sources)))
+	state[:, 0] = params['vr']
+	state[:, 1] = 0.0
+	state[:, 2] = dt
+	state[:, 3:] = noise.initial_state()
+	return state
+
+
+def _setup(cells, noise, I, trial, cell_ids, dt, dtype, steps):
+	params = population_params(cells)
+	n_cells = len(params['C'])
+	if cell_ids is None:
+		cell_ids = np.arange(n_cells)
+	elif len(cell_ids) != n_cells:
+		raise ValueError('got %d cell ids for %d cells' % (len(cell_ids), n_cells))
+	if isinstance(I, Stimulus):
+		I = I.sample(dt, dtype)
+	I = noise_current(I, n_cells, dtype, steps)
+	kinds, coefs = noise.table(dt)
+	return params, I, noise.keys(cell_ids, trial), kinds, coefs
+
+
+def simulate_noise(cells, noise, I=0.0, trial=0, cell_ids=None, steps=None, dt=0.25,
+				   parallel=False, n_threads=None, method='euler', tol=0.01, interpolate=False,
+				   dtype=np.float64, out=None, workspace=None):
+	"""
+	kernels.simulate_population with noise added to the current of every
+	cell inside the kernel.
+
+	Inputs: noise : a Noise
+			I : current as in simulate_population, a constant in pA
+				for steps samples, or a stimulus.Stimulus
+			trial : non-negative int; each trial of a cell draws
+					independent noise
+			cell_ids : the indices of the cells in the random streams,
+					   default 0..cells-1; pass the global indices when a
+					   population is simulated in shards
+	The other arguments are those of simulate_population. Returns a
+	(cells, steps) array of membrane potentials in mV.
+	"""
+	code = _method_code(method)
+	params, I, keys, kinds, coefs = _setup(cells, noise, I, trial, cell_ids, dt, dtype, steps)
+	out = _out(out, I.shape, I.dtype, workspace)
+	state = initial_state(params, noise, dt)
+	kernel = get_vm_population_noise_parallel if parallel else get_vm_population_noise
+	_run_threaded(kernel, (out, I, state, keys, kinds, coefs, code, interpolate, tol)
+				  + _kernel_args(params) + (dt,), {}, n_threads if parallel else None)
+	return out
+
+
+def simulate_noise_spikes(cells, noise, I=0.0, trial=0, cell_ids=None, steps=None, dt=0.25,
+						  parallel=False, n_threads=None, method='euler', tol=0.01,
+						  interpolate=False, dtype=np.float64):
+	"""
+	Like simulate_noise, but returns a list with one array of spike times
+	(ms) per cell, as simulate_population_spikes.
+	"""
+	code = _method_code(method)
+	params, I, keys, kinds, coefs = _setup(cells, noise, I, trial, cell_ids, dt, dtype, steps)
+	state = initial_state(params, noise, dt)
+	kernel = (get_spike_times_population_noise_parallel if parallel
+			  else get_spike_times_population_noise)
+	times, offsets = _run_threaded(kernel, (I, state, keys, kinds, coefs, code, interpolate, tol)
+								   + _kernel_args(params) + (dt,), {}, n_threads if parallel else None)
+	return [times[offsets[n]:offsets[n+1]] for n in range(len(offsets) - 1)]
+
+
+def simulate_noise_chunk(cells, noise, I, state=None, trial=0, cell_ids=None, dt=0.25,
+						 method='euler', tol=0.01, interpolate=False, dtype=np.float64, out=None,
+						 workspace=None):
+	"""
+	kernels.simulate_population_chunk with noise: integrate the chunk I
+	and return (trace, state), state=(sample, array) being passed to the
+	next call. The noise of sample i is the same however the run is cut,
+	so the chunks of a stream join up into the trace of simulate_noise
+	(the very last sample may additionally show a spike peak).
+	"""
+	code = _method_code(method)
+	params, I, keys, kinds, coefs = _setup(cells, noise, I, trial, cell_ids, dt, dtype, None)
+	if state is None:
+		state = (0, initial_state(params, noise, dt))
+	start, values = state
+	values = np.array(values, dtype=np.float64)
+	out = _out(out, I.shape, I.dtype, workspace)
+	get_vm_population_noise_chunk(out, I, start, values, keys, kinds, coefs, code, interpolate,
+								  tol, *_kernel_args(params), dt=dt)
+	return out, (start + I.shape[1], values)
+
+
+def simulate_trials(cells, noise, n_trials, I=0.0, steps=None, first_trial=0, cell_ids=None,
+					bin_width=5.0, dt=0.25, parallel=False, n_threads=None, method='euler',
+					tol=0.01, interpolate=False, dtype=np.float64):
+	"""
+	Repeat every cell over n_trials trials that share its parameters and
+	current and differ only in their noise, in one compiled call.
+
+	Trial t draws the noise of trial first_trial + t of simulate_noise,
+	so an ensemble can be extended or split across calls. The other
+	arguments are those of simulate_noise_spikes. Returns a dict with
+		times, offsets : the raster; trial t of cell n spiked at
+						 times[offsets[l]:offsets[l+1]], l = n*n_trials + t
+		psth : (cells, bins) trial-averaged firing rate in Hz
+		bins : (bins + 1,) bin edges in ms
+	"""
+	n_trials = int(n_trials)
+	if n_trials < 1:
+		raise ValueError('n_trials must be positive')
+	code = _method_code(method)
+	params, I, keys, kinds, coefs = _setup(cells, noise, I, 0, cell_ids, dt, dtype, steps)
+	n_cells = len(params['C'])
+	if cell_ids is None:
+		cell_ids = np.arange(n_cells)
+	keys = noise.keys(np.repeat(cell_ids, n_trials),
+					  np.tile(np.arange(first_trial, first_trial + n_trials), n_cells))
+	state = initial_state(params, noise, dt)
+	kernel = get_spike_times_trials_parallel if parallel else get_spike_times_trials
+	times, offsets = _run_threaded(kernel, (I, state, keys, n_trials, kinds, coefs, code,
+											interpolate, tol) + _kernel_args(params) + (dt,),
+								   {}, n_threads if parallel else None)
+	t_stop = I.shape[1]*dt
+	bins = np.arange(0.0, t_stop + bin_width, bin_width)
+	bins = bins[bins < t_stop + 0.5*bin_width]
+	bins[-1] = t_stop
+	psth = np.empty((n_cells, len(bins) - 1))
+	for n in range(n_cells):
+		spikes = times[offsets[n*n_trials]:offsets[(n+1)*n_trials]]
+		psth[n] = np.histogram(spikes, bins)[0]/(n_trials*np.diff(bins)/1000.0)
+	return {'times': times, 'offsets': offsets, 'psth': psth, 'bins': bins}
+
+
+def trial_spikes(result, n_trials, cell=0):
+	"""
+	The spike times of every trial of cell in a simulate_trials result.
+	"""
+	times, offsets = result['times'], result['offsets']
+	return [times[offsets[l]:offsets[l+1]] for l in range(cell*n_trials, (cell+1)*n_trials)]
@@ -0,0 +1,92 @@
+"""
+Validated parameter records of the 2007 model.
+
+CellParams holds the parameters of one cell in __slots__, checked and
+converted once, with the argument tuple of the compiled kernels ready
+to be splatted (params.args). For populations, population_array builds
+a numpy structured array of dtype PARAMS_DTYPE, which
+kernels.population_params accepts as it is.
+
+	>>> params = CellParams.from_attrs(reduced_cells['RS'])
+	>>> get_vm_cell(out, I, *params.args, dt=0.25)
+"""
+import numpy as np
+
+from kernels import PARAM_NAMES, KERNEL_PARAMS, population_params
+
+PARAMS_DTYPE = np.dtype([(name, np.int64 if name == 'celltype' else np.float64)
+						 for name in PARAM_NAMES])
+# celltype codes of the 2007 model (see utils.type2007)
+CELLTYPES = (1, 2, 3, 4, 5, 6, 7)
+
+
+def _check(name, value):
+	if not np.all(np.isfinite(value)):
+		raise ValueError('parameter %s must be finite, got %r' % (name, value))
+	if name == 'C' and np.any(np.asarray(value) <= 0):
+		raise ValueError('capacitance C must be positive, got %r' % (value,))
+	if name == 'celltype' and not np.all(np.isin(value, CELLTYPES)):
+		raise ValueError('celltype must be one of %s, got %r' % (CELLTYPES, value))
+
+
+class CellParams(object):
+	"""
+	Parameters of a single cell: floats, except celltype which is an int.
+	"""
+	__slots__ = PARAM_NAMES + ('args',)
+
+	def __init__(self, C, k, vr, vt, vPeak, a, b, c, d, celltype):
+		values = (C, k, vr, vt, vPeak, a, b, c, d, celltype)
+		for name, value in zip(PARAM_NAMES, values):
+			value = int(round(value)) if name == 'celltype' else float(value)
+			_check(name, value)
+			setattr(self, name, value)
+		# argument order of the compiled kernels
+		self.args = tuple(getattr(self, name) for name in KERNEL_PARAMS)
+
+	@classmethod
+	def from_attrs(cls, attrs):
+		"""
+		Record of an attrs dict; keys other than PARAM_NAMES are ignored.
+		"""
+		missing = [name for name in PARAM_NAMES if name not in attrs]
+		if missing:
+			raise ValueError('missing parameters: %s' % ', '.join(missing))
+		return cls(*[attrs[name] for name in PARAM_NAMES])
+
+	def as_dict(self):
+		return dict((name, getattr(self, name)) for name in PARAM_NAMES)
+
+	def __eq__(self, other):
+		return isinstance(other, CellParams) and self.args == other.args
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __hash__(self):
+		return hash(self.args)
+
+	def __repr__(self):
+		return 'CellParams(%s)' % ', '.join('%s=%r' % (name, getattr(self, name))
+											for name in PARAM_NAMES)
+
+
+def population_array(cells):
+	"""
+	Validated structured array of dtype PARAMS_DTYPE, one row per cell.
+
+	cells may be a list of attrs dicts or CellParams, or anything accepted
+	by kernels.population_params.
+	"""
+	if isinstance(cells, np.ndarray) and cells.dtype == PARAMS_DTYPE:
+		array = cells
+	else:
+		if isinstance(cells, (list, tuple)):
+			cells = [cell.as_dict() if isinstance(cell, CellParams) else cell for cell in cells]
+		columns = population_params(cells)
+		array = np.empty(len(columns['C']), dtype=PARAMS_DTYPE)
+		for name in PARAM_NAMES:
+			array[name] = columns[name]
+	for name in PARAM_NAMES:
+		_check(name, array[name])
+	return array
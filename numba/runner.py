@@ -0,0 +1,296 @@
+"""
+Population runs sharded across a process pool.
+
+For populations or sweeps too large for one process, run splits the
+parameter sets (see kernels.population_params: a list of
+reduced_cells-style dicts, a dict of columns or a structured array) into
+shards of shard_size cells and integrates them in worker processes.
+The current and the results live in shared buffers that every worker
+maps, so workers write their traces or spike times in place and only
+send back the index of the finished shard; no large array is pickled.
+
+Without a directory the buffers are multiprocessing.shared_memory
+blocks, released when the run returns. With a directory they are .npy
+files mapped with np.memmap, and every finished shard is appended to a
+journal, so a run interrupted by a crash (of a worker or of the parent)
+is resumed by calling run again with the same arguments: shards already
+in the journal are not simulated again.
+
+	>>> cells = sweep.parameter_grid(reduced_cells['RS'], a=np.linspace(0.01, 0.1, 100),
+	...                              d=np.linspace(10, 200, 100))
+	>>> v = run(cells, I, processes=8, directory='/scratch/rs-grid', progress=print_progress)
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+
+from multiprocessing import shared_memory
+import numpy as np
+
+from cache import _canonical
+from kernels import PARAM_NAMES, population_params, population_current, _check_dtype
+from kernels import simulate_population, simulate_population_spikes
+
+RECORDS = ('vm', 'spikes')
+# shards per process when shard_size is not given, for load balancing and
+# a smooth progress report
+SHARDS_PER_PROCESS = 4
+
+
+def print_progress(done, total, stream=None):
+	"""
+	Progress callback writing 'done/total cells' on one line of stderr.
+	"""
+	stream = sys.stderr if stream is None else stream
+	stream.write('\r%d/%d cells' % (done, total))
+	if done >= total:
+		stream.write('\n')
+	stream.flush()
+
+
+class Progress(object):
+	"""
+	Counter calling callback(done, total) on every update; a stand-in for
+	a tqdm bar in scripts.
+	"""
+
+	def __init__(self, total, callback=print_progress):
+		self.total = total
+		self.done = 0
+		self.callback = callback
+
+	def update(self, n=1):
+		self.done += n
+		if self.callback is not None:
+			self.callback(self.done, self.total)
+
+
+def _shards(n_cells, shard_size):
+	return [(lo, min(lo + shard_size, n_cells)) for lo in range(0, n_cells, shard_size)]
+
+
+def _run_key(params, current, settings):
+	description = (tuple((name, _canonical(params[name])) for name in PARAM_NAMES),
+				   _canonical(current), tuple(sorted(settings.items())))
+	return hashlib.sha1(repr(description).encode('utf-8')).hexdigest()
+
+
+class _Buffers(object):
+	"""
+	Named arrays backed by shared memory blocks, or by .npy files in
+	directory. spec() describes them to the workers, which open() the same
+	memory.
+	"""
+
+	def __init__(self, directory=None):
+		self.directory = directory
+		self.arrays = {}
+		self._blocks = []
+
+	def create(self, name, shape, dtype, resume=False):
+		dtype = np.dtype(dtype)
+		if self.directory is None:
+			size = max(int(np.prod(shape))*dtype.itemsize, 1)
+			block = shared_memory.SharedMemory(create=True, size=size)
+			self._blocks.append(block)
+			array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+			self.arrays[name] = (array, ('shm', block.name, shape, dtype.str))
+			return array
+		path = os.path.join(self.directory, name + '.npy')
+		mode = 'r+' if resume else 'w+'
+		array = np.lib.format.open_memmap(path, mode=mode, dtype=dtype, shape=shape)
+		self.arrays[name] = (array, ('npy', path, shape, dtype.str))
+		return array
+
+	def spec(self):
+		return dict((name, spec) for name, (_, spec) in self.arrays.items())
+
+	@staticmethod
+	def open(spec, handles):
+		kind, location, shape, dtype = spec
+		if kind == 'npy':
+			return np.load(location, mmap_mode='r+')
+		block = shared_memory.SharedMemory(name=location)
+		handles.append(block)
+		return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+	def release(self):
+		self.arrays = {}
+		for block in self._blocks:
+			block.close()
+			block.unlink()
+		self._blocks = []
+
+
+# state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(params, specs, shared_current, settings):
+	_worker.clear()
+	handles = []
+	_worker['arrays'] = dict((name, _Buffers.open(spec, handles)) for name, spec in specs.items())
+	_worker['handles'] = handles
+	_worker['params'] = params
+	_worker['shared_current'] = shared_current
+	_worker['settings'] = settings
+
+
+def _run_shard(index, lo, hi):
+	"""
+	Integrate cells lo:hi into the shared buffers and return index once
+	the results are in memory (and flushed to disk for .npy buffers).
+	"""
+	arrays = _worker['arrays']
+	settings = dict(_worker['settings'])
+	record = settings.pop('record')
+	cells = dict((name, _worker['params'][name][lo:hi]) for name in PARAM_NAMES)
+	I = arrays['current'] if _worker['shared_current'] else arrays['current'][lo:hi]
+	if record == 'vm':
+		trace = arrays['trace']
+		simulate_population(cells, I, out=trace[lo:hi], **settings)
+		written = (trace,)
+	else:
+		times, counts = arrays['times'], arrays['counts']
+		for n, train in enumerate(simulate_population_spikes(cells, I, **settings)):
+			k = min(len(train), times.shape[1])
+			times[lo + n, :k] = train[:k]
+			counts[lo + n] = len(train)
+		written = (times, counts)
+	for array in written:
+		if isinstance(array, np.memmap):
+			array.flush()
+	return index
+
+
+def _read_journal(path):
+	done = set()
+	if os.path.exists(path):
+		with open(path) as f:
+			for line in f:
+				# a crash can leave the last line incomplete
+				if line.endswith('\n'):
+					done.add(int(line))
+	return done
+
+
+def run(cells, I, record='vm', dt=0.25, method='euler', tol=0.01, interpolate=False,
+		dtype=np.float64, processes=None, shard_size=None, max_spikes=None, directory=None,
+		progress=None):
+	"""
+	Simulate a population in a pool of worker processes.
+
+	Inputs: cells : parameter sets, see kernels.population_params
+			I : a shared current of shape (steps,) or one row per cell
+			record : 'vm' for the membrane potentials, 'spikes' for the
+					 spike times only
+			dt, method, tol, interpolate, dtype : see
+							  kernels.simulate_population
+			processes : number of worker processes, defaults to the
+						number of CPUs
+			shard_size : cells per task, defaults to an even split in
+						 SHARDS_PER_PROCESS tasks per process
+			max_spikes : room for spike times per cell with
+						 record='spikes', defaults to one per ms
+			directory : keep the buffers and the journal there, so an
+						interrupted run can be resumed
+			progress : callback(done, total) called with the number of
+					   finished cells, e.g. print_progress
+	Returns a (cells, steps) array of membrane potentials (a read-only
+	np.memmap of directory/trace.npy with a directory), or with
+	record='spikes' a list of spike-time arrays as
+	kernels.simulate_population_spikes. Workers run the serial kernels,
+	the parallelism is the pool's. They are started with the 'spawn'
+	method, which is safe after numba's threads are running, so a script
+	that calls run must guard its main code with
+	if __name__ == '__main__'.
+	"""
+	if record not in RECORDS:
+		raise ValueError('unknown record %r, expected one of %s' % (record, ', '.join(RECORDS)))
+	dtype = _check_dtype(dtype)
+	params = population_params(cells)
+	n_cells = len(params['C'])
+	I = population_current(I, n_cells, dtype)
+	steps = I.shape[1]
+	# a current shared by all cells is a broadcast view, share one row
+	shared_current = n_cells > 1 and I.strides[0] == 0
+	current = I[0] if shared_current else I
+	if processes is None:
+		processes = os.cpu_count() or 1
+	if max_spikes is None:
+		max_spikes = int(steps*dt) + 1
+	settings = {'record': record, 'dt': float(dt), 'method': method, 'tol': float(tol),
+				'interpolate': bool(interpolate), 'dtype': dtype.str}
+
+	done = set()
+	journal = None
+	if directory is not None:
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		manifest_path = os.path.join(directory, 'run.json')
+		journal = os.path.join(directory, 'journal')
+		key = _run_key(params, current, settings)
+		if os.path.exists(manifest_path):
+			with open(manifest_path) as f:
+				manifest = json.load(f)
+			if manifest['key'] != key:
+				raise ValueError('%s holds a different run, use a new directory' % directory)
+			shard_size, max_spikes = manifest['shard_size'], manifest['max_spikes']
+			done = _read_journal(journal)
+	if shard_size is None:
+		shard_size = -(-n_cells//(processes*SHARDS_PER_PROCESS))
+	shards = _shards(n_cells, max(int(shard_size), 1))
+
+	buffers = _Buffers(directory)
+	resume = bool(done)
+	try:
+		buffers.create('current', current.shape, dtype)[...] = current
+		if record == 'vm':
+			buffers.create('trace', (n_cells, steps), dtype, resume)
+		else:
+			buffers.create('times', (n_cells, max_spikes), np.float64, resume)
+			buffers.create('counts', (n_cells,), np.int64, resume)
+		if directory is not None and not resume:
+			with open(manifest_path, 'w') as f:
+				json.dump({'key': key, 'shard_size': shard_size, 'max_spikes': max_spikes,
+						   'n_cells': n_cells, 'steps': steps, 'settings': settings}, f)
+			open(journal, 'w').close()
+
+		finished = sum(shards[index][1] - shards[index][0] for index in done)
+		if progress is not None:
+			progress(finished, n_cells)
+		todo = [(index, lo, hi) for index, (lo, hi) in enumerate(shards) if index not in done]
+		if todo:
+			# fork would copy numba's running TBB/OpenMP threads into a broken
+			# state, and leave the parent hung at exit after a parallel run
+			with ProcessPoolExecutor(min(processes, len(todo)), initializer=_init_worker,
+									 initargs=(params, buffers.spec(), shared_current, settings),
+									 mp_context=multiprocessing.get_context('spawn')) as pool:
+				futures = [pool.submit(_run_shard, *task) for task in todo]
+				for future in as_completed(futures):
+					index = future.result()
+					if journal is not None:
+						with open(journal, 'a') as f:
+							f.write('%d\n' % index)
+							f.flush()
+							os.fsync(f.fileno())
+					finished += shards[index][1] - shards[index][0]
+					if progress is not None:
+						progress(finished, n_cells)
+
+		arrays = dict((name, array) for name, (array, _) in buffers.arrays.items())
+		if record == 'vm':
+			if directory is not None:
+				return np.load(os.path.join(directory, 'trace.npy'), mmap_mode='r')
+			return arrays['trace'].copy()
+		counts, times = arrays['counts'], arrays['times']
+		overflow = np.flatnonzero(counts > max_spikes)
+		if len(overflow):
+			raise ValueError('cells %s fired more than max_spikes=%d spikes, raise max_spikes'
+							 % (overflow[:10].tolist(), max_spikes))
+		return [times[n, :counts[n]].copy() for n in range(n_cells)]
+	finally:
+		buffers.release()
@@ -0,0 +1,320 @@
+"""
+Batched engine for the 2003 simple model (Izhikevich 2003, 2004).
+
+	v' = 0.04 v^2 + f v + g - u + I
+	u' = a (b v - u)        or, with accommodation, u' = a b (v + 65)
+	if v > 30: v <- c, u <- u + d
+
+f=5, g=140 is the model of both papers; f=4.1, g=108 is the
+parameterisation of the Class 1 and integrator panels of the 2004
+figure, and the accommodation panel uses the alternative u equation.
+Every cell has its own (a, b, c, d, f, g, accommodation, v_init,
+u_init, dt) and its own stimulus.Stimulus, evaluated in the kernel as in
+stimulus.py, so the 20 panels of the 2004 figure (FIGURE1, the type2004
+table of NEURON/izhiGUI.py) run as one batched call:
+
+	>>> v = run_figure1()          # (20, steps), NaN past each panel's end
+
+The scheme is that of get_2003_vm and of Izhikevich's figure1.m: an Euler
+step of v, then of u from the new v, and out[i] holds v after step i (30
+on a spike).
+"""
+import collections
+
+import numpy as np
+from numba import jit, prange
+from numba.typed import List
+
+from kernels import _concatenate_spikes, _grow, _out, _run_threaded, _check_dtype
+from stimulus import Stimulus, constant, step, square, ramp
+
+PARAM_NAMES_2003 = ('a', 'b', 'c', 'd', 'f', 'g', 'accommodation', 'v_init', 'u_init')
+DEFAULTS_2003 = {'f': 5.0, 'g': 140.0, 'accommodation': False, 'v_init': -70.0}
+# spike cut-off of the 2003 model
+V_PEAK = 30.0
+
+
+def params_2003(cells):
+	"""
+	Per-cell arrays of PARAM_NAMES_2003 from a list of dicts or a dict of
+	sequences or scalars, as kernels.population_params. f, g,
+	accommodation and v_init default to DEFAULTS_2003, u_init to b*v_init.
+	"""
+	if isinstance(cells, dict):
+		columns = dict(cells)
+		sizes = [np.size(value) for value in columns.values() if np.ndim(value)]
+		n_cells = max(sizes) if sizes else 1
+	else:
+		cells = list(cells)
+		n_cells = len(cells)
+		columns = {}
+		for name in PARAM_NAMES_2003[:-1]:
+			values = [cell.get(name, DEFAULTS_2003.get(name)) for cell in cells]
+			if any(value is None for value in values):
+				raise ValueError('missing parameter %s' % name)
+			columns[name] = values
+		columns['u_init'] = [cell.get('u_init', cell['b']*v_init)
+							 for cell, v_init in zip(cells, columns['v_init'])]
+	params = {}
+	for name in PARAM_NAMES_2003:
+		values = columns.get(name, DEFAULTS_2003.get(name))
+		if values is None:
+			if name != 'u_init':
+				raise ValueError('missing parameter %s' % name)
+			values = params['b']*params['v_init']
+		values = np.asarray(values, dtype=np.float64)
+		if values.ndim == 0:
+			values = np.full(n_cells, float(values))
+		if values.shape != (n_cells,):
+			raise ValueError('parameter %s has shape %s, expected (%d,)'
+							 % (name, values.shape, n_cells))
+		params[name] = values
+	params['accommodation'] = params['accommodation'] != 0
+	return params
+
+
+def tables_2003(stimuli, dt, dtype=np.float64):
+	"""
+	stimulus.stimulus_tables with a time step per cell: returns (bounds,
+	values, slopes, spans, steps) with the number of samples of every
+	cell in steps.
+	"""
+	rows = {}
+	parts = []
+	spans = np.empty((len(stimuli), 2), dtype=np.int64)
+	steps = np.empty(len(stimuli), dtype=np.int64)
+	size = 0
+	for n, (stimulus, h) in enumerate(zip(stimuli, dt)):
+		key = (id(stimulus), float(h))
+		if key not in rows:
+			part = stimulus.table(h, dtype)
+			rows[key] = (size, size + len(part[0]))
+			size += len(part[0])
+			parts.append(part)
+		spans[n] = rows[key]
+		steps[n] = stimulus.steps(h)
+	if not parts:
+		parts = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=dtype), np.empty(0, dtype=dtype))]
+	bounds, values, slopes = (np.concatenate([part[i] for part in parts]) for i in range(3))
+	return bounds, values, slopes, spans, steps
+
+
+@jit(nopython=True, cache=True)
+def _cell_2003(out, N, bounds, values, slopes, a, b, c, d, f, g, accommodation, v_init, u_init,
+			   dt):
+	"""
+	Integrate one cell over N samples of a breakpoint table; the trace
+	goes to out[:N] unless out is empty, the spike times (ms) are
+	returned.
+	"""
+	record = out.shape[0] > 0
+	times = np.empty(16, dtype=np.float64)
+	count = 0
+	V = v_init
+	u = u_init
+	n_bounds = bounds.shape[0]
+	for j in range(n_bounds):
+		lo = bounds[j]
+		hi = min(bounds[j+1] if j + 1 < n_bounds else N, N)
+		for i in range(lo, hi):
+			I = values[j] + slopes[j]*(i - lo)
+			V = V + dt*(0.04*V**2 + f*V + g - u + I)
+			if accommodation:
+				u = u + dt*a*(b*(V + 65.0))
+			else:
+				u = u + dt*a*(b*V - u)
+			if V > V_PEAK:
+				if record:
+					out[i] = V_PEAK
+				V = c
+				u = u + d
+				times = _grow(times, count)
+				times[count] = i*dt
+				count += 1
+			elif record:
+				out[i] = V
+	return times[:count].copy()
+
+
+@jit(nopython=True, cache=True)
+def get_vm_population_2003(out, steps, bounds, values, slopes, spans, a, b, c, d, f, g,
+						   accommodation, v_init, u_init, dt):
+	"""
+	Trace of every cell over its steps[n] samples; the rest of each row is
+	set to NaN.
+	"""
+	for n in range(out.shape[0]):
+		lo, hi = spans[n, 0], spans[n, 1]
+		N = min(steps[n], out.shape[1])
+		_cell_2003(out[n], N, bounds[lo:hi], values[lo:hi], slopes[lo:hi], a[n], b[n], c[n], d[n],
+				   f[n], g[n], accommodation[n], v_init[n], u_init[n], dt[n])
+		out[n, N:] = np.nan
+	return out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_vm_population_2003_parallel(out, steps, bounds, values, slopes, spans, a, b, c, d, f, g,
+									accommodation, v_init, u_init, dt):
+	for n in prange(out.shape[0]):
+		lo, hi = spans[n, 0], spans[n, 1]
+		N = min(steps[n], out.shape[1])
+		_cell_2003(out[n], N, bounds[lo:hi], values[lo:hi], slopes[lo:hi], a[n], b[n], c[n], d[n],
+				   f[n], g[n], accommodation[n], v_init[n], u_init[n], dt[n])
+		out[n, N:] = np.nan
+	return out
+
+
+@jit(nopython=True, cache=True)
+def get_spike_times_population_2003(steps, bounds, values, slopes, spans, a, b, c, d, f, g,
+									accommodation, v_init, u_init, dt):
+	"""
+	Spike times of every cell, as (times, offsets).
+	"""
+	spikes = List()
+	for n in range(steps.shape[0]):
+		lo, hi = spans[n, 0], spans[n, 1]
+		spikes.append(_cell_2003(np.empty(0), steps[n], bounds[lo:hi], values[lo:hi],
+								 slopes[lo:hi], a[n], b[n], c[n], d[n], f[n], g[n],
+								 accommodation[n], v_init[n], u_init[n], dt[n]))
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_spike_times_population_2003_parallel(steps, bounds, values, slopes, spans, a, b, c, d, f,
+											 g, accommodation, v_init, u_init, dt):
+	spikes = List()
+	for n in range(steps.shape[0]):
+		spikes.append(np.empty(0, dtype=np.float64))
+	for n in prange(steps.shape[0]):
+		lo, hi = spans[n, 0], spans[n, 1]
+		spikes[n] = _cell_2003(np.empty(0), steps[n], bounds[lo:hi], values[lo:hi],
+							   slopes[lo:hi], a[n], b[n], c[n], d[n], f[n], g[n],
+							   accommodation[n], v_init[n], u_init[n], dt[n])
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+def _setup(cells, stimuli, dt, dtype):
+	params = params_2003(cells)
+	n_cells = len(params['a'])
+	if isinstance(stimuli, Stimulus):
+		stimuli = [stimuli]*n_cells
+	stimuli = list(stimuli)
+	if len(stimuli) != n_cells:
+		raise ValueError('got %d stimuli for %d cells' % (len(stimuli), n_cells))
+	dt = np.asarray(dt, dtype=np.float64)
+	if dt.ndim == 0:
+		dt = np.full(n_cells, float(dt))
+	if dt.shape != (n_cells,):
+		raise ValueError('dt has shape %s, expected (%d,)' % (dt.shape, n_cells))
+	tables = tables_2003(stimuli, dt, dtype)
+	args = tuple(params[name] for name in PARAM_NAMES_2003) + (dt,)
+	return tables, args
+
+
+def simulate_2003(cells, stimuli, dt=0.25, parallel=False, n_threads=None, dtype=np.float64,
+				  out=None, workspace=None):
+	"""
+	Simulate a batch of 2003 model cells in one compiled call.
+
+	Inputs: cells : see params_2003
+			stimuli : a stimulus.Stimulus for every cell, or one shared
+					  by all, in the model's current units
+			dt : time step in ms, one for all cells or one per cell
+			parallel, n_threads, dtype, out, workspace : as in
+					  kernels.simulate_population
+	Returns a (cells, steps) array of v, steps being the longest run;
+	a cell runs for the duration of its stimulus and the rest of its
+	row is NaN.
+	"""
+	dtype = _check_dtype(dtype)
+	(bounds, values, slopes, spans, steps), args = _setup(cells, stimuli, dt, dtype)
+	out = _out(out, (len(steps), int(steps.max(initial=0))), dtype, workspace)
+	kernel = get_vm_population_2003_parallel if parallel else get_vm_population_2003
+	_run_threaded(kernel, (out, steps, bounds, values, slopes, spans) + args, {},
+				  n_threads if parallel else None)
+	return out
+
+
+def simulate_2003_spikes(cells, stimuli, dt=0.25, parallel=False, n_threads=None,
+						 dtype=np.float64):
+	"""
+	Like simulate_2003, but returns a list with one array of spike times
+	(ms) per cell.
+	"""
+	(bounds, values, slopes, spans, steps), args = _setup(cells, stimuli, dt, dtype)
+	kernel = (get_spike_times_population_2003_parallel if parallel
+			  else get_spike_times_population_2003)
+	times, offsets = _run_threaded(kernel, (steps, bounds, values, slopes, spans) + args, {},
+								   n_threads if parallel else None)
+	return [times[offsets[n]:offsets[n+1]] for n in range(len(steps))]
+
+
+def _pulses(amplitude, onsets, width, t_stop, dt, baseline=0.0):
+	# figure1.m applies a pulse on the samples with onset < t < onset + width
+	segments = [((np.floor(onset/dt + 1e-9) + 1)*dt, np.ceil((onset + width)/dt - 1e-9)*dt,
+				 amplitude - baseline, 0.0) for onset in onsets]
+	return Stimulus(segments, t_stop) + constant(baseline, t_stop)
+
+
+def _figure1():
+	"""
+	The 20 panels of Fig. 1 of Izhikevich (2004), from figure1.m, as
+	title -> (params, stimulus, dt).
+	"""
+	panels = collections.OrderedDict()
+
+	def panel(title, a, b, c, d, v_init, dt, stimulus, **params):
+		panels[title] = (dict(params, a=a, b=b, c=c, d=d, v_init=v_init), stimulus, dt)
+
+	panel('(A) Tonic spiking', 0.02, 0.2, -65.0, 6.0, -70.0, 0.25, step(14.0, 10.0 + 0.25, 100.0))
+	panel('(B) Phasic spiking', 0.02, 0.25, -65.0, 6.0, -64.0, 0.25, step(0.5, 20.0 + 0.25, 200.0))
+	panel('(C) Tonic bursting', 0.02, 0.2, -50.0, 2.0, -70.0, 0.25, step(15.0, 22.0 + 0.25, 220.0))
+	panel('(D) Phasic bursting', 0.02, 0.25, -55.0, 0.05, -64.0, 0.2, step(0.6, 20.0 + 0.2, 200.0))
+	panel('(E) Mixed mode', 0.02, 0.2, -55.0, 4.0, -70.0, 0.25, step(10.0, 16.0 + 0.25, 160.0))
+	panel('(F) SFA', 0.01, 0.2, -65.0, 8.0, -70.0, 0.25, step(30.0, 8.5 + 0.25, 85.0))
+	panel('(G) Class 1 excitable', 0.02, -0.1, -55.0, 6.0, -60.0, 0.25,
+		  ramp(0.075, 30.0, 300.0), f=4.1, g=108.0)
+	panel('(H) Class 2 excitable', 0.2, 0.26, -65.0, 0.0, -64.0, 0.25,
+		  ramp(0.015, 30.0, 300.0) + constant(-0.5, 300.0))
+	panel('(I) Spike latency', 0.02, 0.2, -65.0, 6.0, -70.0, 0.2,
+		  _pulses(7.04, [10.0], 3.0, 100.0, 0.2))
+	panel('(J) Subthreshold oscillation', 0.05, 0.26, -60.0, 0.0, -62.0, 0.25,
+		  _pulses(2.0, [20.0], 5.0, 200.0, 0.25))
+	panel('(K) Resonator', 0.1, 0.26, -60.0, -1.0, -62.0, 0.25,
+		  _pulses(0.65, [40.0, 60.0, 280.0, 320.0], 4.0, 400.0, 0.25))
+	panel('(L) Integrator', 0.02, -0.1, -55.0, 6.0, -60.0, 0.25,
+		  _pulses(9.0, [100.0/11, 100.0/11 + 5.0, 70.0, 80.0], 2.0, 100.0, 0.25), f=4.1, g=108.0)
+	panel('(M) Rebound spike', 0.03, 0.25, -60.0, 4.0, -64.0, 0.2,
+		  _pulses(-15.0, [20.0], 5.0, 200.0, 0.2))
+	panel('(N) Rebound burst', 0.03, 0.25, -52.0, 0.0, -64.0, 0.2,
+		  _pulses(-15.0, [20.0], 5.0, 200.0, 0.2))
+	panel('(O) Threshold variability', 0.03, 0.25, -60.0, 4.0, -64.0, 0.25,
+		  _pulses(1.0, [10.0, 80.0], 5.0, 100.0, 0.25) + _pulses(-6.0, [70.0], 5.0, 100.0, 0.25))
+	panel('(P) Bistability', 0.1, 0.26, -60.0, 0.0, -61.0, 0.25,
+		  _pulses(1.24, [37.5, 216.0], 5.0, 300.0, 0.25, baseline=0.24))
+	panel('(Q) DAP', 1.0, 0.2, -60.0, -21.0, -70.0, 0.1, _pulses(20.0, [9.0], 2.0, 50.0, 0.1))
+	panel('(R) Accomodation', 0.02, 1.0, -55.0, 4.0, -65.0, 0.5,
+		  Stimulus(ramp(0.04, 0.0, 200.0).segments + ramp(0.32, 300.0, 312.5).segments, 400.0),
+		  u_init=-16.0, accommodation=True)
+	panel('(S) Inhibition-induced spiking', -0.02, -1.0, -60.0, 8.0, -63.8, 0.5,
+		  constant(80.0, 350.0) + square(-5.0, 50.0, 200.0 + 0.5))
+	panel('(T) Inhibition-induced bursting', -0.026, -1.0, -45.0, -2.0, -63.8, 0.5,
+		  constant(80.0, 350.0) + square(-5.0, 50.0, 200.0 + 0.5))
+	return panels
+
+
+FIGURE1 = _figure1()
+
+
+def run_figure1(titles=None, record='vm', parallel=False):
+	"""
+	Run the panels of FIGURE1 (all of them by default) as one batch.
+	Returns the simulate_2003 traces, or the spike times with
+	record='spikes', in the order of titles.
+	"""
+	if titles is None:
+		titles = list(FIGURE1)
+	params, stimuli, dt = zip(*[FIGURE1[title] for title in titles])
+	if record == 'spikes':
+		return simulate_2003_spikes(list(params), stimuli, dt, parallel=parallel)
+	return simulate_2003(list(params), stimuli, dt, parallel=parallel)
@@ -0,0 +1,389 @@
+"""
+Compact stimulus descriptions evaluated inside the kernels.
+
+A Stimulus is a current (pA) over [0, t_stop) ms given as a sum of
+linear segments: constants, steps, square pulses, pulse trains and ramps
+are one segment per pulse, and stimuli add up with +. The kernels
+below take it as a table of breakpoints (segment_table) and compute the
+current of every step on the fly, so a protocol costs O(segments)
+memory however long it is, and no per-sample array is built in python.
+
+	>>> protocol = square(-50.0, 0.0, 120.0) + ramp(0.5, 120.0, 1000.0)
+	>>> v = simulate_stimulus(cells, protocol, dt=0.25)
+	>>> model.inject_stimulus(pulse_train(500.0, 100.0, 2.0, 25.0, 20, 1000.0))
+
+With the same samples, the traces equal those of the dense current
+(kernels.simulate_population): segment times are rounded to the
+nearest sample.
+"""
+import numpy as np
+from numba import jit, prange
+from numba.typed import List
+
+from kernels import _advance, _grow, _concatenate_spikes, _kernel_args, _method_code, _out
+from kernels import _run_threaded, _check_dtype, population_params
+
+
+class Stimulus(object):
+	"""
+	Sum of linear segments of current.
+
+	segments : sequence of (t_on, t_off, value, slope); the segment is
+			   value pA at t_on and changes by slope pA/ms up to t_off
+			   (excluded), times in ms
+	t_stop : duration of the stimulus in ms
+	"""
+
+	def __init__(self, segments, t_stop):
+		self.segments = [tuple(float(x) for x in segment) for segment in segments]
+		self.t_stop = float(t_stop)
+
+	def __add__(self, other):
+		if isinstance(other, (int, float, np.number)):
+			other = constant(other, self.t_stop)
+		if not isinstance(other, Stimulus):
+			return NotImplemented
+		return Stimulus(self.segments + other.segments, max(self.t_stop, other.t_stop))
+
+	__radd__ = __add__
+
+	def __repr__(self):
+		return 'Stimulus(%d segments, t_stop=%g)' % (len(self.segments), self.t_stop)
+
+	def steps(self, dt):
+		"""
+		Number of samples of the stimulus at time step dt.
+		"""
+		return int(round(self.t_stop/dt))
+
+	def table(self, dt, dtype=np.float64):
+		"""
+		(bounds, values, slopes) of the stimulus sampled every dt ms, see
+		segment_table.
+		"""
+		if not self.segments:
+			return segment_table([], [], [], [], self.steps(dt), dtype)
+		t_on, t_off, values, slopes = np.array(self.segments, dtype=np.float64).T
+		return segment_table(np.rint(t_on/dt), np.rint(t_off/dt), values, slopes*dt,
+							 self.steps(dt), dtype)
+
+	def sample(self, dt, dtype=np.float64):
+		"""
+		The dense current, for plotting or for code that needs an array.
+		"""
+		out = np.empty(self.steps(dt), dtype=_check_dtype(dtype))
+		return get_stimulus_samples(out, *self.table(dt, dtype))
+
+
+def segment_table(starts, stops, values, slopes, steps, dtype=np.float64):
+	"""
+	Breakpoint table of a sum of segments given in samples.
+
+	Segment s is values[s] at sample starts[s] and changes by slopes[s]
+	per sample up to stops[s] (excluded). Returns (bounds, values,
+	slopes): the current of sample i, for bounds[j] <= i < bounds[j+1],
+	is values[j] + slopes[j]*(i - bounds[j]). bounds starts at 0, ends at
+	steps (from where the current is 0, as outside of every segment).
+	values and slopes are rounded to dtype, as a dense current of that
+	dtype would be.
+	"""
+	starts = np.clip(np.asarray(starts, dtype=np.int64), 0, steps)
+	stops = np.clip(np.asarray(stops, dtype=np.int64), 0, steps)
+	seg_values = np.asarray(values, dtype=np.float64)
+	seg_slopes = np.asarray(slopes, dtype=np.float64)
+	bounds = np.unique(np.concatenate(([0, steps], starts, stops)))
+	table_values = np.empty(len(bounds))
+	table_slopes = np.empty(len(bounds))
+	_sum_segments(table_values, table_slopes, bounds, starts, stops, seg_values, seg_slopes,
+				  np.argsort(starts, kind='stable'))
+	dtype = _check_dtype(dtype)
+	return bounds, table_values.astype(dtype), table_slopes.astype(dtype)
+
+
+@jit(nopython=True, cache=True)
+def _sum_segments(out_values, out_slopes, bounds, starts, stops, values, slopes, order):
+	"""
+	Value and slope of the sum of the segments active at every bound,
+	sweeping the segments in order of their start. Only the active
+	segments are summed, so that a segment ending does not leave a
+	rounding residue behind, and the cost is O(bounds x overlap).
+	"""
+	active = np.empty(starts.shape[0], dtype=np.int64)
+	n_active = 0
+	upcoming = 0
+	for j in range(bounds.shape[0]):
+		bound = bounds[j]
+		kept = 0
+		for q in range(n_active):
+			if stops[active[q]] > bound:
+				active[kept] = active[q]
+				kept += 1
+		n_active = kept
+		while upcoming < order.shape[0] and starts[order[upcoming]] <= bound:
+			s = order[upcoming]
+			if stops[s] > bound:
+				active[n_active] = s
+				n_active += 1
+			upcoming += 1
+		total = 0.0
+		slope = 0.0
+		for q in range(n_active):
+			s = active[q]
+			total += values[s] + slopes[s]*(bound - starts[s])
+			slope += slopes[s]
+		out_values[j] = total
+		out_slopes[j] = slope
+
+
+def constant(amplitude, t_stop, t_start=0.0):
+	"""
+	amplitude pA from t_start to t_stop.
+	"""
+	return Stimulus([(t_start, t_stop, amplitude, 0.0)], t_stop)
+
+
+def square(amplitude, delay, duration, t_stop=None):
+	"""
+	A square pulse of amplitude pA from delay for duration ms; t_stop
+	defaults to the end of the pulse.
+	"""
+	if t_stop is None:
+		t_stop = delay + duration
+	return Stimulus([(delay, delay + duration, amplitude, 0.0)], t_stop)
+
+
+def step(amplitude, onset, t_stop):
+	"""
+	0 pA up to onset, then amplitude pA.
+	"""
+	return constant(amplitude, t_stop, onset)
+
+
+def pulses(amplitude, onsets, width, t_stop, baseline=0.0):
+	"""
+	Pulses of amplitude pA and width ms starting at onsets (ms), on top
+	of a constant baseline.
+	"""
+	segments = [(onset, onset + width, amplitude - baseline, 0.0) for onset in onsets]
+	if baseline:
+		segments.append((0.0, t_stop, baseline, 0.0))
+	return Stimulus(segments, t_stop)
+
+
+def pulse_train(amplitude, onset, width, period, count, t_stop, baseline=0.0):
+	"""
+	count pulses of amplitude pA and width ms, one every period ms from
+	onset on.
+	"""
+	return pulses(amplitude, onset + period*np.arange(int(count)), width, t_stop, baseline)
+
+
+def ramp(gradient, onset, t_stop, baseline=0.0):
+	"""
+	baseline pA, increasing by gradient pA/ms from onset on.
+	"""
+	stimulus = Stimulus([(onset, t_stop, baseline, gradient)], t_stop)
+	if baseline and onset > 0:
+		stimulus = stimulus + constant(baseline, onset)
+	return stimulus
+
+
+def stimulus_tables(stimuli, n_cells, dt, dtype=np.float64):
+	"""
+	Pack one Stimulus for every cell, or a single one shared by all,
+	into (bounds, values, slopes, spans, steps): the table of cell n is
+	rows spans[n, 0]:spans[n, 1] of bounds, values and slopes, and steps
+	is the longest duration in samples. A stimulus shared by several
+	cells is converted and stored once.
+	"""
+	if isinstance(stimuli, Stimulus):
+		stimuli = [stimuli]*n_cells
+	stimuli = list(stimuli)
+	if len(stimuli) != n_cells:
+		raise ValueError('got %d stimuli for %d cells' % (len(stimuli), n_cells))
+	rows = {}
+	parts = []
+	spans = np.empty((n_cells, 2), dtype=np.int64)
+	size = 0
+	for n, stimulus in enumerate(stimuli):
+		if id(stimulus) not in rows:
+			part = stimulus.table(dt, dtype)
+			rows[id(stimulus)] = (size, size + len(part[0]))
+			size += len(part[0])
+			parts.append(part)
+		spans[n] = rows[id(stimulus)]
+	steps = max([stimulus.steps(dt) for stimulus in stimuli] or [0])
+	if not parts:
+		parts = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=dtype), np.empty(0, dtype=dtype))]
+	bounds, values, slopes = (np.concatenate([part[i] for part in parts]) for i in range(3))
+	return bounds, values, slopes, spans, steps
+
+
+@jit(nopython=True, cache=True)
+def get_stimulus_samples(out, bounds, values, slopes):
+	"""
+	Fill out with the samples of a breakpoint table.
+	"""
+	N = out.shape[0]
+	for j in range(bounds.shape[0]):
+		hi = bounds[j+1] if j + 1 < bounds.shape[0] else N
+		for i in range(bounds[j], min(hi, N)):
+			out[i] = values[j] + slopes[j]*(i - bounds[j])
+	return out
+
+
+@jit(nopython=True, cache=True)
+def _stimulus_cell(out, N, bounds, values, slopes, method, interpolate, tol, celltype,
+				   C, k, vr, vt, vPeak, a, b, c, d, dt):
+	"""
+	Integrate one cell from rest over N samples of the current of a
+	breakpoint table, one interval at a time so that no per-step lookup
+	is needed. The trace goes to out unless it is empty, as in
+	_vm_cell_method; the spike times (ms) are returned.
+	"""
+	record = out.shape[0] > 0
+	times = np.empty(16, dtype=np.float64)
+	count = 0
+	if N == 0:
+		return times[:0].copy()
+	v = vr
+	u = 0.0
+	h = dt
+	# the current is rounded to the table dtype as get_stimulus_samples
+	# stores it, so that a float32 run matches the dense current
+	sample = np.empty(1, dtype=values.dtype)
+	n_bounds = bounds.shape[0]
+	for j in range(n_bounds):
+		lo = bounds[j]
+		hi = min(bounds[j+1] if j + 1 < n_bounds else N, N - 1)
+		for i in range(lo, hi):
+			sample[0] = values[j] + slopes[j]*(i - lo)
+			I = sample[0]
+			v, u, v_now, h, frac = _advance(method, interpolate, celltype, v, u, I, dt, h, tol,
+											C, k, vr, vt, vPeak, a, b, c, d)
+			if record:
+				out[i] = v_now
+			if frac >= 0:
+				times = _grow(times, count)
+				times[count] = (i + frac)*dt
+				count += 1
+	if record:
+		out[N-1] = v
+	return times[:count].copy()
+
+
+@jit(nopython=True, cache=True)
+def get_vm_cell_stimulus(out, bounds, values, slopes, method, interpolate, tol, celltype,
+						 C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Trace of a single cell from rest written into out, parameters in
+	KERNEL_PARAMS order (params.CellParams.args).
+	"""
+	_stimulus_cell(out, out.shape[0], bounds, values, slopes, method, interpolate, tol, celltype,
+				   C, k, vr, vt, vPeak, a, b, c, d, dt)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def get_spike_times_stimulus(N, bounds, values, slopes, method, interpolate, tol, celltype,
+							 C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Spike times (ms) of a single cell over N samples.
+	"""
+	return _stimulus_cell(np.empty(0), N, bounds, values, slopes, method, interpolate, tol,
+						  celltype, C, k, vr, vt, vPeak, a, b, c, d, dt)
+
+
+@jit(nopython=True, cache=True)
+def get_vm_population_stimulus(out, bounds, values, slopes, spans, method, interpolate, tol,
+							   celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Trace of every cell, the table of cell n being rows
+	spans[n, 0]:spans[n, 1] of bounds, values and slopes.
+	"""
+	for n in range(out.shape[0]):
+		lo, hi = spans[n, 0], spans[n, 1]
+		_stimulus_cell(out[n], out.shape[1], bounds[lo:hi], values[lo:hi], slopes[lo:hi], method,
+					   interpolate, tol, celltype[n], C[n], k[n], vr[n], vt[n], vPeak[n], a[n], b[n],
+					   c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_vm_population_stimulus_parallel(out, bounds, values, slopes, spans, method, interpolate,
+										tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	for n in prange(out.shape[0]):
+		lo, hi = spans[n, 0], spans[n, 1]
+		_stimulus_cell(out[n], out.shape[1], bounds[lo:hi], values[lo:hi], slopes[lo:hi], method,
+					   interpolate, tol, celltype[n], C[n], k[n], vr[n], vt[n], vPeak[n], a[n], b[n],
+					   c[n], d[n], dt)
+	return out
+
+
+@jit(nopython=True, cache=True)
+def get_spike_times_population_stimulus(N, bounds, values, slopes, spans, method, interpolate,
+										tol, celltype, C, k, vr, vt, vPeak, a, b, c, d, dt=0.25):
+	"""
+	Spike times of every cell over N samples, as (times, offsets).
+	"""
+	spikes = List()
+	for n in range(spans.shape[0]):
+		lo, hi = spans[n, 0], spans[n, 1]
+		spikes.append(_stimulus_cell(np.empty(0), N, bounds[lo:hi], values[lo:hi], slopes[lo:hi],
+									 method, interpolate, tol, celltype[n], C[n], k[n], vr[n],
+									 vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt))
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def get_spike_times_population_stimulus_parallel(N, bounds, values, slopes, spans, method,
+												 interpolate, tol, celltype, C, k, vr, vt, vPeak,
+												 a, b, c, d, dt=0.25):
+	spikes = List()
+	for n in range(spans.shape[0]):
+		spikes.append(np.empty(0, dtype=np.float64))
+	for n in prange(spans.shape[0]):
+		lo, hi = spans[n, 0], spans[n, 1]
+		spikes[n] = _stimulus_cell(np.empty(0), N, bounds[lo:hi], values[lo:hi], slopes[lo:hi],
+								   method, interpolate, tol, celltype[n], C[n], k[n], vr[n],
+								   vt[n], vPeak[n], a[n], b[n], c[n], d[n], dt)
+	return _concatenate_spikes(spikes, np.empty(0, dtype=np.float64))
+
+
+def simulate_stimulus(cells, stimuli, dt=0.25, parallel=False, n_threads=None, method='euler',
+					  tol=0.01, interpolate=False, dtype=np.float64, out=None, workspace=None):
+	"""
+	kernels.simulate_population driven by a Stimulus, or one per cell.
+
+	Returns a (cells, steps) array of membrane potentials, steps being
+	the duration of the longest stimulus; shorter ones are 0 pA at the
+	end.
+	"""
+	code = _method_code(method)
+	dtype = _check_dtype(dtype)
+	params = population_params(cells)
+	n_cells = len(params['C'])
+	bounds, values, slopes, spans, steps = stimulus_tables(stimuli, n_cells, dt, dtype)
+	out = _out(out, (n_cells, steps), dtype, workspace)
+	kernel = get_vm_population_stimulus_parallel if parallel else get_vm_population_stimulus
+	_run_threaded(kernel, (out, bounds, values, slopes, spans, code, interpolate, tol)
+				  + _kernel_args(params) + (dt,), {}, n_threads if parallel else None)
+	return out
+
+
+def simulate_stimulus_spikes(cells, stimuli, dt=0.25, parallel=False, n_threads=None,
+							 method='euler', tol=0.01, interpolate=False, dtype=np.float64):
+	"""
+	kernels.simulate_population_spikes driven by a Stimulus, or one per
+	cell; returns a list of spike-time arrays.
+	"""
+	code = _method_code(method)
+	params = population_params(cells)
+	n_cells = len(params['C'])
+	bounds, values, slopes, spans, steps = stimulus_tables(stimuli, n_cells, dt, dtype)
+	kernel = (get_spike_times_population_stimulus_parallel if parallel
+			  else get_spike_times_population_stimulus)
+	times, offsets = _run_threaded(kernel, (steps, bounds, values, slopes, spans, code,
+											interpolate, tol) + _kernel_args(params) + (dt,),
+								   {}, n_threads if parallel else None)
+	return [times[offsets[n]:offsets[n+1]] for n in range(n_cells)]
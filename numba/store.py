@@ -0,0 +1,259 @@
+"""
+Binary store for recorded traces.
+
+A TraceStore is a directory holding any number of named runs. Each run
+is a (cells, steps) array of float32 or float64 samples, split along the
+cells into chunk files of chunk_cells whole rows. Every chunk is a .npy
+file, so it is memory-mapped on access rather than read, and its rows
+are C-contiguous, so the population kernels write into it directly
+(simulate_population(..., out=chunk)). index.json keeps the metadata of
+every run: shape, dtype, dt, t_start, the chunk layout and free-form
+attrs.
+
+	>>> store = TraceStore('results/rs-grid')
+	>>> run = store.simulate('rs', cells, I, dt=0.25, dtype=np.float32)
+	>>> store['rs'][10:20, 4000:8000]   # only these samples are read
+
+A run replaces the '%s\t%s\n' text files written by
+utils.run_simulation: the samples take 4 or 8 bytes each and the times
+are implied by t_start and dt.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from kernels import _check_dtype, population_params, population_current, simulate_population
+
+INDEX = 'index.json'
+# default chunk size in bytes, chunk_cells is chosen to stay below it
+CHUNK_BYTES = 64*2**20
+
+
+class TraceRun(object):
+	"""
+	One run of a TraceStore. Chunks are memory-mapped on first access.
+
+	Indexing takes a cell index (int, slice, sequence of ints or boolean
+	mask) optionally followed by a step index, and returns an in-memory
+	array; only the chunks holding the selected cells are touched.
+	"""
+
+	def __init__(self, directory, name, meta, mode='r'):
+		self.directory = directory
+		self.name = name
+		self.meta = meta
+		self.mode = mode
+		self.shape = tuple(meta['shape'])
+		self.dtype = np.dtype(meta['dtype'])
+		self.dt = meta['dt']
+		self.t_start = meta['t_start']
+		self.chunk_cells = meta['chunk_cells']
+		self.attrs = meta['attrs']
+		self._chunks = {}
+
+	def __len__(self):
+		return self.shape[0]
+
+	@property
+	def times(self):
+		"""
+		Sample times in ms.
+		"""
+		return self.t_start + np.arange(self.shape[1])*self.dt
+
+	def _bounds(self, index):
+		lo = index*self.chunk_cells
+		return lo, min(lo + self.chunk_cells, self.shape[0])
+
+	def chunk(self, index):
+		"""
+		Memory map of chunk index, holding cells chunk_cells*index onwards.
+		"""
+		if index not in self._chunks:
+			path = os.path.join(self.directory, self.name, '%05d.npy' % index)
+			self._chunks[index] = np.load(path, mmap_mode=self.mode)
+		return self._chunks[index]
+
+	def chunks(self):
+		"""
+		Iterate over (lo, hi, memmap) for cells lo:hi of every chunk.
+		"""
+		for index in range(-(-self.shape[0]//self.chunk_cells)):
+			lo, hi = self._bounds(index)
+			yield lo, hi, self.chunk(index)
+
+	def _cells(self, key):
+		if isinstance(key, tuple):
+			if len(key) > 2:
+				raise IndexError('a run has two dimensions, cells and steps')
+			cells, steps = key if len(key) == 2 else (key[0], slice(None))
+		else:
+			cells, steps = key, slice(None)
+		scalar = isinstance(cells, (int, np.integer))
+		rows = np.arange(self.shape[0])[cells]
+		return np.atleast_1d(rows), steps, scalar
+
+	def __getitem__(self, key):
+		rows, steps, scalar = self._cells(key)
+		width = len(np.empty(self.shape[1], dtype=bool)[steps])
+		result = np.empty((len(rows), width), dtype=self.dtype)
+		indices = rows//self.chunk_cells
+		for index in np.unique(indices):
+			where = np.flatnonzero(indices == index)
+			local = rows[where] - index*self.chunk_cells
+			chunk = self.chunk(index)
+			result[where] = chunk[local, steps] if isinstance(steps, slice) else chunk[local][:, steps]
+		return result[0] if scalar else result
+
+	def __setitem__(self, key, value):
+		rows, steps, _ = self._cells(key)
+		value = np.broadcast_to(np.asarray(value, dtype=self.dtype),
+								(len(rows), len(np.empty(self.shape[1], dtype=bool)[steps])))
+		indices = rows//self.chunk_cells
+		for index in np.unique(indices):
+			where = np.flatnonzero(indices == index)
+			chunk = self.chunk(index)
+			for row, sample in zip(rows[where] - index*self.chunk_cells, value[where]):
+				chunk[row, steps] = sample
+
+	def flush(self):
+		for chunk in self._chunks.values():
+			if isinstance(chunk, np.memmap):
+				chunk.flush()
+
+	def close(self):
+		"""
+		Flush and drop the memory maps; the run can still be indexed.
+		"""
+		self.flush()
+		self._chunks = {}
+
+
+class TraceStore(object):
+	"""
+	Directory of named TraceRuns with a shared index.
+
+	mode : 'r' to open the runs read-only, 'a' to allow adding and
+		   writing runs
+	"""
+
+	def __init__(self, directory, mode='a'):
+		if mode not in ('r', 'a'):
+			raise ValueError("mode must be 'r' or 'a', not %r" % mode)
+		self.directory = directory
+		self.mode = mode
+		if mode == 'a' and not os.path.isdir(directory):
+			os.makedirs(directory)
+		path = os.path.join(directory, INDEX)
+		if os.path.exists(path):
+			with open(path) as f:
+				self.index = json.load(f)
+		elif mode == 'r':
+			raise IOError('%s is not a trace store, %s is missing' % (directory, INDEX))
+		else:
+			self.index = {}
+
+	def _save_index(self):
+		# write to a temporary file and rename it, so that a reader never
+		# sees a partial index
+		handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.json')
+		with os.fdopen(handle, 'w') as f:
+			json.dump(self.index, f, indent=1, sort_keys=True)
+		os.replace(temporary, os.path.join(self.directory, INDEX))
+
+	def _check_writable(self):
+		if self.mode == 'r':
+			raise IOError('%s is opened read-only' % self.directory)
+
+	def __contains__(self, name):
+		return name in self.index
+
+	def __len__(self):
+		return len(self.index)
+
+	def names(self):
+		return sorted(self.index)
+
+	def __getitem__(self, name):
+		if name not in self.index:
+			raise KeyError(name)
+		return TraceRun(self.directory, name, self.index[name], 'r' if self.mode == 'r' else 'r+')
+
+	def create(self, name, n_cells, steps, dt=0.25, dtype=np.float64, t_start=0.0,
+			   chunk_cells=None, attrs=None, overwrite=False):
+		"""
+		Allocate a run of n_cells x steps samples and return it for writing.
+
+		dtype : float64 or float32
+		chunk_cells : cells per chunk file, defaults to as many as fit in
+					  CHUNK_BYTES
+		attrs : JSON-serialisable metadata kept in the index
+		overwrite : replace an existing run of the same name
+		"""
+		self._check_writable()
+		dtype = _check_dtype(dtype)
+		if name in self.index:
+			if not overwrite:
+				raise ValueError('run %r exists, pass overwrite=True to replace it' % name)
+			self.remove(name)
+		n_cells, steps = int(n_cells), int(steps)
+		if chunk_cells is None:
+			chunk_cells = CHUNK_BYTES//max(steps*dtype.itemsize, 1)
+		chunk_cells = max(min(int(chunk_cells), n_cells), 1)
+		folder = os.path.join(self.directory, name)
+		os.makedirs(folder)
+		for index, lo in enumerate(range(0, n_cells, chunk_cells)):
+			rows = min(chunk_cells, n_cells - lo)
+			np.lib.format.open_memmap(os.path.join(folder, '%05d.npy' % index), mode='w+',
+									  dtype=dtype, shape=(rows, steps))
+		self.index[name] = {'shape': [n_cells, steps], 'dtype': dtype.str, 'dt': float(dt),
+							't_start': float(t_start), 'chunk_cells': chunk_cells,
+							'attrs': dict(attrs or {})}
+		self._save_index()
+		return self[name]
+
+	def write(self, name, traces, dt=0.25, t_start=0.0, chunk_cells=None, attrs=None,
+			  overwrite=False):
+		"""
+		Store traces, of shape (steps,) or (cells, steps), as a new run.
+		"""
+		traces = np.asarray(traces)
+		if traces.ndim == 1:
+			traces = traces[np.newaxis]
+		dtype = traces.dtype if traces.dtype in (np.float32, np.float64) else np.float64
+		run = self.create(name, traces.shape[0], traces.shape[1], dt=dt, dtype=dtype,
+						  t_start=t_start, chunk_cells=chunk_cells, attrs=attrs, overwrite=overwrite)
+		for lo, hi, chunk in run.chunks():
+			chunk[...] = traces[lo:hi]
+		run.close()
+		return run
+
+	def simulate(self, name, cells, I, dt=0.25, dtype=np.float64, chunk_cells=None, attrs=None,
+				 overwrite=False, **settings):
+		"""
+		Simulate a population straight into a new run, one chunk at a time.
+
+		cells, I, dt, dtype and settings (parallel, method, ...) are those
+		of kernels.simulate_population; each chunk file is the out= buffer
+		of one call, so no trace is held in memory.
+		"""
+		params = population_params(cells)
+		n_cells = len(params['C'])
+		I = population_current(I, n_cells, dtype)
+		run = self.create(name, n_cells, I.shape[1], dt=dt, dtype=dtype, chunk_cells=chunk_cells,
+						  attrs=attrs, overwrite=overwrite)
+		for lo, hi, chunk in run.chunks():
+			chunk_params = dict((key, values[lo:hi]) for key, values in params.items())
+			simulate_population(chunk_params, I[lo:hi], dt=dt, dtype=dtype, out=chunk, **settings)
+			chunk.flush()
+		run.close()
+		return run
+
+	def remove(self, name):
+		self._check_writable()
+		del self.index[name]
+		self._save_index()
+		shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
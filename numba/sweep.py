@@ -0,0 +1,181 @@
+"""
+Batched parameter sweeps and f-I curves of the 2007 model.
+
+A sweep runs every (parameter set, amplitude) pair of a square current
+pulse as one compiled job (kernels.get_pulse_responses) and returns a
+tidy numpy structured array with one row per pair, instead of building
+an IZHIModel, a figure and an AnalogSignal per amplitude as
+utils.plot_model does.
+
+	>>> from utils import reduced_cells
+	>>> cells = parameter_grid(reduced_cells['RS'], a=[0.01, 0.03, 0.05], d=[50, 100])
+	>>> table = sweep(cells, amplitudes=range(0, 500, 10), duration=600.0)
+	>>> table[table['set'] == 0][['amplitude', 'rate']]
+
+rheobase finds the threshold current of many parameter sets (or
+IZHIModel candidates) in one call, bisecting every set independently
+inside the kernel.
+"""
+import itertools
+
+import numpy as np
+
+from kernels import PARAM_NAMES, population_params, _kernel_args, _method_code, _run_threaded
+from kernels import get_pulse_responses, get_pulse_responses_parallel
+from kernels import get_rheobase_population, get_rheobase_population_parallel
+
+# columns of the table returned by sweep, after the parameters
+RESULT_FIELDS = [('amplitude', np.float64), ('spike_count', np.int64),
+				 ('rate', np.float64), ('latency', np.float64)]
+
+
+def sweep_dtype():
+	"""
+	numpy dtype of a sweep table: the parameter set index, the parameters,
+	then RESULT_FIELDS.
+	"""
+	fields = [('set', np.int64)]
+	fields += [(name, np.int64 if name == 'celltype' else np.float64) for name in PARAM_NAMES]
+	return np.dtype(fields + RESULT_FIELDS)
+
+
+def _columns(base, names, values, n_sets):
+	"""
+	Per-set parameter arrays: values[i] for names[i], base for the rest.
+	"""
+	columns = dict((name, np.full(n_sets, base[name], dtype=np.float64)) for name in PARAM_NAMES)
+	for name, column in zip(names, values):
+		if name not in PARAM_NAMES:
+			raise ValueError('unknown parameter %r, expected one of %s' % (name, ', '.join(PARAM_NAMES)))
+		columns[name] = np.asarray(column, dtype=np.float64)
+	return columns
+
+
+def parameter_grid(base, **axes):
+	"""
+	Cartesian product of parameter values around a base cell.
+
+	base : an attrs dict such as reduced_cells['RS']
+	axes : parameter name -> sequence of values
+	Returns a dict of per-set arrays accepted as cells by sweep and by
+	kernels.simulate_population; the last axis varies fastest.
+	"""
+	names = list(axes)
+	points = list(itertools.product(*[axes[name] for name in names]))
+	values = [[point[i] for point in points] for i in range(len(names))]
+	return _columns(base, names, values, len(points))
+
+
+def parameter_samples(base, names, samples):
+	"""
+	Parameter sets given as a sample matrix, e.g. from a Latin hypercube.
+
+	samples : (sets, len(names)) array, column i holds parameter names[i]
+	The parameters that are not in names are taken from base.
+	"""
+	samples = np.asarray(samples, dtype=np.float64)
+	if samples.ndim != 2 or samples.shape[1] != len(names):
+		raise ValueError('samples has shape %s, expected (sets, %d)' % (samples.shape, len(names)))
+	return _columns(base, names, samples.T, samples.shape[0])
+
+
+def pulse_indices(delay, duration, dt):
+	"""
+	(N, start, stop) of a square pulse sampled like
+	IZHIModel.inject_square_current: N samples over delay + duration ms,
+	the amplitude on samples start <= i < stop.
+	"""
+	tMax = float(delay) + float(duration)
+	N = int(tMax/dt)
+	delay_ind = int((float(delay)/tMax)*N)
+	duration_ind = int((float(duration)/tMax)*N)
+	return N, delay_ind, delay_ind + duration_ind - 1
+
+
+def sweep(cells, amplitudes, delay=0.0, duration=600.0, dt=0.25, method='euler', tol=0.01,
+		  interpolate=False, parallel=False, n_threads=None):
+	"""
+	Square-pulse responses of every parameter set to every amplitude.
+
+	Inputs: cells : parameter sets, see parameter_grid, parameter_samples
+					and kernels.population_params
+			amplitudes : pulse amplitudes in pA
+			delay, duration : pulse timing in ms, as the 'delay' and
+							  'duration' of inject_square_current
+			dt, method, tol, interpolate, parallel, n_threads : see
+							  kernels.simulate_population
+	Returns a structured array of dtype sweep_dtype() with one row per
+	(set, amplitude), sets major. spike_count counts the spikes from the
+	pulse onset on, rate is spike_count over the pulse duration in Hz and
+	latency the time from the onset to the first spike in ms (nan if the
+	cell stays silent).
+	"""
+	code = _method_code(method)
+	params = population_params(cells)
+	amplitudes = np.asarray(amplitudes, dtype=np.float64).ravel()
+	n_sets = len(params['C'])
+	N, start, stop = pulse_indices(delay, duration, dt)
+	counts = np.zeros((n_sets, len(amplitudes)), dtype=np.int64)
+	latencies = np.empty((n_sets, len(amplitudes)))
+	kernel = get_pulse_responses_parallel if parallel else get_pulse_responses
+	_run_threaded(kernel, (counts, latencies, amplitudes, start, stop, N, code, interpolate, tol)
+				  + _kernel_args(params) + (dt,), {}, n_threads if parallel else None)
+
+	table = np.empty(n_sets*len(amplitudes), dtype=sweep_dtype())
+	table['set'] = np.repeat(np.arange(n_sets), len(amplitudes))
+	for name in PARAM_NAMES:
+		table[name] = np.repeat(params[name], len(amplitudes))
+	table['amplitude'] = np.tile(amplitudes, n_sets)
+	table['spike_count'] = counts.ravel()
+	table['rate'] = counts.ravel()/(float(duration)/1000.0)
+	table['latency'] = latencies.ravel()
+	return table
+
+
+def fi_curve(table, set_index=0):
+	"""
+	(amplitudes, rates) of one parameter set of a sweep table.
+	"""
+	rows = table[table['set'] == set_index]
+	return rows['amplitude'], rows['rate']
+
+
+def rheobase(cells, lo=0.0, hi=100.0, resolution=0.1, max_amplitude=10000.0, delay=0.0,
+			 duration=600.0, dt=0.25, method='euler', tol=0.01, interpolate=False,
+			 parallel=False, n_threads=None, return_runs=False):
+	"""
+	Rheobase (pA) of every parameter set for a square pulse.
+
+	Inputs: cells : parameter sets as for sweep, or a list of IZHIModel
+					instances whose attrs are used
+			lo, hi : initial bracket, scalars or one value per set; hi is
+					 doubled until the set fires, up to max_amplitude
+			resolution : width (pA) of the final bracket
+			delay, duration, dt, method, tol, interpolate, parallel,
+			n_threads : see sweep
+	Returns the smallest firing amplitude found for every set (nan where
+	even max_amplitude stays silent), and with return_runs the number of
+	simulations each set needed. Each simulation stops at the first spike.
+	"""
+	if isinstance(cells, (list, tuple)):
+		cells = [getattr(cell, 'attrs', cell) for cell in cells]
+	code = _method_code(method)
+	params = population_params(cells)
+	n_sets = len(params['C'])
+	lo = np.broadcast_to(np.asarray(lo, dtype=np.float64), (n_sets,))
+	hi = np.broadcast_to(np.asarray(hi, dtype=np.float64), (n_sets,))
+	if np.any(hi <= lo) or np.any(hi <= 0):
+		raise ValueError('expected 0 < hi and lo < hi')
+	if not float(resolution) > 0:
+		# the bisection would never narrow the bracket below it
+		raise ValueError('resolution must be positive, got %r' % (resolution,))
+	N, start, stop = pulse_indices(delay, duration, dt)
+	out = np.empty(n_sets)
+	runs = np.zeros(n_sets, dtype=np.int64)
+	kernel = get_rheobase_population_parallel if parallel else get_rheobase_population
+	_run_threaded(kernel, (out, runs, lo, hi, float(max_amplitude), float(resolution), start, stop, N,
+						   code, interpolate, tol) + _kernel_args(params) + (dt,),
+				  {}, n_threads if parallel else None)
+	if return_runs:
+		return out, runs
+	return out
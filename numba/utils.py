@@ -1,27 +1,28 @@
-
 from __future__ import division
-import os
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-from pyNN.utility import normalized_filename
 import izhikevich as izhi
+import metrics
+from store import TraceStore
 from numba import jit
-from tqdm.auto import tqdm
-import time
-import numba
 import collections
 global_time_step = 0.25
 
-plt.rcParams.update({
-	'lines.linewidth': 0.5,
-	'legend.fontsize': 'small',
-	'axes.titlesize': 'small',
-	'font.size': 6,
-	'savefig.dpi': 200,
-})
+def _pyplot():
+	"""
+	matplotlib is only needed for plotting, import it on first use so that
+	the stimulus and cell tables can be used without it.
+	"""
+	import matplotlib
+	matplotlib.use('Agg')
+	import matplotlib.pyplot as plt
+	plt.rcParams.update({
+		'lines.linewidth': 0.5,
+		'legend.fontsize': 'small',
+		'axes.titlesize': 'small',
+		'font.size': 6,
+		'savefig.dpi': 200,
+	})
+	return plt
 
 
 # https://www.izhikevich.org/publications/spikes.htm
@@ -50,23 +51,20 @@ for index,key in enumerate(reduced_cells.keys()):
 	for k,v in trans_dict.items():
 		reduced_cells[key][k] = v[index]
 
-import time
-def timer(func):
-	def inner(*args, **kwargs):
-		t1 = time.time()
-		f = func(*args, **kwargs)
-		t2 = time.time()
-		print('time taken on block {0} '.format(t2-t1))
-		return f
-	return inner
-
 
 def plot_model(IinRange,reduced_cells,
 				params,cell_key='RS',
 				title='Layer 5 regular spiking (RS) pyramidal cell (fig 8.12)',
-				direct=False, timed=False):
+				direct=False, timed=False, dt=global_time_step):
+	"""
+	timed - enable metrics, so that the time of every run is recorded,
+			see metrics.records()
+	"""
+	plt = _pyplot()
+	if timed:
+		metrics.enable()
 	for i,amp in enumerate(IinRange):
-		model = izhi.IZHIModel()
+		model = izhi.IZHIModel(dt=dt)
 		model.set_attrs(reduced_cells[cell_key])
 		params['amplitude'] = amp
 		plt.figure(figsize=(8,10))
@@ -79,13 +77,7 @@ def plot_model(IinRange,reduced_cells,
 			plt.xlabel(str(' Time: (ms)'))
 
 		else:
-			if not timed:
-				model.inject_square_current(params)
-			else:
-				t1 = time.time()
-				model.inject_square_current(params)
-				t2 = time.time()
-				print('time taken to evaluate model {0} '.format(t2-t1))
+			model.inject_square_current(params)
 
 			vm = model.get_membrane_potential()
 
@@ -97,22 +89,21 @@ def plot_model(IinRange,reduced_cells,
 		plt.title(title)
 	plt.show()
 
-def transform_input(T,IinRange,Iin0,burstMode=True):
-	tau=0.25; #%dt
-	index = 0;
+def transform_input(T,IinRange,Iin0,burstMode=True,time_step=global_time_step):
+	"""
+	One current array per amplitude in IinRange: T ms of that amplitude,
+	preceded in burstMode by 120 ms of Iin0 (to lower the resting
+	potential). stimulus.step describes the same protocol without
+	sampling it.
+	"""
+	tau=time_step; #%dt
+	n=int(np.round(T/tau)); #% number of samples
+	n0 = int(120/tau) if burstMode else 0; #% initial period of 120 ms to lower Vrmp to -80mV
 	list_currents=[]
 	for Iinput in IinRange:
-		index = index + 1; #% subplot index
-		n=int(np.round(T/tau)); #% number of samples
-
-		if burstMode:
-			n0 = int(120/tau); #% initial period of 120 ms to lower Vrmp to -80mV
-			I=list(Iin0*np.ones(n0)[:])
-			Ipart=list(Iinput*np.ones(n)[:])
-			I.extend(Ipart);#% 2 different pulses of input DC current
-			n = n+n0;
-		else:
-			I=list(Iinput*np.ones(n));#% pulse of input DC current
+		I = np.empty(n0+n)
+		I[:n0] = Iin0
+		I[n0:] = Iinput
 		list_currents.append(I)
 	return list_currents
 
@@ -140,6 +131,8 @@ def run_simulation(time_step=global_time_step, a=0.02, b=0.2, c=-65.0, d=6.0,
 		label_scalebar - True or False, whether to add a label to the scalebar
 	"""
 	global j, fig, gs
+	plt = _pyplot()
+	import matplotlib.gridspec as gridspec
 
 	# create a neuron and current source
 
@@ -177,12 +170,9 @@ def run_simulation(time_step=global_time_step, a=0.02, b=0.2, c=-65.0, d=6.0,
 	#neuron.record('v')
 
 	times, amps = waveform
-	t1 = time.time()
 
 	vm = model.wrap_known_i(amps,times)
 	print(len(vm),np.std(vm),np.mean(vm))
-	t2 = time.time()
-	print('time taken on block {0} '.format(t2-t1))
 	print(len(vm),len(vm.times))
 
 	gs1 = gridspec.GridSpecFromSubplotSpec(2, 1,
@@ -231,20 +221,22 @@ def run_simulation(time_step=global_time_step, a=0.02, b=0.2, c=-65.0, d=6.0,
 	plt.show(block=True)
 	fig.canvas.draw()
 	if save_data:
-		datfilename = 'results/blah.dat'#"results/%s_%s.dat" % (title.replace("(","").replace(")","").replace(" ","_"),options.simulator)
-
-		datfile = open('results/blah.dat','w')
-		for i in range(len(vm)):
-			datfile.write('%s\t%s\n'%(vm.times[i].magnitude,vm[i][0].magnitude))
-		datfile.close()
-		print('Saved data to %s'%datfilename)
+		# one binary run per panel instead of a '%s\t%s\n' line per sample,
+		# read back lazily with store.TraceStore('results')[name]
+		name = title.replace("(","").replace(")","").replace(" ","_") or 'vm'
+		TraceStore('results').write(name, np.asarray(vm.magnitude).ravel(),
+									dt=float(vm.sampling_period.rescale('ms').magnitude),
+									t_start=float(vm.t_start.rescale('ms').magnitude),
+									attrs={'title': title, 'units': 'mV'}, overwrite=True)
+		print('Saved data to results/%s' % name)
 
 #@jit
-def step(amplitude, t_stop,time_step=global_time_step):
+def step(amplitude, t_stop,time_step=global_time_step, dtype=np.float64):
 	"""
 	Generate the waveform for a current
 	that starts at zero and is stepped up
 	to the given amplitude at time t_stop/10.
+	dtype - precision of the current, np.float32 halves its memory
 	"""
 
 	times = np.array([0, t_stop/10, t_stop])
@@ -252,9 +244,9 @@ def step(amplitude, t_stop,time_step=global_time_step):
 	delay = t_stop/10
 	duration = t_stop
 	tMax = t_stop#delay + duration #+ 200.0#*pq.ms
-	times = np.arange(0,tMax,global_time_step)
+	times = np.arange(0,tMax,time_step)
 	N = int(tMax/time_step)
-	Iext = np.zeros(N)
+	Iext = np.zeros(N, dtype=dtype)
 	delay_ind = int((delay/tMax)*N)
 	duration_ind = int((duration/tMax)*N)
 
@@ -266,7 +258,8 @@ def step(amplitude, t_stop,time_step=global_time_step):
 
 
 #@jit
-def pulse(amplitude, onsets, width, t_stop, baseline=0.0):
+def pulse(amplitude, onsets, width, t_stop, baseline=0.0, time_step=global_time_step,
+		  dtype=np.float64):
 	"""
 	Generate the waveform for a series of current pulses.
 
@@ -276,6 +269,8 @@ def pulse(amplitude, onsets, width, t_stop, baseline=0.0):
 		width - duration of each pulse
 		t_stop - total duration of the waveform
 		baseline - the current value before, between and after pulses.
+		time_step - sampling interval of the waveform
+		dtype - precision of the current, np.float32 halves its memory
 	"""
 	times = [0]
 	amps = [baseline]
@@ -290,9 +285,9 @@ def pulse(amplitude, onsets, width, t_stop, baseline=0.0):
 	delay = t_stop/10
 	duration = t_stop
 	tMax = t_stop#delay + duration #+ 200.0#*pq.ms
-	times = np.arange(0,tMax,global_time_step)
-	N = int(tMax/global_time_step)
-	Iext = np.zeros(N)
+	times = np.arange(0,tMax,time_step)
+	N = int(tMax/time_step)
+	Iext = np.zeros(N, dtype=dtype)
 
 	on_indexs = []
 	off_indexs = []
@@ -310,10 +305,11 @@ def pulse(amplitude, onsets, width, t_stop, baseline=0.0):
 
 	Iext[0:on_indexs[0]] = 0.0
 
-	return np.array(times), np.array(Iext)
+	return np.array(times), Iext
 
 @jit
-def ramp(gradient, onset, t_stop, baseline=0.0, time_step=global_time_step, t_start=0.0):
+def ramp(gradient, onset, t_stop, baseline=0.0, time_step=global_time_step, t_start=0.0,
+		 dtype=np.float64):
 	"""
 	Generate the waveform for a current which is initially constant
 	and then increases linearly with time.
@@ -326,13 +322,14 @@ def ramp(gradient, onset, t_stop, baseline=0.0, time_step=global_time_step, t_st
 		time_step - interval between increments in the ramp current
 		t_start - time at which the waveform begins (used to construct waveforms
 				  containing multiple ramps).
+		dtype - precision of the current, np.float32 halves its memory
 	"""
 	if onset > t_start:
 		times = np.hstack((np.array((t_start, onset)),  # flat part
 						   np.arange(onset + time_step, t_stop + time_step, time_step)))  # ramp part
 	else:
 		times = np.arange(t_start, t_stop + time_step, time_step)
-	amps = baseline + gradient*(times - onset) * (times > onset)
+	amps = (baseline + gradient*(times - onset) * (times > onset)).astype(dtype)
 	return times, amps
 
 @jit
@@ -347,303 +344,3 @@ def stepify(times, values):
 	new_values[::2] = values
 	new_values[1::2] = values[:-1]
 	return new_times, new_values
-
-'''
-j = 0
-plt.ion()
-fig = plt.figure(1, facecolor='white', figsize=(6, 6))
-gs = gridspec.GridSpec(6, 4)
-gs.update(hspace=0.5, wspace=0.4)
-
-pbar = tqdm(total=21)
-
-
-
-#%%%%%%%%%%%%%%% thalamo-cortical burst (TC) %%%%%%%%%%%%%%%%%%%%%%
-#subplot(2,4,6)
-#V=-87;  u=b*V;
-#VV=[];  uu=[];
-#tau = 0.25; tspan = 0:tau:150;
-#T1=3*tspan(end)/10;
-#for t=tspan#
-#    if (t>T1)
-#        I=0.0;
-#    else
-#        I=-25;
-#    end;
-
-
-#%%%%%%%%%%%%%%% chattering (CH) %%%%%%%%%%%%%%%%%%%%%%
-#subplot(2,4,3)
-#a=0.02; b=0.2;  c=-50;  d=2;
-#V=-70;  u=b*V;
-#VV=[];  uu=[];
-#tau = 0.25; tspan = 0:tau:150;
-#T1=tspan(end)/10;
-
-t_stop = 150.0
-run_simulation(a=0.02, b=0.2,  c=-50,  d=2,v_init=-70,
-			   waveform=step(10.0, t_stop),
-			   t_stop=t_stop, title='chattering (CH)',
-			   label_scalebar=True, save_data=True)
-
-tau = 0.25;
-tspan = np.arange(0,150/tau,tau);
-print(tspan)
-import pdb
-pdb.set_trace()
-T1=3*tspan[-1]/10;
-I = []
-for t in tspan:
-	if (t>T1):
-		I.append(0.0);
-	else:
-		I.append(-25.0);
-wv=[I,tspan]
-t_stop = 150.0
-run_simulation(a=0.02, b=0.25,  c=-65,  d=0.05,v_init=-87,
-			   waveform=wv,#step(-25, t_stop),
-			   t_stop=t_stop, title='thalamo-cortical burst (TC)',
-			   label_scalebar=True, save_data=True)
-
-# == Sub-plot A: Tonic spiking ==============================================
-pbar.update(1)
-
-t_stop = 100.0
-run_simulation(a=0.02, b=0.2, c=-65.0, d=6.0, v_init=-70.0,
-			   waveform=step(0.014, t_stop),
-			   t_stop=t_stop, title='(A) Tonic spiking',
-			   label_scalebar=True, save_data=True)
-#filename = "results_izhikevich2004_1.png"#normalized_filename()
-#try:
-#    os.makedirs(os.path.dirname(filename))
-#except OSError:
-#    pass
-fig.savefig("results_izhikevich2004_1.png")
-
-# == Sub-plot B: Phasic spiking =============================================
-pbar.update(1)
-
-t_stop = 200.0
-run_simulation(a=0.02, b=0.25, c=-65.0, d=6.0, v_init=-64.0,
-			   waveform=step(0.0005, t_stop),
-			   t_stop=t_stop, title='(B) Phasic spiking')
-fig.savefig("results_izhikevich2004_12png")
-
-# == Sub-plot C: Tonic bursting =============================================
-pbar.update(1)
-
-_stop = 220.0
-run_simulation(a=0.02, b=0.2, c=-50.0, d=2.0, v_init=-70.0,
-			   waveform=step(0.015, t_stop),
-			   t_stop=t_stop, title='(C) Tonic bursting', save_data=True)
-
-# == Sub-plot D: Phasic bursting ============================================
-pbar.update(1)
-
-t_stop = 200.0
-run_simulation(a=0.02, b=0.25, c=-55.0, d=0.05, v_init=-64.0,
-			   waveform=step(0.0006, t_stop),
-			   t_stop=t_stop, title='(D) Phasic bursting')
-
-# == Sub-plot E: Mixed mode =================================================
-pbar.update(1)
-
-t_stop = 160.0
-run_simulation(a=0.02, b=0.2, c=-55.0, d=4.0, v_init=-70.0,
-			   waveform=step(0.01, t_stop),
-			   t_stop=t_stop, title='(E) Mixed mode')
-
-# == Sub-plot F: Spike Frequency Adaptation (SFA) ===========================
-pbar.update(1)
-
-t_stop = 85.0
-run_simulation(a=0.01, b=0.2, c=-65.0, d=8.0, v_init=-70.0,
-			   waveform=step(0.03, t_stop),
-			   t_stop=t_stop, title='(F) SFA')
-
-# == Sub-plot G: Class 1 excitable ==========================================
-
-
-#Note: This simulation is supposed to use a different parameterization of the
-#      model, i.e.
-#            V' = tau*(0.04*V^2 + 4.1*V + 108 -u + I)
-#      as opposed to
-#            V' = tau*(0.04*V^2 + 5*V + 140 - u + I)
-#The alternative parameterization is not currently available in PyNN, therefore
-#the results of this simulation are not expected to match the original figure.
-pbar.update(1)
-
-t_stop = 300.0
-run_simulation(a=0.02, b=0.2, c=-65.0, d=6.0, v_init=-70.0,
-			   waveform=ramp(0.000075, 30.0, t_stop),
-			   t_stop=t_stop, title='(G) Class 1 excitable')
-
-# == Sub-plot H: Class 2 excitable ==========================================
-pbar.update(1)
-
-t_stop = 300.0
-run_simulation(a=0.2, b=0.26, c=-65.0, d=0.0, v_init=-64.0,
-			   waveform=ramp(0.000015, 30.0, t_stop, baseline=-0.0005),
-			   t_stop=t_stop, title='(H) Class 2 excitable')
-
-# == Sub-plot I: Spike latency ==============================================
-pbar.update(1)
-
-t_stop = 100.0
-run_simulation(a=0.02, b=0.2, c=-65.0, d=6.0, v_init=-70.0,
-			   waveform=pulse(0.00671,  # 0.00704 in original
-							  [10], 3, t_stop),
-			   t_stop=t_stop, title='(I) Spike latency',
-			   scalebar_level=0.5)
-pbar.update(1)
-
-# == Sub-plot J: Subthreshold oscillation ===================================
-
-t_stop = 200.0
-run_simulation(a=0.05, b=0.26, c=-60.0, d=0.0, v_init=-62.0,
-			   waveform=pulse(0.002, [20], 5, t_stop),
-			   t_stop=t_stop, title='(J) Subthreshold oscillation',
-			   scalebar_level=0.5)
-pbar.update(1)
-
-# == Sub-plot K: Resonator ==================================================
-
-t_stop = 400.0
-T1 = t_stop / 10
-T2 = T1 + 20
-T3 = 0.7 * t_stop
-T4 = T3 + 40
-run_simulation(a=0.1, b=0.26, c=-60.0, d=-1.0, v_init=-62.0,
-			   waveform=pulse(0.00065, [T1, T2, T3, T4], 4, t_stop),
-			   t_stop=t_stop, title='(K) Resonator',
-			   scalebar_level=0.5)
-
-# == Sub-plot L: Integrator =================================================
-pbar.update(1)
-
-
-#Note: This simulation is supposed to use a different parameterization of the
-#      model, i.e.
-#            V' = tau*(0.04*V^2 + 4.1*V + 108 -u + I)
-#      as opposed to
-#            V' = tau*(0.04*V^2 + 5*V + 140 - u + I)
-#The alternative parameterization is not currently available in PyNN, therefore
-#the results of this simulation are not expected to match the original figure.
-
-t_stop = 100.0
-T1 = t_stop / 11
-T2 = T1 + 5
-T3 = 0.7 * t_stop
-T4 = T3 + 10
-run_simulation(a=0.02, b=-0.1, c=-55.0, d=6.0, v_init=-60.0,
-			   waveform=pulse(0.009, [T1, T2, T3, T4], 2, t_stop),
-			   t_stop=t_stop, title='(L) Integrator',
-			   scalebar_level=0.5)
-pbar.update(1)
-
-# == Sub-plot M: Rebound spike ==============================================
-
-t_stop = 200.0
-run_simulation(a=0.03, b=0.25, c=-60.0, d=4.0, v_init=-64.0,
-			   waveform=pulse(-0.015, [20], 5, t_stop),
-			   t_stop=t_stop, title='(M) Rebound spike')
-
-# == Sub-plot N: Rebound burst ==============================================
-pbar.update(1)
-
-t_stop = 200.0
-run_simulation(a=0.03, b=0.25, c=-52.0, d=0.0, v_init=-64.0,
-			   waveform=pulse(-0.015, [20], 5, t_stop),
-			   t_stop=t_stop, title='(N) Rebound burst')
-
-# == Sub-plot O: Threshold variability ======================================
-pbar.update(1)
-
-t_stop = 100.0
-times = np.array([0, 10, 15, 70, 75, 80, 85, t_stop])
-amps = np.array([0, 0.001, 0, -0.006, 0, 0.001, 0, 0])
-run_simulation(a=0.03, b=0.25, c=-60.0, d=4.0, v_init=-64.0,
-			   waveform=(times, amps),
-			   t_stop=t_stop, title='(O) Threshold variability')
-pbar.update(1)
-
-# == Sub-plot P: Bistability ================================================
-
-t_stop = 300.0
-T1 = t_stop/8
-T2 = 208  # 216.0 in original
-run_simulation(a=0.1, b=0.26, c=-60.0, d=0.0, v_init=-61.0,
-			   waveform=pulse(0.00124, [T1, T2], 5, t_stop, baseline=0.00024),
-			   t_stop=t_stop, title='(P) Bistability',
-			   scalebar_level=0.5)
-pbar.update(1)
-
-# == Sub-plot Q: Depolarizing after-potential ===============================
-
-t_stop = 50.0
-run_simulation(a=1.0, b=0.18,  # 0.2 in original
-			   c=-60.0, d=-21.0, v_init=-70.0,
-			   waveform=pulse(0.02, [9], 2, t_stop),
-			   t_stop=t_stop, title='(Q) DAP',
-			   scalebar_level=0.5)
-pbar.update(1)
-
-# == Sub-plot R: Accomodation ===============================================
-
-#Note: This simulation is supposed to use a different parameterization of the
-#      model, i.e.
-#            u' = tau*a*(b*(V + 65))
-#      as opposed to
-#            u' = tau*a*(b*V - u)
-#The alternative parameterization is not currently available in PyNN, therefore
-#the results of this simulation are not expected to match the original figure.
-
-
-t_stop = 400.0
-
-parts = (ramp(0.00004, 0.0, 200.0),
-		 (np.array([200.0 + global_time_step, 300.0 - global_time_step]), np.array([0.0, 0.0])),
-		 ramp(0.00032, 300.0, 312.5, t_start=300.0),
-		 (np.array([312.5 + global_time_step, t_stop]), np.array([0.0, 0.0])))
-totalTimes, totalAmps = np.hstack(parts)
-pbar.update(1)
-
-run_simulation(a=0.02, b=1.0, c=-55.0, d=4.0, v_init=-65.0, u_init=-16.0,
-			   waveform=(totalTimes, totalAmps),
-			   t_stop=t_stop, title='(R) Accomodation',
-			   scalebar_level=0.5)
-pbar.update(1)
-
-# == Sub-plot S: Inhibition-induced spiking =================================
-
-t_stop = 350.0
-run_simulation(a=-0.02, b=-1.0, c=-60.0, d=8.0, v_init=-63.8,
-			   waveform=pulse(0.075, [50], 170,  # 200 in original
-							  t_stop, baseline=0.08),
-			   t_stop=t_stop, title='(S) Inhibition-induced spiking')
-pbar.update(1)
-
-# == Sub-plot T: Inhibition-induced bursting ================================
-
-#Modifying parameter d from -2.0 to -0.7 in order to reproduce Fig. 1
-
-
-t_stop = 350.0
-run_simulation(a=-0.026, b=-1.0, c=-45.0, d=-0.7, v_init=-63.8,
-			   waveform=pulse(0.075, [50], 200, t_stop, baseline=0.08),
-			   t_stop=t_stop, title='(T) Inhibition-induced bursting')
-pbar.update(1)
-
-
-# == Export figure in PNG format ============================================
-
-filename = "results_izhikevich2004.png"#normalized_filename()
-#try:
-#    os.makedirs(os.path.dirname(filename))
-#except OSError:
-#    pass
-fig.savefig("results_izhikevich2004.png")
-
-print("\n  Simulation complete. Results can be seen in figure at %s\n"%(filename))
-'''